@@ -13,25 +13,23 @@ import csv
 import sys
 import string
 import argparse
-import importlib
 import ipaddress
 from pathlib import Path
+from time import time
 from datetime import datetime
 from lib.host import *
 from lib.deliverable import *
 from lib.inventory import Inventory
+from lib.compression import compressed_name, strip_extension, check as check_compression
+from lib.columnar import check as check_parquet
+from lib.registry import ModuleRegistry
 
 
 # detect .py modules in lib/modules
-detected_modules = []
-
+# they're only imported if they're used (see main())
 script_location = Path(__file__).resolve().parent
-module_candidates = next(os.walk(script_location / 'lib/modules'))[2]
-
-for file in module_candidates:
-    file = Path(file)
-    if file.suffix == ('.py') and file.stem not in ['__init__', 'base_module']:
-        detected_modules.append(str(file.stem))
+module_registry = ModuleRegistry(script_location / 'lib/modules')
+detected_modules = module_registry.names()
 
 
 
@@ -61,32 +59,34 @@ def main(options):
     zmap_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
 
     if options.csv_file is None:
-        options.csv_file = options.work_dir / 'asset_inventory_{date:%Y-%m-%d_%H-%M-%S}.csv'.format( date=datetime.now() )
+        options.csv_file = compressed_name(options.work_dir / 'asset_inventory_{date:%Y-%m-%d_%H-%M-%S}.csv'.format( date=datetime.now() ), options.compress)
 
 
     z = Inventory(options.targets, options.bandwidth, resolve=(not options.no_dns), force_resolve=options.force_dns, \
         work_dir=cache_dir, skip_ping=options.skip_ping, force_ping=options.force_ping, force_syn=options.force_syn, \
         blacklist=options.blacklist, whitelist=options.whitelist, interface=options.interface, \
-        gateway_mac=options.gateway_mac)
+        gateway_mac=options.gateway_mac, max_parallel_modules=options.parallel_modules, \
+        max_connections=options.max_connections, compression=options.compress)
 
     def load_module(m, active=False):
-        z.modules.append(m)
+        z.add_module(m, active=active)
         if active:
-            z.active_modules.append(m)
             try:
                 options.ports += m.required_ports
             except TypeError:
                 options.ports = m.required_ports
 
-    for module in detected_modules:
-        module_name = 'lib.modules.{}'.format(module)
+    for spec in module_registry:
+        # inactive modules are represented by their metadata, so their columns are still carried over
+        if not spec.module in options.modules:
+            load_module(spec)
+            continue
+
         try:
-            #_m = importlib.import_module(module_name, package=__package__)
-            _m = importlib.import_module(module_name)
-            m = _m.Module(z)
-            load_module(m, active=(module in options.modules))
+            m = spec.load(z)
+            load_module(m, active=True)
         except ImportError as e:
-            sys.stderr.write('[!] Error importing {}:\n{}\n'.format(module_name, str(e)))
+            sys.stderr.write('[!] Error importing lib.modules.{}:\n{}\n'.format(spec.module, str(e)))
             continue
 
 
@@ -99,6 +99,10 @@ def main(options):
         pass
 
 
+    # start modules in the background
+    # each one starts as soon as the ports it needs have been scanned
+    z.start_modules(scanned_ports=[])
+
     # scan additional ports if requested
     # only alive hosts are scanned
     if options.ports:
@@ -106,6 +110,12 @@ def main(options):
         # deduplicate ports
         options.ports = list(set(options.ports))
 
+        # scan ports for modules with the fewest ports first, so they can start sooner
+        port_order = []
+        for m in sorted(z.active_modules, key=lambda m: len(m.required_ports)):
+            port_order += [p for p in m.required_ports if not p in port_order]
+        options.ports.sort(key=lambda p: (port_order.index(p) if p in port_order else len(port_order)))
+
         # always scan 445 first so AV will have less of a chance to block us
         if 445 in options.ports:
             options.ports.remove(445)
@@ -115,10 +125,15 @@ def main(options):
             zmap_out_file, new_hosts_found = z.scan_online_hosts(port)
             if new_hosts_found:
                 print('\n[+] Port scan results for {}/TCP written to {}'.format(port, zmap_out_file))
+            z.port_scanned(port)
 
 
-    # run modules
-    z.run_modules()
+    # wait for modules to finish
+    try:
+        z.finish_modules()
+    except KeyboardInterrupt:
+        sys.stderr.write('\n[!] Cancelling modules, results so far will still be saved (ctrl+c again to quit)\n')
+        z.cancel_modules()
 
 
     # write CSV file
@@ -127,94 +142,198 @@ def main(options):
     except PermissionError as e:
         pass
 
+    write_parquet(z, options)
+
     # print summary
-    z.report(netmask=options.netmask)
+    z.report(netmask=options.netmask, summary_netmasks=options.summary_netmasks, top=options.top_subnets)
+    write_subnet_summary(z, options)
 
     # print module reports
     z.module_reports()
 
     # calculate deltas if requested
     if options.diff:
-        stray_hosts = []
-        stray_networks = []
-
-        stray_networks = z.get_network_delta(options.diff, netmask=options.netmask)
-        stray_networks_csv = './network_diff_{date:%Y-%m-%d_%H-%M-%S}.csv'.format( date=datetime.now())
-        print('')
-        print('[+] {:,} active network(s) not found in {}'.format(len(stray_networks), str(options.diff)))
-        print('[+] Full report written to {}'.format(stray_networks_csv))
-        print('=' * 60)
-
-        with open(stray_networks_csv, 'w', newline='') as f:
-            csv_file = csv.DictWriter(f, fieldnames=['Network', 'Host Count'])
-            csv_file.writeheader()
-
-            max_display_count = 20
-            for network in stray_networks:
-                #print('\t{:<16}{}'.format(str(network[0]), network[1]))
-                print('\t{:<19}{:<10}'.format(str(network[0]), ' ({:,})'.format(network[1])))
-                max_display_count -= 1
-                if max_display_count <= 0:
-                    print('\t...')
-                    break
-
-            for network in stray_networks:
-                csv_file.writerow({'Network': str(network[0]), 'Host Count': str(network[1])})
-
-        stray_hosts = z.get_host_delta(options.diff)
-        stray_hosts_csv = './host_diff_{date:%Y-%m-%d_%H-%M-%S}.csv'.format( date=datetime.now())
-        print('')
-        print('[+] {:,} alive host(s) not found in {}'.format(len(stray_hosts), str(options.diff)))
-        print('[+] Full report written to {}'.format(stray_hosts_csv))
-        print('=' * 60)
+        show_diff(z, options)
+
+    # make a deliverable spreadsheet if requested
+    if options.make_deliverable:
+        make_deliverable(z, options)
+
+    print('[+] CSV file written to {}'.format(options.csv_file))
+
+    z.stop()
+    try:
+        z.dump_scan_cache()
+    except PermissionError as e:
+        pass
+
+
+
+def offline(options):
+    '''
+    answers report/diff/export questions from the cache alone
+    no scanning, so zmap and root aren't needed
+    (e.g. on an analyst's laptop with a copy of ~/.asset_inventory)
+    '''
+
+    started = time()
+
+    options.work_dir = options.work_dir.resolve()
+    cache_dir = options.work_dir / 'cache'
+    assert cache_dir.is_dir(), 'No cache found at {}'.format(str(cache_dir))
+
+    z = Inventory(options.targets, options.bandwidth, resolve=False, force_resolve=options.force_dns, \
+        work_dir=cache_dir, blacklist=options.blacklist, whitelist=options.whitelist, offline=True, \
+        compression=options.compress)
+
+    # no modules are run, but their columns are still carried over
+    z.modules += list(module_registry)
+
+    z.load_scan_cache()
+    print('[+] Loaded cache in {:.2f} seconds'.format(time() - started))
+
+    # print summary
+    z.report(netmask=options.netmask, summary_netmasks=options.summary_netmasks, top=options.top_subnets)
+    write_subnet_summary(z, options)
+
+    # write CSV file, only if asked for
+    # (an asset_inventory_*.csv in the working directory would be picked up by --make-deliverable as a new scan)
+    if options.csv_file is not None:
+        try:
+            z.write_csv(csv_file=options.csv_file)
+            print('[+] CSV file written to {}'.format(options.csv_file))
+        except PermissionError as e:
+            sys.stderr.write('[!] {}\n'.format(str(e)))
+
+    write_parquet(z, options)
+
+    if options.diff:
+        show_diff(z, options)
+
+    if options.make_deliverable:
+        make_deliverable(z, options)
+
+
+
+def write_parquet(z, options):
+    '''
+    writes the inventory to a Parquet file if requested
+    '''
+
+    if not options.parquet:
+        return
+
+    parquet_file = options.work_dir / 'asset_inventory_{date:%Y-%m-%d_%H-%M-%S}.parquet'.format( date=datetime.now() )
+    try:
+        z.write_parquet(parquet_file)
+        print('[+] Parquet file written to {}'.format(parquet_file))
+    except PermissionError as e:
+        sys.stderr.write('[!] {}\n'.format(str(e)))
+
+
+
+def write_subnet_summary(z, options):
+    '''
+    writes host counts for every subnet at each of --summary-netmasks to a CSV or JSON file, if requested
+    '''
+
+    if not options.subnet_summary:
+        return
+
+    try:
+        z.subnet_tree(options.summary_netmasks or [8, 16, 24]).write(options.subnet_summary)
+        print('[+] Subnet summary written to {}'.format(options.subnet_summary))
+    except PermissionError as e:
+        sys.stderr.write('[!] {}\n'.format(str(e)))
+
+
+
+def show_diff(z, options):
+    '''
+    prints and writes out hosts and networks which aren't in the file given with --diff
+    '''
+
+    stray_hosts = []
+    stray_networks = []
+
+    stray_networks = z.get_network_delta(options.diff, netmask=options.netmask)
+    stray_networks_csv = './network_diff_{date:%Y-%m-%d_%H-%M-%S}.csv'.format( date=datetime.now())
+    print('')
+    print('[+] {:,} active network(s) not found in {}'.format(len(stray_networks), str(options.diff)))
+    print('[+] Full report written to {}'.format(stray_networks_csv))
+    print('=' * 60)
+
+    with open(stray_networks_csv, 'w', newline='') as f:
+        csv_file = csv.DictWriter(f, fieldnames=['Network', 'Host Count'])
+        csv_file.writeheader()
 
         max_display_count = 20
-        for host in stray_hosts:
-            print('\t{}'.format(str(host)))
+        for network in stray_networks:
+            #print('\t{:<16}{}'.format(str(network[0]), network[1]))
+            print('\t{:<19}{:<10}'.format(str(network[0]), ' ({:,})'.format(network[1])))
             max_display_count -= 1
             if max_display_count <= 0:
                 print('\t...')
                 break
 
-        z.write_csv(csv_file=stray_hosts_csv, hosts=stray_hosts)
+        for network in stray_networks:
+            csv_file.writerow({'Network': str(network[0]), 'Host Count': str(network[1])})
 
-        # if more than 5 percent of hosts are strays, or you have more than one stray network
-        if len(z.hosts) > 0:
-            if len(stray_hosts)/len(z.hosts) > .05 or len(stray_networks) > 1:
-                print('')
-                print(' "Your asset management is bad and you should feel bad"')
-                print('\n')
+    stray_hosts = z.get_host_delta(options.diff)
+    stray_hosts_csv = './host_diff_{date:%Y-%m-%d_%H-%M-%S}.csv'.format( date=datetime.now())
+    print('')
+    print('[+] {:,} alive host(s) not found in {}'.format(len(stray_hosts), str(options.diff)))
+    print('[+] Full report written to {}'.format(stray_hosts_csv))
+    print('=' * 60)
 
+    max_display_count = 20
+    for host in stray_hosts:
+        print('\t{}'.format(str(host)))
+        max_display_count -= 1
+        if max_display_count <= 0:
+            print('\t...')
+            break
 
-    # make a deliverable spreadsheet if requested
-    if options.make_deliverable:
+    z.write_csv(csv_file=stray_hosts_csv, hosts=stray_hosts)
 
-        print('[+] Combining all data gathered to date for specified targets:')
-        print('     - {}'.format('\n     - '.join([str(t) for t in options.targets])))
+    # if more than 5 percent of hosts are strays, or you have more than one stray network
+    if len(z.hosts) > 0:
+        if len(stray_hosts)/len(z.hosts) > .05 or len(stray_networks) > 1:
+            print('')
+            print(' "Your asset management is bad and you should feel bad"')
+            print('\n')
 
-        csv_files = []
-        try:
-            for csv_file in next(os.walk(options.work_dir))[2]:
-                if csv_file.startswith('asset_inventory') and csv_file.endswith('.csv'):
-                    print('[+] Found asset inventory CSV: {}'.format(csv_file))
-                    csv_files.append(options.work_dir / csv_file)
-
-        except StopIteration:
-            pass
 
-        filename = options.work_dir / 'asset_inventory_deliverable_{date:%Y-%m-%d_%H-%M-%S}.csv'.format( date=datetime.now() )
 
-        deliverable = Deliverable(z, csv_files)
-        deliverable.generate_xlsx(filename)
+def make_deliverable(z, options):
+    '''
+    combines all data gathered for the specified targets into one file
+    '''
 
-    print('[+] CSV file written to {}'.format(options.csv_file))
+    print('[+] Combining all data gathered to date for specified targets:')
+    print('     - {}'.format('\n     - '.join([str(t) for t in options.targets])))
 
-    z.stop()
+    csv_files = []
     try:
-        z.dump_scan_cache()
-    except PermissionError as e:
+        # oldest first (filenames are timestamped)
+        for csv_file in sorted(next(os.walk(options.work_dir))[2]):
+            # skip previous deliverables
+            if csv_file.startswith('asset_inventory_deliverable'):
+                continue
+            if csv_file.startswith('asset_inventory') and strip_extension(csv_file).endswith('.csv'):
+                print('[+] Found asset inventory CSV: {}'.format(csv_file))
+                csv_files.append(options.work_dir / csv_file)
+
+    except StopIteration:
         pass
 
+    # XLSX is zipped already, so --compress doesn't apply
+    filename = options.work_dir / 'asset_inventory_deliverable_{date:%Y-%m-%d_%H-%M-%S}.xlsx'.format( date=datetime.now() )
+
+    # results of previous deliverables are kept in the cache, so only new CSVs are read
+    deliverable = Deliverable(z, csv_files, state_dir=z.work_dir / 'deliverable')
+    deliverable.generate_xlsx(filename)
+
 
 
 
@@ -262,10 +381,18 @@ if __name__ == '__main__':
     parser.add_argument('--force-ping',             action='store_true',        help='force a new zmap ping sweep')
     parser.add_argument('--force-syn',              action='store_true',        help='SYN scan hosts which have already been scanned')
     parser.add_argument('-M', '--modules', nargs='*',   default=[],             help='Module for additional checks such as EternalBlue (pick from {})'.format(', '.join(detected_modules + ['all', '*'])))
+    parser.add_argument('--parallel-modules', type=int, default=4,             help='max number of modules to run at once (default 4)', metavar='INT')
+    parser.add_argument('--max-connections', type=int, default=1000,           help='max connections open at once, shared between modules (default 1000)', metavar='INT')
+    parser.add_argument('--compress',   choices=['gzip', 'zstd'],               help='compress CSVs, caches, and scan output (zstd requires "zstandard")')
     parser.add_argument('--work-dir', type=Path,    default=default_work_dir,   help='custom working directory (default {})'.format(default_work_dir), metavar='DIR')
     parser.add_argument('-d', '--diff',             type=Path,                  help='show differences between scan results and IPs/networks from file', metavar='FILE')
     parser.add_argument('--netmask',      type=int, default=default_cidr_mask,  help='summarize networks with this CIDR mask (default {})'.format(default_cidr_mask))
-    parser.add_argument('--make-deliverable',       action='store_true',        help='combine all data gathered for each host into a deliverable CSV file')
+    parser.add_argument('--summary-netmasks', type=int, nargs='+',             help='also summarize hosts at these netmasks (e.g. 8 16 24), with the busiest subnets in each', metavar='INT')
+    parser.add_argument('--top-subnets', type=int, default=5,                  help='how many of the busiest subnets to show for each --summary-netmasks level (default 5)', metavar='INT')
+    parser.add_argument('--subnet-summary', type=Path,                          help='write host counts for every subnet at each of --summary-netmasks (default 8 16 24) to a CSV or JSON file', metavar='FILE')
+    parser.add_argument('--offline',                action='store_true',        help='only load the cache (no scanning, zmap or root needed), for use with --diff, --make-deliverable, etc.')
+    parser.add_argument('--parquet',                action='store_true',        help='also write the inventory to a Parquet file (requires pyarrow)')
+    parser.add_argument('--make-deliverable',       action='store_true',        help='combine all data gathered for each host into a deliverable XLSX file (CSV if openpyxl is missing)')
 
     try:
 
@@ -280,6 +407,14 @@ if __name__ == '__main__':
         assert not (options.skip_ping and options.force_ping), 'Conflicting options: --force-ping and --skip-ping'
 
         assert 0 <= options.netmask <= 32, 'Invalid netmask'
+        assert all([0 <= n <= 32 for n in (options.summary_netmasks or [])]), 'Invalid summary netmask'
+
+        try:
+            check_compression(options.compress)
+            if options.parquet:
+                check_parquet()
+        except ValueError as e:
+            raise AssertionError(str(e))
 
         valid_module_chars = string.ascii_lowercase + '-'
         options.modules = [''.join([c for c in module.lower() if c in valid_module_chars]) for module in options.modules]
@@ -288,7 +423,12 @@ if __name__ == '__main__':
         elif not all([module in detected_modules for module in options.modules]):
             raise AssertionError('Invalid module name, please pick from the following: {}'.format(', '.join(detected_modules)))
 
-        main(options)
+        if options.offline:
+            assert not (options.modules or options.ports or options.start_fresh), \
+                '--offline cannot be used with --modules, --ports, or --start-fresh'
+            offline(options)
+        else:
+            main(options)
 
 
     except (argparse.ArgumentError, AssertionError) as e:
@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+'''
+offline benchmarks (no root, network, zmap or nmap needed)
+    $ python3 -m benchmarks --hosts 100000 --output results.json
+see __main__.py for options, and synthetic.py / fakes.py / scenarios.py for what's being run
+'''
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+'''
+generates a synthetic network, then times each scenario in its own process
+results are written to JSON, so runs can be compared across versions:
+    $ python3 -m benchmarks --hosts 100000 --output before.json
+    (make changes)
+    $ python3 -m benchmarks --hosts 100000 --output after.json --compare before.json
+'''
+
+import os
+import sys
+import json
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess as sp
+from pathlib import Path
+from time import time
+from datetime import datetime
+
+from .synthetic import SyntheticNetwork
+from .scenarios import scenarios, repo_dir, module_registry
+
+
+bin_dir = Path(__file__).resolve().parent / 'bin'
+
+# optional dependencies which change which code paths are taken
+optional_packages = ['numpy', 'pyarrow', 'openpyxl', 'lxml', 'zstandard']
+
+
+
+def main(options):
+
+    fixture_dir = options.fixture_dir
+    if fixture_dir is None:
+        fixture_dir = Path(tempfile.mkdtemp(prefix='asset_inventory_bench_'))
+    fixture_dir = fixture_dir.resolve()
+
+    try:
+        params = make_fixture(fixture_dir, options)
+
+        env = dict(os.environ)
+        env['PATH'] = '{}{}{}'.format(bin_dir, os.pathsep, env.get('PATH', ''))
+        env['BENCH_NETWORK'] = str(fixture_dir / 'network')
+        env['BENCH_RATE'] = str(options.rate)
+
+        results = {
+            'version':      git_version(),
+            'date':         '{:%Y-%m-%d %H:%M:%S}'.format(datetime.now()),
+            'python':       platform.python_version(),
+            'platform':     platform.platform(),
+            'optional':     dict([(p, installed(p)) for p in optional_packages]),
+            'params':       dict(params, rate=options.rate),
+            'scenarios':    dict(),
+        }
+
+        for name in options.scenarios:
+            print('[+] Running {} ({} time(s))'.format(name, options.repeat))
+            runs = []
+            for i in range(options.repeat):
+                run = run_scenario(name, fixture_dir, env, verbose=options.verbose)
+                if run is None:
+                    break
+                runs.append(run)
+                print('\t{:.3f}s'.format(run['seconds']))
+            if runs:
+                results['scenarios'][name] = summarize(runs)
+
+    finally:
+        if options.fixture_dir is None:
+            shutil.rmtree(fixture_dir, ignore_errors=True)
+
+    print('')
+    print_results(results)
+
+    if options.output is not None:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('\n[+] Results written to {}'.format(options.output))
+
+    if options.compare is not None:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        print('')
+        print_comparison(baseline, results)
+
+
+
+def make_fixture(fixture_dir, options):
+    '''
+    writes the synthetic network, unless one with the same parameters is already there
+    returns the parameters
+    '''
+
+    params = {
+        'hosts':        options.hosts,
+        'targets':      [str(t) for t in options.targets],
+        'ports':        options.ports,
+        'port_density': options.port_density,
+        'finding_rate': options.finding_rate,
+        'reports':      options.reports,
+        'seed':         options.seed,
+        'modules':      options.modules,
+    }
+
+    params_file = fixture_dir / 'fixture.json'
+    try:
+        with open(params_file) as f:
+            if json.load(f) == params:
+                print('[+] Using existing synthetic network in {}'.format(fixture_dir))
+                return params
+    except (OSError, ValueError):
+        pass
+
+    print('[+] Generating {:,} hosts in {}'.format(options.hosts, fixture_dir))
+    started = time()
+    for d in ['work', 'network']:
+        shutil.rmtree(fixture_dir / d, ignore_errors=True)
+
+    network = SyntheticNetwork.from_registry(module_registry, options.targets, hosts=options.hosts, \
+        ports=options.ports, port_density=options.port_density, finding_rate=options.finding_rate, \
+        reports=options.reports, seed=options.seed)
+    network.write(fixture_dir / 'work', fixture_dir / 'network')
+
+    # written last, so an interrupted run isn't reused
+    with open(params_file, 'w') as f:
+        json.dump(params, f, indent=2)
+
+    print('[+] Generated in {:.1f} seconds'.format(time() - started))
+    return params
+
+
+
+def run_scenario(name, fixture_dir, env, verbose=False):
+    '''
+    runs a scenario in a new process, so each one starts from the same (cold) state
+    returns its results, or None if it failed
+    '''
+
+    with tempfile.NamedTemporaryFile(suffix='.json', dir=str(fixture_dir)) as result_file:
+
+        command = [sys.executable, '-m', 'benchmarks.scenarios', name, str(fixture_dir), result_file.name]
+        process = sp.run(command, cwd=str(repo_dir), env=env, stdout=(None if verbose else sp.DEVNULL), stderr=sp.PIPE)
+
+        if process.returncode != 0:
+            sys.stderr.write('[!] Scenario "{}" failed:\n{}\n'.format(name, process.stderr.decode(errors='replace')))
+            return None
+
+        with open(result_file.name) as f:
+            return json.load(f)
+
+
+
+def summarize(runs):
+    '''
+    takes results of each run
+    returns the median and best of every timing, and everything else from the last run
+    '''
+
+    summary = dict(runs[-1])
+    for key, value in runs[-1].items():
+        if key.endswith('seconds') and isinstance(value, float):
+            values = [run[key] for run in runs]
+            summary[key] = statistics.median(values)
+            summary['best_' + key] = min(values)
+    summary['runs'] = runs
+
+    hosts = summary.get('hosts', 0)
+    if hosts and summary['seconds'] > 0:
+        summary['hosts_per_second'] = round(hosts / summary['seconds'])
+
+    return summary
+
+
+
+def print_results(results):
+
+    print('[+] Results ({}, Python {}):'.format(results['version'], results['python']))
+    print('\t{:<20}{:>12}{:>12}{:>14}{:>12}'.format('Scenario', 'Median', 'Best', 'Hosts/sec', 'Peak RSS'))
+    for name, summary in results['scenarios'].items():
+        print('\t{:<20}{:>11.3f}s{:>11.3f}s{:>14,}{:>10.0f}MB'.format(name, summary['seconds'], \
+            summary['best_seconds'], summary.get('hosts_per_second', 0), summary['peak_rss_mb']))
+        if 'rerun_seconds' in summary:
+            print('\t{:<20}{:>11.3f}s{:>11.3f}s'.format('  (rerun)', summary['rerun_seconds'], summary['best_rerun_seconds']))
+
+
+
+def print_comparison(baseline, results):
+
+    print('[+] Compared to {} ({}):'.format(baseline.get('version', '?'), baseline.get('date', '?')))
+    if baseline.get('params') != results['params']:
+        print('[!] Parameters differ, so these numbers may not be comparable')
+
+    print('\t{:<20}{:>12}{:>12}{:>10}'.format('Scenario', 'Before', 'After', 'Change'))
+    for name, summary in results['scenarios'].items():
+        for key in ['seconds', 'rerun_seconds']:
+            try:
+                before = baseline['scenarios'][name][key]
+                after = summary[key]
+            except KeyError:
+                continue
+            label = (name if key == 'seconds' else '  (rerun)')
+            change = ('{:+.1f}%'.format((after - before) / before * 100) if before else '')
+            print('\t{:<20}{:>11.3f}s{:>11.3f}s{:>10}'.format(label, before, after, change))
+
+
+
+def git_version():
+
+    try:
+        process = sp.run(['git', 'describe', '--always', '--dirty'], cwd=str(repo_dir), stdout=sp.PIPE, stderr=sp.DEVNULL)
+        return process.stdout.decode().strip() or 'unknown'
+    except OSError:
+        return 'unknown'
+
+
+
+def installed(package):
+
+    try:
+        __import__(package)
+        return True
+    except ImportError:
+        return False
+
+
+
+
+if __name__ == '__main__':
+
+    default_targets = ['10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16']
+    # the ports modules need, plus a couple of common ones
+    default_ports = sorted(set([22, 80, 443, 445] + [p for spec in module_registry for p in spec.required_ports]))
+
+    parser = argparse.ArgumentParser(description='Benchmark the asset inventory offline, against a synthetic network')
+    parser.add_argument('--hosts', type=int, default=100000,                    help='number of online hosts (default 100000)', metavar='INT')
+    parser.add_argument('-t', '--targets', nargs='+', default=default_targets,  help='target network(s) (default {})'.format(' '.join(default_targets)), metavar='STR')
+    parser.add_argument('-p', '--ports', nargs='+', type=int, default=default_ports, help='ports to generate and scan (default {})'.format(' '.join([str(p) for p in default_ports])))
+    parser.add_argument('--port-density', type=float, default=.25,             help='fraction of hosts with each port open (default .25)', metavar='FLOAT')
+    parser.add_argument('--finding-rate', type=float, default=.05,             help='fraction of hosts with findings (vulnerable, open shares, etc.) (default .05)', metavar='FLOAT')
+    parser.add_argument('--reports', type=int, default=3,                      help='number of past reports for --make-deliverable (default 3)', metavar='INT')
+    parser.add_argument('--seed', type=int, default=1,                         help='random seed for the synthetic network (default 1)', metavar='INT')
+    parser.add_argument('--rate', type=float, default=0,                       help='results per second from the stand-in zmap/nmap/etc. (default 0, no limit)', metavar='FLOAT')
+    parser.add_argument('-M', '--modules', nargs='+', default=['eternalblue'], help='modules for the "modules" scenario (default eternalblue)')
+    parser.add_argument('-s', '--scenarios', nargs='+', default=list(scenarios), choices=list(scenarios), help='scenarios to run (default all)', metavar='STR')
+    parser.add_argument('-r', '--repeat', type=int, default=3,                 help='times to run each scenario (default 3)', metavar='INT')
+    parser.add_argument('--fixture-dir', type=Path,                             help='keep the synthetic network here, and reuse it if the parameters match', metavar='DIR')
+    parser.add_argument('-o', '--output', type=Path,                            help='write results to this JSON file', metavar='FILE')
+    parser.add_argument('-c', '--compare', type=Path,                           help='compare to results from a previous run', metavar='FILE')
+    parser.add_argument('-v', '--verbose', action='store_true',                 help='show output from the scenarios')
+
+    try:
+
+        options = parser.parse_args()
+
+        assert options.hosts > 0, 'Please specify at least one host'
+        assert options.repeat > 0, 'Please specify at least one repeat'
+        assert 0 <= options.port_density <= 1, 'Invalid port density'
+        assert 0 <= options.finding_rate <= 1, 'Invalid finding rate'
+        assert all([m in module_registry.names() for m in options.modules]), \
+            'Invalid module name, please pick from the following: {}'.format(', '.join(module_registry.names()))
+
+        main(options)
+
+    except (argparse.ArgumentError, AssertionError, ValueError) as e:
+        sys.stderr.write('\n[!] {}\n\n'.format(str(e)))
+        sys.exit(2)
+
+    except KeyboardInterrupt:
+        sys.stderr.write('\n[!] Interrupted\n')
+        sys.exit(1)
@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+
+# stand-in for wmiexec.py (see benchmarks/fakes.py)
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from benchmarks.fakes import wmiexec
+
+if __name__ == '__main__':
+    sys.exit(wmiexec(sys.argv[1:]))
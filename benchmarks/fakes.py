@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+'''
+stand-ins for zmap, nmap, patator and wmiexec.py
+they answer from a network written by SyntheticNetwork (see synthetic.py) instead of the real one,
+so scans can be benchmarked without root, a network, or the real programs
+    $BENCH_NETWORK      directory written by SyntheticNetwork.write()
+    $BENCH_RATE         results per second (IPs for zmap, hosts for everything else), 0 for no limit
+the wrappers in benchmarks/bin are what actually go in $PATH
+'''
+
+import os
+import sys
+import json
+import time
+import shlex
+import socket
+import itertools
+import ipaddress
+from pathlib import Path
+from datetime import datetime
+from xml.sax.saxutils import quoteattr
+
+from .synthetic import finding
+
+
+# services a Windows host might have, in "sc query" format
+# (SERVICE_NAME, DISPLAY_NAME, fraction of hosts which have it)
+windows_services = [
+    ('Winmgmt',                 'Windows Management Instrumentation',   1.0),
+    ('WinDefend',               'Microsoft Defender Antivirus Service', 0.6),
+    ('SepMasterService',        'Symantec Endpoint Protection',         0.3),
+    ('AeXNSClient',             'Symantec Management Agent',            0.2),
+    ('CSFalconService',         'CrowdStrike Falcon Sensor Service',    0.3),
+    ('SplunkForwarder',         'SplunkForwarder Service',              0.4),
+    ('CbDefense',               'CB Defense',                           0.1),
+    ('vpnagent',                'Cisco AnyConnect Secure Mobility Agent', 0.2),
+    ('Sophos Agent',            'Sophos Agent',                         0.1),
+    ('WRSVC',                   'Webroot SecureAnywhere',               0.05),
+]
+
+windows_versions = [
+    'Windows 10 Enterprise',
+    'Windows 11 Enterprise',
+    'Windows Server 2016 Standard',
+    'Windows Server 2019 Standard',
+    'Windows Server 2022 Datacenter',
+    'Windows 7 Professional',
+]
+
+
+class Network:
+    '''
+    the fake tools' view of the network (see SyntheticNetwork.write())
+    '''
+
+    def __init__(self, network_dir=None):
+
+        if network_dir is None:
+            try:
+                network_dir = os.environ['BENCH_NETWORK']
+            except KeyError:
+                sys.stderr.write('[!] Please set $BENCH_NETWORK (see benchmarks/synthetic.py)\n')
+                sys.exit(1)
+
+        self.network_dir = Path(network_dir)
+        with open(self.network_dir / 'network.json') as f:
+            params = json.load(f)
+
+        self.seed           = params['seed']
+        self.finding_rate   = params['finding_rate']
+        self.ports          = params['ports']
+        # { port: set(ip_str ...) ... }
+        self._open          = dict()
+
+
+    def ping(self):
+        '''
+        generates every online host, in scan order
+        '''
+
+        return self._read_ips(self.network_dir / 'ping.txt')
+
+
+    def port(self, port):
+        '''
+        generates every host with a port open, in scan order
+        '''
+
+        return self._read_ips(self.network_dir / 'port_{}.txt'.format(port))
+
+
+    def is_open(self, ip, port):
+        '''
+        ports which weren't generated are always open, since they're only scanned
+        on hosts the inventory already knows have them open
+        '''
+
+        if not int(port) in self.ports:
+            return True
+        try:
+            return ip in self._open[port]
+        except KeyError:
+            self._open[port] = set(self.port(port))
+            return ip in self._open[port]
+
+
+    def finding(self, ip, check):
+
+        return finding(self.seed, ip, check, self.finding_rate)
+
+
+    def chance(self, ip, check, rate):
+
+        return finding(self.seed, ip, check, rate)
+
+
+    @staticmethod
+    def _read_ips(filename):
+
+        try:
+            with open(filename) as f:
+                for line in f:
+                    yield line.strip()
+        except FileNotFoundError:
+            return
+
+
+
+class Throttle:
+    '''
+    keeps output to $BENCH_RATE results per second
+    '''
+
+    def __init__(self, rate=None):
+
+        if rate is None:
+            rate = float(os.environ.get('BENCH_RATE', 0) or 0)
+        self.rate       = rate
+        self.count      = 0
+        self.started    = time.time()
+
+
+    def tick(self):
+
+        self.count += 1
+        if self.rate > 0:
+            delay = self.started + (self.count / self.rate) - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+
+    @property
+    def limited(self):
+
+        return self.rate > 0
+
+
+
+class Targets:
+    '''
+    matches IPs against networks given on the command line or in a file
+    single IPs are kept in a set, since that's what the inventory usually passes
+    '''
+
+    def __init__(self, networks=None):
+
+        self.ips = set()
+        self.ranges = []
+        for network in (networks or []):
+            self.add(network)
+
+
+    def add(self, network):
+
+        try:
+            network = ipaddress.ip_network(network.strip(), strict=False)
+        except ValueError:
+            return
+        if network.num_addresses == 1:
+            self.ips.add(str(network.network_address))
+        else:
+            self.ranges.append((int(network.network_address), int(network.broadcast_address)))
+
+
+    def read(self, filename):
+
+        with open(filename) as f:
+            for line in f:
+                self.add(line)
+
+
+    def __contains__(self, ip):
+
+        if ip in self.ips:
+            return True
+        if self.ranges:
+            ip = int.from_bytes(socket.inet_aton(ip), 'big')
+            return any([start <= ip <= end for start, end in self.ranges])
+        return False
+
+
+    def __bool__(self):
+
+        return bool(self.ips or self.ranges)
+
+
+
+def zmap(argv):
+    '''
+    prints IPs which answer a ping sweep (--probe-module=icmp_echoscan) or SYN scan (--target-port)
+    '''
+
+    port = None
+    targets = Targets()
+    blacklist = Targets()
+    for arg in argv:
+        if arg.startswith('--target-port='):
+            port = int(arg.split('=', 1)[-1])
+        elif arg.startswith('--whitelist-file='):
+            targets.read(arg.split('=', 1)[-1])
+        elif arg.startswith('--blacklist-file='):
+            blacklist.read(arg.split('=', 1)[-1])
+        elif not arg.startswith('-'):
+            targets.add(arg)
+
+    network = Network()
+    throttle = Throttle()
+    started = time.time()
+    sys.stderr.write('{:%b %d %H:%M:%S.000} [INFO] zmap: output module: csv\n'.format(datetime.now()))
+
+    found = 0
+    ips = (network.ping() if port is None else network.port(port))
+    for ip in ips:
+        if ip in targets and not ip in blacklist:
+            sys.stdout.write(ip + '\n')
+            found += 1
+            throttle.tick()
+            if throttle.limited:
+                sys.stdout.flush()
+
+    sys.stdout.flush()
+    sys.stderr.write('{:%b %d %H:%M:%S.000} [INFO] zmap: completed ({:,} hits in {:.1f}s)\n'.format(\
+        datetime.now(), found, time.time() - started))
+    return 0
+
+
+
+def nmap(argv):
+    '''
+    writes -oA output (.xml, .nmap, .gnmap) for -iL targets
+    script output is what the modules look for, for a fraction of hosts
+    '''
+
+    ports = []
+    scripts = []
+    output_file = None
+    targets = []
+    args = iter(argv)
+    for arg in args:
+        if arg.startswith('-p'):
+            ports = [int(p) for p in arg[2:].split(',') if p]
+        elif arg.startswith('--script='):
+            scripts = [s for s in arg.split('=', 1)[-1].split(',') if s]
+        elif arg == '-oA':
+            output_file = next(args)
+        elif arg == '-iL':
+            with open(next(args)) as f:
+                targets += [line.strip() for line in f if line.strip()]
+        elif not arg.startswith('-'):
+            targets.append(arg)
+
+    network = Network()
+    throttle = Throttle()
+    started = datetime.now()
+    print('Starting Nmap 7.94 ( https://nmap.org ) at {:%Y-%m-%d %H:%M} UTC'.format(started))
+
+    xml_hosts = []
+    nmap_lines = []
+    gnmap_lines = []
+    for ip in targets:
+        open_ports = [p for p in ports if network.is_open(ip, p)]
+        port_xml = []
+        host_scripts = []
+        for port in open_ports:
+            print('Discovered open port {}/tcp on {}'.format(port, ip))
+            port_scripts = []
+            for script in scripts:
+                output = _nmap_script(network, ip, port, script)
+                if output is None:
+                    continue
+                elif script in ['smb-vuln-ms17-010', 'smb-enum-shares']:
+                    if not (script, output) in host_scripts:
+                        host_scripts.append((script, output))
+                else:
+                    port_scripts.append((script, output))
+            port_xml.append('<port protocol="tcp" portid="{}"><state state="open" reason="syn-ack"/><service name="unknown"/>{}</port>'.format(\
+                port, ''.join(['<script id={} output={}/>'.format(quoteattr(s), quoteattr(o)) for s, o in port_scripts])))
+
+        xml_hosts.append('<host><status state="up"/><address addr="{}" addrtype="ipv4"/><ports>{}</ports>{}</host>'.format(\
+            ip, ''.join(port_xml), \
+            ('<hostscript>{}</hostscript>'.format(''.join(['<script id={} output={}/>'.format(quoteattr(s), quoteattr(o)) for s, o in host_scripts])) if host_scripts else '')))
+
+        nmap_lines.append('Nmap scan report for {}\n{}\n'.format(ip, \
+            '\n'.join(['{}/tcp open  unknown'.format(p) for p in open_ports]) or 'All {} scanned ports are filtered'.format(len(ports))))
+        gnmap_lines.append('Host: {} ()\tPorts: {}\n'.format(ip, \
+            ', '.join(['{}/open/tcp//unknown///'.format(p) for p in open_ports])))
+
+        throttle.tick()
+
+    elapsed = (datetime.now() - started).total_seconds()
+    if output_file is not None:
+        with open(output_file + '.xml', 'w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<nmaprun scanner="nmap" args={} version="7.94">\n'.format(quoteattr(' '.join(['nmap'] + argv))))
+            f.write('\n'.join(xml_hosts))
+            f.write('\n<runstats><finished elapsed="{:.2f}"/><hosts up="{}" total="{}"/></runstats>\n</nmaprun>\n'.format(\
+                elapsed, len(targets), len(targets)))
+        with open(output_file + '.nmap', 'w') as f:
+            f.write('# Nmap 7.94 scan initiated as: {}\n'.format(' '.join(['nmap'] + argv)))
+            f.write('\n'.join(nmap_lines))
+        with open(output_file + '.gnmap', 'w') as f:
+            f.write('# Nmap 7.94 scan initiated as: {}\n'.format(' '.join(['nmap'] + argv)))
+            f.writelines(gnmap_lines)
+
+    print('Nmap done: {0} IP addresses ({0} hosts up) scanned in {1:.2f} seconds'.format(len(targets), elapsed))
+    return 0
+
+
+def _nmap_script(network, ip, port, script):
+    '''
+    returns the output of an NSE script, or None if it wouldn't print anything
+    '''
+
+    vulnerable = network.finding(ip, script)
+
+    if script == 'smb-vuln-ms17-010':
+        if vulnerable:
+            return '\n  VULNERABLE:\n  Remote Code Execution vulnerability in Microsoft SMBv1 servers (ms17-010)\n    State: VULNERABLE\n'
+        return None
+
+    elif script == 'vnc-info':
+        if vulnerable:
+            return '\n  Protocol version: 3.8\n  Security types: \n    None (1)\n  WARNING: Server does not require authentication\n'
+        return '\n  Protocol version: 3.8\n  Security types: \n    VNC Authentication (2)\n'
+
+    elif script == 'ftp-anon':
+        if vulnerable:
+            return 'Anonymous FTP login allowed (FTP code 230)'
+        return None
+
+    elif script == 'smb-enum-shares':
+        if vulnerable:
+            return '\n  account_used: guest\n  \\\\{}\\Public: \n    Type: STYPE_DISKTREE\n    Anonymous access: READ\n'.format(ip)
+        return '\n  account_used: guest\n  \\\\{}\\IPC$: \n    Type: STYPE_IPC_HIDDEN\n    Anonymous access: <none>\n'.format(ip)
+
+    return None
+
+
+
+def patator(argv):
+    '''
+    ssh_login, with host=FILE0 0=hosts.txt style arguments (and user/password from FILEn or given directly)
+    '''
+
+    module = (argv[0] if argv else 'ssh_login')
+    if module != 'ssh_login':
+        sys.stderr.write('[!] Only ssh_login is supported by the stand-in patator, not "{}"\n'.format(module))
+        return 1
+
+    options = dict()
+    files = dict()
+    for arg in argv[1:]:
+        if '=' in arg:
+            key, value = arg.split('=', 1)
+            if key.isdigit():
+                with open(value) as f:
+                    files['FILE' + key] = [line.strip() for line in f if line.strip()]
+            else:
+                options[key] = value
+
+    # every combination of the FILEn keywords
+    keywords = [k for k in ['host', 'user', 'password'] if k in options]
+    values = [(files.get(options[k], []) if options[k].startswith('FILE') else [options[k]]) for k in keywords]
+
+    network = Network()
+    throttle = Throttle()
+    log = lambda level, msg: print('{:%H:%M:%S} patator    {:<5}- {}'.format(datetime.now(), level, msg))
+
+    log('INFO', 'Starting Patator 1.0 (https://github.com/lanjelot/patator) with python-3 at {:%Y-%m-%d %H:%M} UTC'.format(datetime.now()))
+    log('INFO', '')
+    log('INFO', 'code  size    time | candidate                          |   num | mesg')
+    log('INFO', '-' * 91)
+
+    for num, combination in enumerate(itertools.product(*values), 1):
+        candidate = dict(zip(keywords, combination))
+        ip = candidate.get('host', '')
+        candidate_str = ':'.join(combination)
+        if not network.is_open(ip, 22):
+            log('FAIL', 'xxx   41      0.001 | {:<35}| {:>5} | <class \'ConnectionRefusedError\'> [Errno 111] Connection refused'.format(candidate_str, num))
+        elif network.finding(ip, 'ssh_login:' + candidate_str):
+            log('INFO', '0     39      0.084 | {:<35}| {:>5} | SSH-2.0-OpenSSH_7.4'.format(candidate_str, num))
+        else:
+            log('FAIL', '1     22      0.052 | {:<35}| {:>5} | Authentication failed.'.format(candidate_str, num))
+        throttle.tick()
+
+    log('INFO', 'Hits/Done/Skip/Fail/Size: -/{}/0/0/{}'.format(num if values else 0, num if values else 0))
+    return 0
+
+
+
+def wmiexec(argv):
+    '''
+    runs a command line built by lib/collectors.py's build_command() against a fake Windows host
+    each "&"-separated command gets plausible output
+    '''
+
+    args = [a for a in argv if not a in ['-k', '-no-pass']]
+    if args and args[0] == '-hashes':
+        args = args[2:]
+    if len(args) < 2:
+        sys.stderr.write('usage: wmiexec.py [[domain/]username[:password]@]<targetName or address> [command]\n')
+        return 1
+
+    target = args[0].split('@')[-1]
+    command = ' '.join(args[1:]).strip()
+    if command.startswith('(') and command.endswith(')'):
+        command = command[1:-1]
+
+    network = Network()
+    throttle = Throttle()
+
+    print('Impacket v0.11.0 - Copyright 2023 Fortra\n')
+    print('[*] SMBv3.0 dialect used')
+
+    for part in command.split(' & '):
+        part = part.strip()
+        if part.startswith('echo '):
+            print(part[5:])
+        elif part.startswith('reg query') and 'productname' in part.lower():
+            version = windows_versions[sum(target.encode()) % len(windows_versions)]
+            print('\nHKEY_LOCAL_MACHINE\\software\\microsoft\\windows nt\\currentversion')
+            print('    productname    REG_SZ    {}\n'.format(version))
+        elif part.startswith('sc query'):
+            # findstr /i "word word ..." matches any of the words
+            try:
+                words = [w.lower() for w in shlex.split(part.split('|', 1)[1])[-1].split()]
+            except (IndexError, ValueError):
+                words = []
+            for service_name, display_name, rate in windows_services:
+                if network.chance(target, service_name, rate):
+                    for line in ['SERVICE_NAME: {}'.format(service_name), 'DISPLAY_NAME: {}'.format(display_name)]:
+                        if not words or any([w in line.lower() for w in words]):
+                            print(line)
+        elif part.startswith('wmic qfe'):
+            for i in range(sum(target.encode()) % 40):
+                print('KB50{:05d}  '.format(i * 37))
+        elif part.startswith('query user'):
+            print(' USERNAME              SESSIONNAME        ID  STATE   IDLE TIME  LOGON TIME')
+            print('>jsmith                console             1  Active      none   1/1/2026 9:00 AM')
+        elif part.startswith('net localgroup'):
+            print('Alias name     administrators')
+            print('Comment        Administrators have complete and unrestricted access to the computer/domain\n')
+            print('Members\n')
+            print('-' * 79)
+            print('Administrator')
+            print('CORP\\Domain Admins')
+            print('The command completed successfully.\n')
+
+    throttle.tick()
+    return 0
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+'''
+timed scenarios, each run in its own process by benchmarks/__main__.py
+    $ python3 -m benchmarks.scenarios <scenario> <fixture_dir> <result_file>
+only the part of each scenario that's being measured is timed (not loading the cache beforehand, etc.)
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import ipaddress
+from pathlib import Path
+
+# so lib and asset_inventory can be imported (and services.config is found) from anywhere
+repo_dir = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(repo_dir))
+
+from lib.inventory import Inventory
+from lib.registry import ModuleRegistry
+# for show_diff() and make_deliverable()
+import asset_inventory
+
+
+module_registry = ModuleRegistry(repo_dir / 'lib/modules')
+
+# { scenario_name: function ... }
+scenarios = dict()
+
+def scenario(f):
+
+    scenarios[f.__name__] = f
+    return f
+
+
+
+class BenchInventory(Inventory):
+    '''
+    zmap and nmap are the stand-ins in benchmarks/bin, so root isn't needed
+    '''
+
+    def _check_root(self):
+
+        pass
+
+
+
+class Timer:
+
+    def __enter__(self):
+
+        self.started = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *args):
+
+        self.seconds = time.perf_counter() - self.started
+
+
+
+class Fixture:
+    '''
+    a synthetic network and working directory written by benchmarks/__main__.py
+    scenarios which change the working directory get their own copy of it
+    '''
+
+    def __init__(self, fixture_dir):
+
+        self.fixture_dir    = Path(fixture_dir)
+        with open(self.fixture_dir / 'fixture.json') as f:
+            self.params     = json.load(f)
+
+        self.targets        = [ipaddress.ip_network(t) for t in self.params['targets']]
+        self.ports          = self.params['ports']
+        self.work_dir       = self.fixture_dir / 'work'
+        self.scratch_dir    = Path(tempfile.mkdtemp(prefix='scratch_', dir=str(self.fixture_dir)))
+
+
+    def copy(self):
+        '''
+        returns a copy of the working directory
+        '''
+
+        work_dir = Path(tempfile.mkdtemp(dir=str(self.scratch_dir))) / 'work'
+        shutil.copytree(self.work_dir, work_dir)
+        return work_dir
+
+
+    def empty(self):
+        '''
+        returns an empty working directory (nothing cached)
+        '''
+
+        work_dir = Path(tempfile.mkdtemp(dir=str(self.scratch_dir))) / 'work'
+        (work_dir / 'cache' / 'zmap').mkdir(mode=0o755, parents=True)
+        return work_dir
+
+
+    def inventory(self, work_dir=None, offline=False, modules=()):
+        '''
+        set up the same way as asset_inventory.py does it
+        modules are active, and the rest only carry their columns over
+        '''
+
+        if work_dir is None:
+            work_dir = self.work_dir
+
+        z = BenchInventory(self.targets, '500K', work_dir / 'cache', resolve=False, offline=offline)
+
+        for spec in module_registry:
+            if spec.module in modules:
+                z.add_module(spec.load(z), active=True)
+            else:
+                z.add_module(spec)
+
+        return z
+
+
+    def cleanup(self):
+
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+
+
+@scenario
+def load_scan_cache(fixture):
+    '''
+    reading state.csv for every target
+    '''
+
+    z = fixture.inventory(offline=True)
+    with Timer() as t:
+        z.load_scan_cache()
+
+    return {'seconds': t.seconds, 'hosts': len(z.hosts)}
+
+
+
+@scenario
+def discovery(fixture):
+    '''
+    ingesting a zmap ping sweep of every target, with nothing cached
+    '''
+
+    z = fixture.inventory(fixture.empty())
+    # nothing is cached, so every target gets a ping sweep
+    z.load_scan_cache()
+
+    with Timer() as t:
+        for host in z:
+            pass
+
+    return {'seconds': t.seconds, 'hosts': len(z.hosts)}
+
+
+
+@scenario
+def scan_online_hosts(fixture):
+    '''
+    zmap SYN scans of every port, on hosts found by a ping sweep
+    '''
+
+    z = fixture.inventory(fixture.empty())
+    z.load_scan_cache()
+    for host in z:
+        pass
+
+    port_seconds = dict()
+    with Timer() as t:
+        for port in fixture.ports:
+            with Timer() as port_timer:
+                z.scan_online_hosts(port)
+            port_seconds[str(port)] = port_timer.seconds
+
+    return {'seconds': t.seconds, 'hosts': len(z.hosts), 'open_ports': sum(z.open_ports.values()), \
+        'port_seconds': port_seconds}
+
+
+
+@scenario
+def write_csv(fixture):
+    '''
+    writing the report CSV (and the list of online hosts) for a cached inventory
+    '''
+
+    work_dir = fixture.copy()
+    z = fixture.inventory(work_dir)
+    z.load_scan_cache()
+
+    csv_file = work_dir / 'asset_inventory_bench.csv'
+    with Timer() as t:
+        z.write_csv(csv_file=csv_file)
+
+    return {'seconds': t.seconds, 'hosts': len(z.hosts), 'bytes': csv_file.stat().st_size}
+
+
+
+@scenario
+def dump_scan_cache(fixture):
+    '''
+    writing state.csv for every target
+    '''
+
+    work_dir = fixture.copy()
+    z = fixture.inventory(work_dir)
+    z.load_scan_cache()
+
+    with Timer() as t:
+        z.dump_scan_cache()
+
+    return {'seconds': t.seconds, 'hosts': len(z.hosts)}
+
+
+
+@scenario
+def diff(fixture):
+    '''
+    --diff against a file of known /24s (most of the ones with hosts in them)
+    '''
+
+    work_dir = fixture.copy()
+    z = fixture.inventory(work_dir, offline=True)
+    z.load_scan_cache()
+
+    # show_diff() writes its CSVs to the current directory
+    options = argparse.Namespace(diff=work_dir / 'diff.txt', netmask=24)
+    cwd = Path.cwd()
+    try:
+        os.chdir(str(work_dir))
+        with Timer() as t:
+            asset_inventory.show_diff(z, options)
+    finally:
+        os.chdir(str(cwd))
+
+    return {'seconds': t.seconds, 'hosts': len(z.hosts)}
+
+
+
+@scenario
+def make_deliverable(fixture):
+    '''
+    --make-deliverable from past reports, once from scratch and once more with nothing new
+    '''
+
+    work_dir = fixture.copy()
+    z = fixture.inventory(work_dir, offline=True)
+    z.load_scan_cache()
+
+    options = argparse.Namespace(targets=fixture.targets, work_dir=work_dir)
+    with Timer() as t:
+        asset_inventory.make_deliverable(z, options)
+    with Timer() as rerun:
+        asset_inventory.make_deliverable(z, options)
+
+    return {'seconds': t.seconds, 'rerun_seconds': rerun.seconds, 'hosts': len(z.hosts)}
+
+
+
+@scenario
+def modules(fixture):
+    '''
+    running modules against a cached inventory, with nmap answered by the stand-in
+    only modules whose checks all go through the stand-ins belong here (e.g. not ones that connect to hosts themselves)
+    '''
+
+    module_names = fixture.params.get('modules', ['eternalblue'])
+
+    work_dir = fixture.copy()
+    z = fixture.inventory(work_dir, modules=module_names)
+    z.load_scan_cache()
+
+    with Timer() as t:
+        z.run_modules()
+
+    return {'seconds': t.seconds, 'hosts': len(z.hosts), 'module_seconds': dict(z.module_timing), \
+        'findings': dict([(column, len(ips)) for column, ips in z.findings.items()])}
+
+
+
+def run(name, fixture_dir, result_file):
+
+    fixture = Fixture(fixture_dir)
+    try:
+        result = scenarios[name](fixture)
+    finally:
+        fixture.cleanup()
+
+    # peak for the whole process, including setup
+    result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    with open(result_file, 'w') as f:
+        json.dump(result, f)
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run one benchmark scenario (see benchmarks/__main__.py)')
+    parser.add_argument('scenario', choices=list(scenarios))
+    parser.add_argument('fixture_dir', type=Path)
+    parser.add_argument('result_file', type=Path)
+
+    options = parser.parse_args()
+    run(options.scenario, options.fixture_dir, options.result_file)
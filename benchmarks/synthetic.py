@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import csv
+import zlib
+import json
+import random
+import socket
+import ipaddress
+from pathlib import Path
+
+
+# filled in for hosts without a hostname
+hostname_formats = [
+    'ws-{a:03d}-{b:03d}.corp.local',
+    'srv-{a:03d}-{b:03d}.corp.local',
+    'lt-{a:03d}{b:03d}.corp.local',
+]
+
+
+def ip_to_str(ip):
+
+    return socket.inet_ntoa(ip.to_bytes(4, 'big'))
+
+
+def finding(seed, ip, check, rate):
+    '''
+    whether or not a host has a finding (vulnerable, open share, etc.)
+    deterministic, so the generated cache and the fake tools agree with each other
+    '''
+
+    return zlib.crc32('{}-{}-{}'.format(seed, ip, check).encode()) < rate * 0xffffffff
+
+
+
+class SyntheticNetwork:
+    '''
+    generates a fake network and a working directory full of cached results for it
+        work_dir/cache/<target>/state.csv       the scan cache (see Inventory.load_scan_cache())
+        work_dir/asset_inventory_*.csv          past reports (see --make-deliverable)
+        work_dir/diff.txt                       known networks (see --diff)
+        network/                                what the fake zmap/nmap see (see benchmarks/fakes.py)
+
+    hosts are clustered into a subset of the /24s in each target, with a few busy subnets
+    and a long tail, which is closer to a real network than IPs picked evenly
+    '''
+
+    def __init__(self, targets, hosts=10000, ports=(22, 80, 445), port_density=0.25, \
+        columns=None, finding_rate=0.05, reports=3, hosts_per_subnet=64, seed=1):
+
+        self.targets            = [ipaddress.ip_network(t) for t in targets]
+        self.host_count         = int(hosts)
+        self.ports              = [int(p) for p in ports]
+        self.port_density       = float(port_density)
+        self.finding_rate       = float(finding_rate)
+        self.reports            = int(reports)
+        self.hosts_per_subnet   = int(hosts_per_subnet)
+        self.seed               = seed
+        self.random             = random.Random(seed)
+
+        # module columns, and the ports a host needs for them to be filled in
+        # [ (column, [port ...]) ... ]
+        if columns is None:
+            columns = []
+        self.columns            = [(column, list(required_ports)) for column, required_ports in columns]
+
+        # { ip_as_int: (hostname, set(port ...)) ... }
+        self.hosts              = dict()
+        self._generate()
+
+
+    @classmethod
+    def from_registry(cls, registry, targets, **kwargs):
+        '''
+        uses the columns of every module in lib/modules
+        '''
+
+        columns = []
+        for spec in registry:
+            for column in spec.csv_headers:
+                if not column in [c[0] for c in columns]:
+                    columns.append((column, spec.required_ports))
+
+        return cls(targets, columns=columns, **kwargs)
+
+
+    def write(self, work_dir, network_dir):
+        '''
+        writes the cache, past reports, diff file and the fake tools' view of the network
+        '''
+
+        work_dir = Path(work_dir)
+        network_dir = Path(network_dir)
+        cache_dir = work_dir / 'cache'
+        (cache_dir / 'zmap').mkdir(mode=0o755, parents=True, exist_ok=True)
+        network_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
+
+        ips = sorted(self.hosts)
+
+        # scan cache, one state.csv per target (every port has been scanned)
+        for target in self.targets:
+            start, end = int(target.network_address), int(target.broadcast_address)
+            target_dir = cache_dir / str(target).replace('/', '-')
+            target_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
+            self._write_csv(target_dir / 'state.csv', [ip for ip in ips if start <= ip <= end])
+
+        # past reports, each with most of the hosts and some of the results changed
+        for i in range(self.reports):
+            report_ips = [ip for ip in ips if self.random.random() < 0.8]
+            self._write_csv(work_dir / 'asset_inventory_2000-01-01_00-00-{:02d}.csv'.format(i), \
+                report_ips, check='report-{}'.format(i))
+
+        # known networks for --diff: most of the /24s which have hosts in them
+        subnets = sorted(set([ip >> 8 for ip in ips]))
+        with open(work_dir / 'diff.txt', 'w') as f:
+            for subnet in subnets:
+                if self.random.random() < 0.9:
+                    f.write('{}/24\n'.format(ip_to_str(subnet << 8)))
+
+        # what zmap sees, in the order it'd find it (zmap scans in a random order)
+        shuffled = list(ips)
+        self.random.shuffle(shuffled)
+        self._write_ips(network_dir / 'ping.txt', shuffled)
+        for port in self.ports:
+            self._write_ips(network_dir / 'port_{}.txt'.format(port), [ip for ip in shuffled if port in self.hosts[ip][1]])
+
+        with open(network_dir / 'network.json', 'w') as f:
+            json.dump({
+                'seed':         self.seed,
+                'hosts':        len(self.hosts),
+                'ports':        self.ports,
+                'finding_rate': self.finding_rate,
+            }, f, indent=2)
+
+
+    def _generate(self):
+
+        # each target is split into /24s (or is a single block if it's smaller)
+        # [ (start_as_int, block_size, block_count) ... ]
+        blocks = []
+        for target in self.targets:
+            block_size = 2 ** (32 - max(target.prefixlen, 24))
+            blocks.append((int(target.network_address), block_size, target.num_addresses // block_size))
+
+        total_blocks = sum([b[2] for b in blocks])
+        capacity = sum([self._usable(b[:2]) * b[2] for b in blocks])
+        if self.host_count > capacity:
+            raise ValueError('{:,} hosts won\'t fit in {:,} addresses'.format(self.host_count, capacity))
+
+        # pick which /24s have hosts in them
+        subnet_count = min(total_blocks, max(1, -(-self.host_count // self.hosts_per_subnet)))
+        subnets = []
+        for i in self.random.sample(range(total_blocks), subnet_count):
+            subnets.append(self._block(blocks, i))
+        # use every block if the targets are too small for the chosen ones to hold everything
+        if sum([self._usable(s) for s in subnets]) < self.host_count:
+            subnets = [self._block(blocks, i) for i in range(total_blocks)]
+
+        # a few busy subnets and a long tail
+        # each subnet gets its share of the hosts, and whatever doesn't fit goes to the next one
+        weights = [1 / (rank ** 0.8) for rank in range(1, len(subnets) + 1)]
+        total_weight = sum(weights)
+        ips = []
+        leftover = 0
+        remaining = self.host_count
+        for (start, block_size), weight in zip(subnets, weights):
+            usable = self._usable((start, block_size))
+            count = min(usable, remaining, round(self.host_count * weight / total_weight) + leftover)
+            leftover = max(0, round(self.host_count * weight / total_weight) + leftover - count)
+            remaining -= count
+            first = (1 if block_size > 2 else 0)
+            ips += [start + i for i in self.random.sample(range(first, first + usable), count)]
+        # rounding may leave a few over, go through the subnets again
+        taken = set(ips)
+        for start, block_size in subnets:
+            if remaining <= 0:
+                break
+            first = (1 if block_size > 2 else 0)
+            spare = [start + i for i in range(first, first + self._usable((start, block_size))) if not start + i in taken]
+            ips += spare[:remaining]
+            remaining -= len(spare[:remaining])
+
+        for ip in ips:
+            if self.random.random() < 0.7:
+                hostname = self.random.choice(hostname_formats).format(a=(ip >> 8) & 0xff, b=ip & 0xff)
+            else:
+                hostname = ''
+            open_ports = set([port for port in self.ports if self.random.random() < self.port_density])
+            self.hosts[ip] = (hostname, open_ports)
+
+
+    @staticmethod
+    def _block(blocks, i):
+        '''
+        takes index into all the blocks across targets
+        returns (start_as_int, block_size)
+        '''
+
+        for start, block_size, block_count in blocks:
+            if i < block_count:
+                return (start + i * block_size, block_size)
+            i -= block_count
+
+        raise IndexError(i)
+
+
+    @staticmethod
+    def _usable(block):
+        '''
+        number of usable addresses in a block (no network or broadcast address)
+        '''
+
+        return (block[1] - 2 if block[1] > 2 else block[1])
+
+
+    def _write_csv(self, filename, ips, check='cache'):
+
+        port_columns = ['{}/tcp'.format(port) for port in self.ports]
+        fieldnames = ['IP Address', 'Hostname'] + [c[0] for c in self.columns] + port_columns
+
+        with open(filename, 'w', newline='') as f:
+            c = csv.DictWriter(f, fieldnames=fieldnames)
+            c.writeheader()
+            for ip in ips:
+                hostname, open_ports = self.hosts[ip]
+                ip_str = ip_to_str(ip)
+                row = {'IP Address': ip_str, 'Hostname': hostname}
+                for column, required_ports in self.columns:
+                    if required_ports and not open_ports.intersection(required_ports):
+                        row[column] = 'N/A'
+                    elif finding(self.seed, ip_str, column + check, self.finding_rate):
+                        row[column] = 'Yes'
+                    else:
+                        row[column] = 'No'
+                for port, column in zip(self.ports, port_columns):
+                    row[column] = ('Open' if port in open_ports else 'Closed')
+                c.writerow(row)
+
+
+    @staticmethod
+    def _write_ips(filename, ips):
+
+        with open(filename, 'w') as f:
+            for ip in ips:
+                f.write(ip_to_str(ip) + '\n')
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import re
+import json
+import hashlib
+import configparser
+
+
+# marks the start of each section in the combined output
+canary = '!@#'
+
+
+class CollectorError(Exception):
+    pass
+
+
+
+class Collector:
+    r'''
+    one fact to gather from a Windows host, as defined in collectors.config:
+
+        [bitlocker]
+        Command=manage-bde -status C:
+        Parser=regex
+        Pattern=Protection Status:\s+(.+)
+        Columns=BitLocker
+
+    parsers:
+        regex   each capture group of the first match fills the corresponding column
+        count   number of lines matching Pattern (every non-empty line if there's no Pattern)
+        list    every match of Pattern (or its first capture group), comma-separated
+        lines   every non-empty line, comma-separated
+    Start and End (regexes) can be used to only parse the lines between them
+    '''
+
+    parsers = ['regex', 'count', 'list', 'lines']
+
+    def __init__(self, name, command, columns, parser='lines', pattern=None, start=None, end=None):
+
+        self.name       = str(name).strip().lower()
+        self.command    = str(command).strip()
+        self.columns    = list(columns)
+        self.parser     = str(parser).strip().lower()
+        self.pattern    = pattern
+        self.start      = start
+        self.end        = end
+
+        if not re.fullmatch(r'[a-z0-9_\-]+', self.name):
+            raise CollectorError('Invalid collector name "{}" (use letters, numbers, dashes, underscores)'.format(self.name))
+        if not self.command:
+            raise CollectorError('Collector "{}" has no command'.format(self.name))
+        if not self.columns:
+            raise CollectorError('Collector "{}" has no columns'.format(self.name))
+        if not self.parser in self.parsers:
+            raise CollectorError('Collector "{}" has invalid parser "{}", pick from: {}'.format(self.name, self.parser, ', '.join(self.parsers)))
+        if self.parser == 'regex' and not self.pattern:
+            raise CollectorError('Collector "{}" needs a Pattern for the regex parser'.format(self.name))
+
+        try:
+            self.regex = (re.compile(self.pattern, re.I) if self.pattern else None)
+            self.start_regex = (re.compile(self.start, re.I) if self.start else None)
+            self.end_regex = (re.compile(self.end, re.I) if self.end else None)
+        except re.error as e:
+            raise CollectorError('Collector "{}" has invalid regex: {}'.format(self.name, str(e)))
+
+
+    @property
+    def fingerprint(self):
+        '''
+        changes whenever the collector definition changes
+        '''
+
+        definition = [self.command, self.columns, self.parser, self.pattern, self.start, self.end]
+        return hashlib.sha1(json.dumps(definition).encode()).hexdigest()[:16]
+
+
+    def parse(self, lines):
+        '''
+        takes list of output lines from this collector's command
+        returns dictionary in format:
+        { column: value ... }
+        '''
+
+        lines = self._trim(lines)
+        values = []
+
+        if self.parser == 'regex':
+            for line in lines:
+                match = self.regex.search(line)
+                if match:
+                    values = [g.strip() for g in (match.groups() or [match.group(0)])]
+                    break
+
+        elif self.parser == 'count':
+            values = [str(len([l for l in lines if (self.regex is None or self.regex.search(l))]))]
+
+        elif self.parser == 'list':
+            matches = []
+            for line in lines:
+                if self.regex is None:
+                    matches.append(line)
+                else:
+                    for match in self.regex.finditer(line):
+                        matches.append((match.group(1) if match.groups() else match.group(0)).strip())
+            values = [', '.join(matches)]
+
+        elif self.parser == 'lines':
+            values = [', '.join(lines)]
+
+        results = dict()
+        for i, column in enumerate(self.columns):
+            try:
+                results[column] = values[i]
+            except IndexError:
+                results[column] = ''
+
+        return results
+
+
+    def _trim(self, lines):
+
+        lines = [l.strip() for l in lines if l.strip()]
+
+        if self.start_regex is not None:
+            for i, line in enumerate(lines):
+                if self.start_regex.search(line):
+                    lines = lines[i+1:]
+                    break
+            else:
+                lines = []
+
+        if self.end_regex is not None:
+            for i, line in enumerate(lines):
+                if self.end_regex.search(line):
+                    lines = lines[:i]
+                    break
+
+        return lines
+
+
+
+def load_collectors(config_file):
+    '''
+    reads collector definitions from an INI file
+    returns list of Collector objects (empty if the file doesn't exist)
+    '''
+
+    config = configparser.ConfigParser(interpolation=None)
+    if not config.read(str(config_file)):
+        return []
+
+    collectors = []
+    for name in config.sections():
+        section = config[name]
+        if section.get('Enabled', 'yes').strip().lower() in ['no', 'false', '0']:
+            continue
+        collectors.append(Collector(
+            name,
+            section.get('Command', ''),
+            [c.strip() for c in section.get('Columns', '').split(',') if c.strip()],
+            parser=section.get('Parser', 'lines'),
+            pattern=section.get('Pattern', None),
+            start=section.get('Start', None),
+            end=section.get('End', None)
+        ))
+
+    return collectors
+
+
+
+def build_command(sections):
+    '''
+    takes list of (section_name, command) tuples
+    packs them into one command line, with a canary before each section
+    '''
+
+    win_commands = ['(']
+    for name, command in sections:
+        win_commands += ['echo {}{}'.format(canary, name), '&', command, '&']
+
+    return ' '.join(win_commands[:-1] + [')'])
+
+
+
+def split_output(output):
+    '''
+    takes output from a command line created with build_command()
+    returns dictionary in format:
+    { section_name: [line, line, ...] ... }
+    '''
+
+    sections = dict()
+    section = None
+
+    for line in output.splitlines():
+        stripped = line.strip()
+        if stripped.startswith(canary):
+            section = stripped[len(canary):]
+            sections[section] = []
+        elif section is not None:
+            sections[section].append(line)
+
+    return sections
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import socket
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# port columns are stored as indexes into this list
+port_states = ['Open', 'Closed', 'Unknown']
+port_codes = dict([(state, i) for i, state in enumerate(port_states)])
+
+
+def check():
+    '''
+    raises ValueError if pyarrow isn't installed
+    '''
+
+    if pa is None:
+        raise ValueError('Please run "python3 -m pip install pyarrow" to use Parquet export')
+
+
+def schema(fieldnames):
+    '''
+    takes CSV fieldnames, returns pyarrow schema
+        IP Address  -->  uint32
+        Hostname    -->  string
+        ###/tcp     -->  dictionary (Open/Closed/Unknown)
+        (other)     -->  dictionary-encoded string (module results are mostly Yes/No/N/A)
+    '''
+
+    check()
+
+    fields = []
+    for name in fieldnames:
+        if name == 'IP Address':
+            fields.append(pa.field(name, pa.uint32(), nullable=False))
+        elif name == 'Hostname':
+            fields.append(pa.field(name, pa.string()))
+        elif name.endswith('/tcp'):
+            fields.append(pa.field(name, pa.dictionary(pa.int8(), pa.string())))
+        else:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+
+    return pa.schema(fields)
+
+
+
+class ParquetWriter:
+    '''
+    like csv.DictWriter, but writes a Parquet file
+    rows are buffered and written in record batches, so the whole table is never in memory
+    '''
+
+    def __init__(self, filename, fieldnames, batch_size=65536):
+
+        self.filename   = str(filename)
+        self.fieldnames = list(fieldnames)
+        self.schema     = schema(self.fieldnames)
+        self.batch_size = batch_size
+        self.rows       = []
+
+        self.port_dictionary = pa.array(port_states, pa.string())
+        self.writer = pq.ParquetWriter(self.filename, self.schema)
+
+
+    def writerow(self, row):
+
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+
+    def writerows(self, rows):
+
+        for row in rows:
+            self.writerow(row)
+
+
+    def flush(self):
+
+        if not self.rows:
+            return
+
+        columns = []
+        for field in self.schema:
+            name = field.name
+            if name == 'IP Address':
+                values = [int.from_bytes(socket.inet_aton(row[name]), 'big') for row in self.rows]
+                columns.append(pa.array(values, pa.uint32()))
+            elif name == 'Hostname':
+                columns.append(pa.array([(row.get(name) or None) for row in self.rows], pa.string()))
+            elif name.endswith('/tcp'):
+                indices = pa.array([port_codes.get(row.get(name)) for row in self.rows], pa.int8())
+                columns.append(pa.DictionaryArray.from_arrays(indices, self.port_dictionary))
+            else:
+                values = pa.array([(row.get(name) or None) for row in self.rows], pa.string())
+                columns.append(values.dictionary_encode())
+
+        self.writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=self.schema))
+        self.rows = []
+
+
+    def close(self):
+
+        try:
+            self.flush()
+        finally:
+            self.writer.close()
+
+
+
+def read_rows(filename, batch_size=65536):
+    '''
+    reads a Parquet file written by ParquetWriter
+    generates rows in the same format as csv.DictReader, one record batch at a time
+    '''
+
+    check()
+
+    parquet_file = pq.ParquetFile(str(filename))
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+
+        # decoded one column at a time, which is much faster than row by row
+        columns = []
+        for name, column in zip(batch.schema.names, batch.columns):
+            if name == 'IP Address':
+                columns.append([socket.inet_ntoa(ip.to_bytes(4, 'big')) for ip in column.to_pylist()])
+            else:
+                if pa.types.is_dictionary(column.type):
+                    column = column.dictionary_decode()
+                columns.append(column.fill_null('').to_pylist())
+
+        for values in zip(*columns):
+            yield dict(zip(batch.schema.names, values))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import gzip
+import shutil
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# { compression: file_extension }
+extensions = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+# favor speed over size, since CSVs compress well either way
+gzip_level = 6
+zstd_level = 3
+
+
+def check(compression):
+    '''
+    raises ValueError if compression is unknown or unavailable
+    '''
+
+    if compression is None:
+        return
+    if not compression in extensions:
+        raise ValueError('Invalid compression: {} (pick from {})'.format(compression, ', '.join(extensions)))
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError('Please run "python3 -m pip install zstandard" to use zstd compression')
+
+
+def detect(filename):
+    '''
+    returns compression used by a file, based on its extension (or None)
+    '''
+
+    filename = str(filename)
+    for compression, extension in extensions.items():
+        if filename.endswith(extension):
+            return compression
+    return None
+
+
+def compressed_name(filename, compression):
+    '''
+    adds the extension for compression to a filename
+    returns the same type it's given (str or Path)
+    '''
+
+    if compression is None or detect(filename) == compression:
+        return filename
+
+    new_filename = str(filename) + extensions[compression]
+    return (Path(new_filename) if isinstance(filename, Path) else new_filename)
+
+
+def strip_extension(filename):
+    '''
+    "state.csv.gz" --> "state.csv"
+    '''
+
+    filename = str(filename)
+    compression = detect(filename)
+    if compression is None:
+        return filename
+    return filename[:-len(extensions[compression])]
+
+
+def variants(filename):
+    '''
+    returns all possible names of a file (uncompressed and compressed)
+    '''
+
+    filename = Path(strip_extension(filename))
+    return [filename] + [Path(str(filename) + extension) for extension in extensions.values()]
+
+
+def open_file(filename, mode='r', newline=None, buffering=-1):
+    '''
+    like open(), but transparently (de)compresses based on the file extension
+    reads and writes are streamed, so the whole file is never held in memory
+    '''
+
+    compression = detect(filename)
+    text = not 'b' in mode
+
+    if compression is None:
+        return open(filename, mode, newline=(newline if text else None), buffering=buffering)
+
+    if compression == 'gzip':
+        if text:
+            return gzip.open(filename, mode.replace('t', '') + 't', compresslevel=gzip_level, \
+                encoding='utf-8', newline=newline)
+        return gzip.open(filename, mode, compresslevel=gzip_level)
+
+    check(compression)
+    cctx = zstandard.ZstdCompressor(level=zstd_level)
+    if text:
+        return zstandard.open(filename, mode.replace('t', ''), cctx=cctx, encoding='utf-8', newline=newline)
+    return zstandard.open(filename, mode, cctx=cctx)
+
+
+def compress_file(filename, compression):
+    '''
+    compresses an existing file, and removes the original
+    returns the new filename
+    (used for files written by other programs, e.g. nmap's -oA output)
+    '''
+
+    if compression is None or detect(filename) is not None:
+        return filename
+
+    filename = Path(filename)
+    if not filename.is_file():
+        return filename
+
+    new_filename = compressed_name(filename, compression)
+    with open(filename, 'rb') as f_in, open_file(new_filename, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out, 1024*1024)
+    filename.unlink()
+
+    return new_filename
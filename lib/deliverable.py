@@ -2,95 +2,459 @@
 
 # by TheTechromancer
 
+import os
 import csv
 import sys
+import json
+import heapq
+import socket
+import hashlib
+import tempfile
 import ipaddress
+from pathlib import Path
+from operator import itemgetter
+from contextlib import ExitStack
+from .compression import open_file, compressed_name, variants
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+class UnsortedInput(Exception):
+    '''
+    raised when a CSV turns out not to be sorted by IP
+    '''
+
+    def __init__(self, file):
+
+        super().__init__('{} is not sorted by IP'.format(file))
+        self.file = file
+
+
 
 class Deliverable:
+    '''
+    combines asset inventory CSVs into one file
+    CSVs are already sorted by IP, so they're merged as streams (k-way merge),
+    and each host is written out as soon as it's been seen in every file
+    memory use depends on the number of files, not the number of hosts
+    if state_dir is given, the merged results are kept there along with a manifest
+    of which CSVs went into them, so each build only has to read the new CSVs
+    the manifest is stored as JSON in format (keyed by name, so a copied working directory still matches):
+    {
+        filename: {'size': bytes, 'mtime': unix_time, 'hash': sha1_of_contents} ...
+    }
+    '''
 
-    def __init__(self, inventory, csv_files):
+    # values which are overwritten by later files
+    empty_values = ['unknown', 'n/a', 'closed']
+
+    def __init__(self, inventory, csv_files, state_dir=None, max_open_files=256):
 
         self.inventory = inventory
-        self.csv_files = csv_files
+        self.csv_files = [Path(f) for f in csv_files]
+
+        # if there are more files than this, they're merged in several passes
+        self.max_open_files = max(2, max_open_files)
+
+        # files which need to be sorted in memory
+        self.unsorted = set()
+        # files which couldn't be read
+        self.failed = set()
+
+        self.state_dir = state_dir
+        if self.state_dir is not None:
+            self.state_dir = Path(state_dir)
+            self.state_file = compressed_name(self.state_dir / 'merged.csv', inventory.compression)
+            self.manifest_file = self.state_dir / 'manifest.json'
 
 
     def generate_xlsx(self, filename):
         '''
         takes a list of asset inventory CSV files and combines them
-        writes to a new CSV file in the current directory
+        writes to an XLSX file (see WorkbookWriter) if filename ends with ".xlsx",
+        otherwise to a CSV file
         '''
 
-        #try:
-        #    import openpyxl
-        #except ImportError:
-        #    sys.stderr.write('\n[!] Please run "python3 -m pip install openpyxl"\n\n')
-        #    return
+        if str(filename).endswith('.xlsx') and openpyxl is None:
+            sys.stderr.write('[!] Please run "python3 -m pip install openpyxl" to create XLSX files, writing CSV instead\n')
+            filename = compressed_name(Path(filename).with_suffix('.csv'), self.inventory.compression)
+
+        csv_files = self.csv_files
+        manifest = dict()
+        inputs = list(csv_files)
+
+        if self.state_dir is not None:
+            manifest, csv_files = self._new_files()
+            inputs = list(csv_files)
+            if manifest:
+                print('[+] Reusing {:,} previously merged CSV(s) from {}'.format(len(manifest), self.state_file))
+                inputs = [self.state_file] + inputs
 
-        hosts = dict()
-        fieldnames = []
+        # only hosts in the cache end up in the deliverable
+        cached_hosts = set([int(ip) for ip in self.inventory.hosts])
 
-        for file in self.csv_files:
+        tmp_files = []
+        try:
+            # too many files to open at once
+            while len(inputs) > self.max_open_files:
+                fd, tmp_file = tempfile.mkstemp(prefix='tmp_merge_', suffix='.csv', dir=str(self.inventory.work_dir))
+                os.close(fd)
+                tmp_files.append(Path(tmp_file))
+                self._merge_to(inputs[:self.max_open_files], [(tmp_files[-1], None)])
+                inputs = [tmp_files[-1]] + inputs[self.max_open_files:]
+
+            outputs = [(filename, cached_hosts)]
+            if self.state_dir is not None:
+                self.state_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
+                state_tmp_file = self.state_dir / ('tmp_' + self.state_file.name)
+                # hosts outside the cache are kept in the state
+                outputs.append((state_tmp_file, None))
+
+            print('[+] Writing combined list to {}'.format(filename))
+            self._merge_to(inputs, outputs)
+
+        finally:
+            for tmp_file in tmp_files:
+                tmp_file.unlink()
+
+        if self.state_dir is not None:
+            for file in csv_files:
+                if not file in self.failed:
+                    manifest[file.name] = self._file_info(file)
+            self._save_state(state_tmp_file, manifest)
+
+
+    def _merge_to(self, files, outputs):
+        '''
+        merges files into one or more CSV/XLSX files
+        outputs is a list of (filename, ips) tuples, where ips is a set of integers,
+        or None to write every host
+        if any file turns out to be unsorted, the merge starts over
+        '''
+
+        fieldnames = self._fieldnames(files)
+
+        while True:
             try:
-                with open(file, newline='') as f:
+                with ExitStack() as stack:
+                    writers = []
+                    for filename, ips in outputs:
+                        if str(filename).endswith('.xlsx'):
+                            w = WorkbookWriter(filename, fieldnames)
+                            stack.callback(w.close)
+                        else:
+                            f = stack.enter_context(open_file(filename, newline='', mode='w'))
+                            w = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+                            w.writeheader()
+                        writers.append((w, ips))
 
-                    c = csv.DictReader(f)
+                    for ip, host in self._merge(files, stack):
+                        host['Open Ports'] = ', '.join([str(p) for p in sorted(host['Open Ports'])])
+                        for w, ips in writers:
+                            if ips is None or ip in ips:
+                                w.writerow(host)
+                return
 
-                    if not fieldnames:
-                        fieldnames = ['IP Address', 'Hostname', 'Open Ports']
+            except UnsortedInput as e:
+                print('[!] {}, sorting it in memory'.format(str(e)))
+                self.unsorted.add(e.file)
 
-                    if c.fieldnames:
-                        for field in c.fieldnames:
-                            if not field in fieldnames and not field.lower().endswith('/tcp'):
-                                fieldnames.append(field)
 
-                    for row in c:
+    def _merge(self, files, stack):
+        '''
+        generates (ip, host) for every host in files, in order
+        rows for the same IP arrive in the same order as files, so earlier files win
+        '''
 
-                        row = dict(row)
-                        ports = set()
-                        ip = ipaddress.ip_address(row['IP Address'])
+        streams = []
+        for file in files:
+            f = stack.enter_context(open_file(file, newline=''))
+            if file in self.unsorted:
+                streams.append(sorted(self._read(file, f), key=itemgetter(0)))
+            else:
+                streams.append(self._read(file, f, check_order=True))
 
-                        # filter out hosts not in the cache
-                        if not ip in self.inventory.hosts:
-                            continue
+        ip = None
+        host = None
+        # heapq.merge() is stable, so ties go to the earlier file
+        for row_ip, row in heapq.merge(*streams, key=itemgetter(0)):
+            if row_ip != ip:
+                if host is not None:
+                    yield (ip, host)
+                ip, host = row_ip, row
+            else:
+                self._fold(host, row)
 
-                        for k in list(row):
-                            if k.lower().endswith('/tcp'):
-                                try:
-                                    if row[k].lower() == 'open':
-                                        port = int(k.split('/')[0])
-                                        ports.add(port)
-                                    row.pop(k)
-                                except ValueError:
-                                    continue
+        if host is not None:
+            yield (ip, host)
 
+
+    def _read(self, file, f, check_order=False):
+        '''
+        generates (ip, row) from a CSV, where ip is an integer
+        port columns are replaced by "Open Ports" (a set)
+        '''
+
+        last_ip = None
+
+        try:
+            for row in csv.DictReader(f):
+
+                ports = set()
+                ip = int(ipaddress.ip_address(row['IP Address']))
+
+                if check_order:
+                    if last_ip is not None and ip < last_ip:
+                        raise UnsortedInput(file)
+                    last_ip = ip
+
+                # "Open Ports" from a previous merge
+                for port in (row.pop('Open Ports', '') or '').split(','):
+                    try:
+                        ports.add(int(port))
+                    except ValueError:
+                        continue
+
+                for k in list(row):
+                    if k is not None and k.lower().endswith('/tcp'):
                         try:
-                            ports.update(hosts[ip]['Open Ports'])
-                            for k,v in row.items():
-                                if v and not v.lower() in ['unknown', 'n/a', 'closed']:
-                                    # skip if the cell isn't empty
-                                    if k in hosts[ip] and not k.lower() == 'open ports':
-                                        if hosts[ip][k] and not hosts[ip][k].lower() in ['unknown', 'n/a', 'closed']:
-                                            continue
-                                    hosts[ip].update({k: v})
+                            if row[k].lower() == 'open':
+                                port = int(k.split('/')[0])
+                                ports.add(port)
+                            row.pop(k)
+                        except ValueError:
+                            continue
 
-                        except KeyError:
-                            hosts[ip] = row
+                row['Open Ports'] = ports
+                yield (ip, row)
 
-                        finally:
-                            hosts[ip].update({'Open Ports': ports})
+        except KeyError:
+            sys.stderr.write('[!] Error combining {}\n'.format(file))
+            self.failed.add(file)
+
+
+    def _fold(self, host, row):
+        '''
+        merges a later row into host
+        ports are combined, and empty/unknown values are filled in
+        '''
+
+        host['Open Ports'].update(row.pop('Open Ports'))
+        for k,v in row.items():
+            if v and not v.lower() in self.empty_values:
+                # skip if the cell isn't empty
+                if k in host and host[k] and not host[k].lower() in self.empty_values:
+                    continue
+                host[k] = v
+
+
+    @staticmethod
+    def _fieldnames(files):
+        '''
+        combined headers of all files, without port columns
+        '''
+
+        fieldnames = ['IP Address', 'Hostname', 'Open Ports']
+        for file in files:
+            with open_file(file, newline='') as f:
+                for field in (csv.DictReader(f).fieldnames or []):
+                    if not field in fieldnames and not field.lower().endswith('/tcp'):
+                        fieldnames.append(field)
+
+        return fieldnames
+
+
+    def _new_files(self):
+        '''
+        compares CSV files against the manifest
+        returns (manifest, csv_files_to_merge)
+        if a CSV that was already merged has changed or disappeared, everything is merged again
+        '''
 
+        try:
+            with open(self.manifest_file) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return (dict(), self.csv_files)
+        except ValueError:
+            print('[!] Ignoring corrupt deliverable manifest at {}'.format(self.manifest_file))
+            return (dict(), self.csv_files)
+
+        if not self.state_file.is_file():
+            return (dict(), self.csv_files)
+
+        current_files = dict([(f.name, f) for f in self.csv_files])
+
+        for file, info in manifest.items():
+            if not file in current_files:
+                print('[!] {} has been removed since the last deliverable, merging everything again'.format(file))
+                return (dict(), self.csv_files)
+            if not self._unchanged(current_files[file], info):
+                print('[!] {} has changed since the last deliverable, merging everything again'.format(file))
+                return (dict(), self.csv_files)
+
+        return (manifest, [f for f in self.csv_files if not f.name in manifest])
+
+
+    def _unchanged(self, file, info):
+        '''
+        the file is only hashed if its size or mtime has changed
+        '''
+
+        stat = os.stat(file)
+        if stat.st_size != info['size']:
+            return False
+        if stat.st_mtime == info['mtime']:
+            return True
+        if self.hash_file(file) == info['hash']:
+            info['mtime'] = stat.st_mtime
+            return True
+        return False
+
+
+    def _file_info(self, file):
+
+        stat = os.stat(file)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': self.hash_file(file)}
+
+
+    def _save_state(self, tmp_file, manifest):
+        '''
+        moves the merged hosts into place and writes the manifest
+        the manifest is written last, so it never refers to a merge that wasn't saved
+        '''
+
+        tmp_file.replace(self.state_file)
+        # remove the old state if compression was changed
+        for old_file in variants(self.state_file):
+            if old_file != self.state_file and old_file.is_file():
+                old_file.unlink()
+
+        tmp_file = self.manifest_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(manifest, f)
+        tmp_file.replace(self.manifest_file)
+
+
+    @staticmethod
+    def hash_file(filename):
+
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024*1024), b''):
+                h.update(chunk)
+        return h.hexdigest()[:16]
+
+
+
+class WorkbookWriter:
+    '''
+    like csv.DictWriter, but writes an XLSX workbook with:
+        - a summary sheet (hosts per /16, open port counts, module findings)
+        - one sheet of hosts for each /16
+    rows must be written in order of IP, since sheets can't be revisited
+    the workbook is write-only, so rows are streamed to disk instead of kept in memory
+    '''
+
+    # columns with more distinct values than this (e.g. lists of shares) are
+    # only counted as having a value
+    max_distinct_values = 20
+
+    def __init__(self, filename, fieldnames, netmask=16):
+
+        if openpyxl is None:
+            raise ValueError('Please run "python3 -m pip install openpyxl" to create XLSX files')
+
+        self.filename   = str(filename)
+        self.fieldnames = list(fieldnames)
+        self.netmask    = netmask
+
+        self.workbook   = openpyxl.Workbook(write_only=True)
+        # summary is written last, but should be the first sheet
+        self.summary    = self.workbook.create_sheet('Summary')
+        self.sheet      = None
+        # current subnet, as an integer (IP >> host bits) and as ip_network()
+        self.subnet     = None
+        self.network    = None
+        self.host_bits  = 32 - netmask
+
+        self.host_count = 0
+        # { subnet: host_count }
+        self.subnets    = dict()
+        # { port: host_count }
+        self.ports      = dict()
+        # { column: { value: host_count } }
+        self.findings   = dict([(f, dict()) for f in self.fieldnames if not f in ['IP Address', 'Hostname', 'Open Ports']])
+        # columns with too many distinct values
+        self.various    = set()
+
+
+    def writerow(self, host):
+
+        subnet = int.from_bytes(socket.inet_aton(host['IP Address']), 'big') >> self.host_bits
+
+        if subnet != self.subnet:
+            self.subnet = subnet
+            self.network = ipaddress.ip_network((subnet << self.host_bits, self.netmask))
+            self.sheet = self.workbook.create_sheet(str(self.network).replace('/', '-'))
+            self.sheet.append(self.fieldnames)
+            self.subnets[self.network] = 0
+
+        # empty cells are left out of the file entirely
+        self.sheet.append([(host.get(f) or None) for f in self.fieldnames])
+
+        self.host_count += 1
+        self.subnets[self.network] += 1
+
+        for port in (host.get('Open Ports', '') or '').split(','):
+            try:
+                port = int(port)
+            except ValueError:
+                continue
+            try:
+                self.ports[port] += 1
             except KeyError:
-                sys.stderr.write('[!] Error combining {}\n'.format(file))
+                self.ports[port] = 1
+
+        for column, values in self.findings.items():
+            value = (host.get(column, '') or '').strip()
+            if not value or value.lower() in Deliverable.empty_values:
                 continue
-            
-        print('[+] Writing combined list to {}'.format(filename))
-        with open(filename, newline='', mode='w') as f:
-            c = csv.DictWriter(f, fieldnames=fieldnames)
-            c.writeheader()
-            hosts = list(hosts.items())
-            hosts.sort(key=lambda x: x[0])
-            for ip, host in hosts:
-                host['Open Ports'] = list(host['Open Ports'])
-                host['Open Ports'].sort()
-                host['Open Ports'] = ', '.join([str(p) for p in host['Open Ports']])
-                c.writerow(host)
\ No newline at end of file
+            if column in self.various:
+                value = '(various)'
+            elif len(values) >= self.max_distinct_values and not value in values:
+                self.various.add(column)
+                count = sum(values.values())
+                values.clear()
+                values['(various)'] = count
+                value = '(various)'
+            try:
+                values[value] += 1
+            except KeyError:
+                values[value] = 1
+
+
+    def close(self):
+
+        self.summary.append(['Hosts', self.host_count])
+
+        self.summary.append([])
+        self.summary.append(['Subnet', 'Hosts'])
+        for subnet, count in self.subnets.items():
+            self.summary.append([str(subnet), count])
+
+        self.summary.append([])
+        self.summary.append(['Open Port', 'Hosts'])
+        for port, count in sorted(self.ports.items(), key=lambda x: x[1], reverse=True):
+            self.summary.append(['{}/tcp'.format(port), count])
+
+        self.summary.append([])
+        self.summary.append(['Finding', 'Value', 'Hosts'])
+        for column, values in self.findings.items():
+            for value, count in sorted(values.items(), key=lambda x: x[1], reverse=True):
+                self.summary.append([column, value, count])
+
+        self.workbook.save(self.filename)
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import os
+import time
+import random
+import subprocess as sp
+from shutil import which
+
+
+class ExecutionError(Exception):
+    pass
+
+class LogonFailure(ExecutionError):
+    pass
+
+class ConnectionFailure(ExecutionError):
+    '''
+    the host couldn't be reached or didn't answer in time
+    '''
+    pass
+
+
+# errors which mean the host (or the network) is struggling, rather than a problem with that host
+connection_errors = ['timed out', 'Connection error', 'Connection refused', 'Connection reset', 'No route to host', 'Broken pipe']
+
+def connection_error(message):
+
+    return any([e.lower() in message.lower() for e in connection_errors])
+
+
+
+class ExecutionBackend:
+    '''
+    base class for executing commands on remote Windows hosts
+    backends must be safe to call from multiple threads at once
+    '''
+
+    name = 'base'
+
+    def __init__(self, config):
+
+        self.username = config['CREDENTIALS']['username']
+        self.password = config['CREDENTIALS']['password']
+        self.domain   = config['CREDENTIALS']['domain']
+        self.hashes   = config['CREDENTIALS']['hashes']
+        self.timeout  = int(config['EXECUTION']['TIMEOUT'])
+
+        # use kerberos ticket if there's no password or hash
+        self.kerberos = not self.username or not (self.password or self.hashes)
+        if self.kerberos and not 'KRB5CCNAME' in os.environ:
+            raise ValueError('Kerberos ticket not found, please export "KRB5CCNAME" variable')
+
+
+    def execute(self, target, command):
+        '''
+        runs a shell command on target
+        returns tuple (stdout, stderr)
+        raises LogonFailure or ExecutionError
+        '''
+
+        raise NotImplementedError
+
+
+    def close(self):
+        '''
+        called when we're finished with all targets
+        '''
+
+        pass
+
+
+    def missing_progs(self):
+        '''
+        returns list of anything that needs to be installed for this backend to work
+        '''
+
+        return []
+
+
+
+class SubprocessBackend(ExecutionBackend):
+    '''
+    runs one of the impacket example scripts (wmiexec.py, smbexec.py, etc.) per command
+    slow, but works wherever the scripts are in $PATH
+    '''
+
+    name = 'subprocess'
+
+    def __init__(self, config):
+
+        super().__init__(config)
+        self.method = config['EXECUTION']['METHOD']
+
+
+    def auth_args(self, target):
+
+        if self.kerberos:
+            return ['-k', '-no-pass', '{}/{}@{}'.format(self.domain, self.username, target)]
+        elif self.password:
+            return ['{}/{}:{}@{}'.format(self.domain, self.username, self.password, target)]
+        else:
+            return ['-hashes', self.hashes, '{}/{}@{}'.format(self.domain, self.username, target)]
+
+
+    def execute(self, target, command):
+
+        exec_base = [self.method] + self.auth_args(target)
+        exec_command = exec_base + [command]
+
+        print(' >> ' + ' '.join(exec_base) + " '{}'".format(command))
+        try:
+            env = dict(os.environ, PYTHONIOENCODING='UTF-8')
+            exec_process = sp.run(exec_command, stdout=sp.PIPE, stderr=sp.PIPE, timeout=self.timeout, env=env)
+        except sp.TimeoutExpired:
+            raise ConnectionFailure(f'{self.method} timed out:\n{" ".join(exec_command)}')
+
+        stdout = exec_process.stdout.decode()
+        stderr = exec_process.stderr.decode()
+        if 'STATUS_LOGON_FAILURE' in stdout:
+            raise LogonFailure(stdout + stderr)
+        # impacket reports errors as "[-] <error>"
+        if any([connection_error(line) for line in (stdout + stderr).splitlines() if line.startswith('[-]')]):
+            raise ConnectionFailure(stdout + stderr)
+
+        return (stdout, stderr)
+
+
+    def missing_progs(self):
+
+        if not which(self.method):
+            return [self.method]
+        return []
+
+
+
+class ImpacketBackend(ExecutionBackend):
+    '''
+    same technique as impacket's wmiexec.py, but in-process
+    saves starting a new python process for every host
+    (enum-services packs everything into one command, so each host gets one session)
+    '''
+
+    name = 'impacket'
+
+    # where command output is written on the target
+    share = 'ADMIN$'
+
+    def __init__(self, config):
+
+        super().__init__(config)
+
+        self.lmhash = ''
+        self.nthash = ''
+        if self.hashes:
+            self.lmhash, self.nthash = self.hashes.split(':')
+
+
+    def connect(self, target):
+        '''
+        returns authenticated (smb_connection, dcom_connection, win32_process)
+        '''
+
+        from impacket.smbconnection import SMBConnection
+        from impacket.dcerpc.v5.dcomrt import DCOMConnection
+        from impacket.dcerpc.v5.dcom import wmi
+        from impacket.dcerpc.v5.dtypes import NULL
+
+        smb_connection = None
+        dcom = None
+        try:
+            smb_connection = SMBConnection(target, target, timeout=self.timeout)
+            if self.kerberos:
+                smb_connection.kerberosLogin(self.username, self.password, self.domain, self.lmhash, self.nthash)
+            else:
+                smb_connection.login(self.username, self.password, self.domain, self.lmhash, self.nthash)
+
+            dcom = DCOMConnection(target, self.username, self.password, self.domain, self.lmhash, self.nthash, \
+                oxidResolver=True, doKerberos=self.kerberos)
+            interface = dcom.CoCreateInstanceEx(wmi.CLSID_WbemLevel1Login, wmi.IID_IWbemLevel1Login)
+            login = wmi.IWbemLevel1Login(interface)
+            services = login.NTLMLogin('//./root/cimv2', NULL, NULL)
+            login.RemRelease()
+            win32_process, _ = services.GetObject('Win32_Process')
+
+        except Exception as e:
+            # e.g. access denied for non-admin credentials, after DCOM has already connected
+            if dcom is not None:
+                try:
+                    dcom.disconnect()
+                except Exception:
+                    pass
+            if smb_connection is not None:
+                try:
+                    smb_connection.logoff()
+                except Exception:
+                    pass
+            if 'STATUS_LOGON_FAILURE' in str(e):
+                raise LogonFailure(str(e))
+            if isinstance(e, OSError) or connection_error(str(e)):
+                raise ConnectionFailure('Error connecting to {}: {}'.format(target, str(e)))
+            raise ExecutionError('Error connecting to {}: {}'.format(target, str(e)))
+
+        return (smb_connection, dcom, win32_process)
+
+
+    def execute(self, target, command):
+
+        smb_connection, dcom, win32_process = self.connect(target)
+        try:
+            return self._execute(target, command, smb_connection, win32_process)
+        finally:
+            try:
+                dcom.disconnect()
+            except Exception:
+                pass
+            try:
+                smb_connection.logoff()
+            except Exception:
+                pass
+
+
+    def _execute(self, target, command, smb_connection, win32_process):
+
+        from impacket.smbconnection import SessionError
+
+        output_file = '__{:.5f}'.format(time.time())
+        win32_process.Create('cmd.exe /Q /c {} 1> \\\\127.0.0.1\\{}\\{} 2>&1'.format(command, self.share, output_file), 'C:\\', None)
+
+        output = []
+        started = time.time()
+        while True:
+            try:
+                smb_connection.getFile(self.share, output_file, output.append)
+                break
+            except SessionError as e:
+                # command is still running
+                if any([s in str(e) for s in ['STATUS_SHARING_VIOLATION', 'STATUS_OBJECT_NAME_NOT_FOUND']]):
+                    if time.time() - started > self.timeout:
+                        raise ConnectionFailure('{} timed out on {}'.format(self.name, target))
+                    time.sleep(.5)
+                else:
+                    raise ExecutionError(str(e))
+
+        try:
+            smb_connection.deleteFile(self.share, output_file)
+        except SessionError:
+            pass
+
+        return (b''.join(output).decode('utf-8', errors='replace'), '')
+
+
+    def missing_progs(self):
+
+        try:
+            import impacket
+            return []
+        except ImportError:
+            return ['impacket (python3 -m pip install impacket)']
+
+
+
+class FakeBackend(ExecutionBackend):
+    '''
+    doesn't touch the network
+    answers the commands sent by enum-services with plausible output after a configurable delay
+    useful for benchmarking the pipeline offline
+    '''
+
+    name = 'fake'
+
+    operating_systems = [
+        'Windows 10 Enterprise',
+        'Windows Server 2016 Standard',
+        'Windows Server 2019 Datacenter',
+        'Windows 7 Professional',
+    ]
+
+    def __init__(self, config, latency=None, failure_rate=None):
+
+        self.timeout = int(config['EXECUTION']['TIMEOUT'])
+        self.latency = float(config['EXECUTION'].get('FakeLatency', '.5')) if latency is None else latency
+        self.failure_rate = float(config['EXECUTION'].get('FakeFailureRate', '0')) if failure_rate is None else failure_rate
+
+
+    def execute(self, target, command):
+
+        # make results repeatable for each target
+        r = random.Random(str(target))
+        time.sleep(r.uniform(.5, 1.5) * self.latency)
+
+        if r.random() < self.failure_rate:
+            raise ConnectionFailure('Simulated failure on {}'.format(target))
+
+        stdout = []
+        for cmd in command.strip('() ').split(' & '):
+            cmd = cmd.strip()
+            if cmd.lower().startswith('echo '):
+                stdout.append(cmd[5:])
+            else:
+                stdout += self.fake_output(cmd, r)
+
+        return ('\r\n'.join(stdout) + '\r\n', '')
+
+
+    def fake_output(self, cmd, r):
+
+        cmd_lower = cmd.lower()
+        if 'productname' in cmd_lower:
+            return [
+                'HKEY_LOCAL_MACHINE\\software\\microsoft\\windows nt\\currentversion',
+                '    productname    REG_SZ    {}'.format(r.choice(self.operating_systems)),
+            ]
+        elif cmd_lower.startswith('sc query'):
+            # pretend each keyword in the findstr is a service name
+            lines = []
+            keywords = cmd.split('"')[1].split() if '"' in cmd else []
+            for keyword in keywords:
+                if r.random() < .5:
+                    lines.append('SERVICE_NAME: {}'.format(keyword))
+                    lines.append('DISPLAY_NAME: {}'.format(keyword))
+            return lines
+        elif 'qfe' in cmd_lower:
+            return ['KB{}'.format(r.randint(4000000, 5999999)) for i in range(r.randint(0, 40))]
+        elif cmd_lower.startswith('query user'):
+            return [
+                ' USERNAME              SESSIONNAME        ID  STATE   IDLE TIME  LOGON TIME',
+                '>{:<22}console             1  Active      none   1/1/2020 9:00 AM'.format(r.choice(['administrator', 'jsmith', 'svc_backup'])),
+            ]
+        elif 'localgroup' in cmd_lower:
+            return ['Alias name     administrators', '', 'Members', '', '-' * 79, 'Administrator', 'CORP\\Domain Admins', \
+                'The command completed successfully.']
+        elif cmd_lower.startswith('manage-bde'):
+            return ['    Protection Status:    Protection {}'.format(r.choice(['On', 'Off']))]
+
+        return []
+
+
+
+backends = {
+    'subprocess':   SubprocessBackend,
+    'impacket':     ImpacketBackend,
+    'fake':         FakeBackend,
+}
+
+
+def get_backend(config):
+    '''
+    picks an execution backend based on the "Backend" option in services.config
+    "auto" uses impacket in-process if it's installed, otherwise falls back to subprocess
+    '''
+
+    backend_name = config['EXECUTION'].get('Backend', 'auto').strip().lower()
+
+    if backend_name == 'auto':
+        try:
+            import impacket
+            backend_name = 'impacket'
+        except ImportError:
+            backend_name = 'subprocess'
+
+    try:
+        return backends[backend_name](config)
+    except KeyError:
+        raise ValueError('Invalid execution backend "{}", please pick from: auto, {}'.format(backend_name, ', '.join(backends)))
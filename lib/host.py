@@ -52,8 +52,6 @@ class Host(dict):
         if resolve:
             self.resolve()
 
-        self.raw_wmiexec_output = ''
-
 
     def resolve(self):
 
@@ -6,8 +6,10 @@ import io
 import os
 import csv
 import sys
+import bisect
 import tempfile
 import ipaddress
+import threading
 from time import sleep
 import subprocess as sp
 from shutil import which
@@ -15,11 +17,17 @@ from pathlib import Path
 from datetime import datetime
 
 from .host import *
+from . import compression as compress
+from . import columnar
+from .result_store import ResultStore
+from .subnets import SubnetTree
+from .scheduler import ModuleScheduler
+from .streaming import StreamDispatcher
 
 
 class Inventory:
 
-    def __init__(self, targets, bandwidth, work_dir, resolve=True, force_resolve=False, skip_ping=False, force_ping=False, force_syn=False, blacklist=None, whitelist=None, interface=None, gateway_mac=None):
+    def __init__(self, targets, bandwidth, work_dir, resolve=True, force_resolve=False, skip_ping=False, force_ping=False, force_syn=False, blacklist=None, whitelist=None, interface=None, gateway_mac=None, max_parallel_modules=4, max_connections=1000, offline=False, compression=None):
 
         # target-specific open port counters
         # nested dictionary in format:
@@ -31,18 +39,58 @@ class Inventory:
             except ValueError:
                 raise ValueError('Invalid target: {}'.format(str(target)))
 
-        # global open port counters
+        # inverted index of open ports (see add_open_port())
         # dictionary in format:
-        # { port: open_count ... }
-        self.open_ports                 = dict()
+        # { port: set(ip_address() ...) ... }
+        self.port_index                 = dict()
+        # sorted, valid hosts for each port, rebuilt when the index changes
+        # { port: [ Host() ... ] ... }
+        self._port_index_sorted         = dict()
+        # memoized results of _valid_host()
+        # { ip_address(): True|False ... }
+        self._valid_hosts               = dict()
+
+        # buffer size for CSV output
+        self.write_buffer               = 1024 * 1024
+        # compression for files written by the tool ("gzip", "zstd", or None)
+        # files are always read based on their extension, so compressed and uncompressed caches can be mixed
+        compress.check(compression)
+        self.compression                = compression
 
         # stores all known hosts
         # dictionary in format:
         # { ip_address(): Host() ... }
         self.hosts                      = dict()
+        # modules run in parallel, so all changes to hosts go through update_host()
+        self.hosts_lock                 = threading.RLock()
+
+        # running totals, kept up to date as hosts and results are added
+        # so reports don't have to go through every host
+        # host counts for each subnet size that's been asked for (see subnet_counts())
+        # { netmask: { subnet_as_int: host_count ... } ... }
+        self._subnet_counts             = dict()
+        # hosts with findings (see BaseModule.finding())
+        # { column: set(ip_address() ...) ... }
+        self.findings                   = dict()
+        # active modules which own each column, rebuilt when active modules change
+        # { column: [ module ... ] ... }
+        self._finding_modules           = dict()
 
         self.modules                    = []
         self.active_modules             = []
+        # columns found in cached CSVs that don't belong to any module
+        # (dictionary used as an ordered set)
+        self.extra_columns              = dict()
+        # runs modules in the background (see start_modules())
+        self.scheduler                  = None
+        # pushes hosts to streaming modules as ports are found open
+        self.dispatcher                 = None
+
+        # how many modules can run at once, and how many connections they can open between them
+        self.max_parallel_modules       = max_parallel_modules
+        self.max_connections            = max_connections
+        # { module_name: seconds }
+        self.module_timing              = dict()
 
         # whether or not to perform reverse DNS lookups
         self.resolve                    = resolve
@@ -64,17 +112,20 @@ class Inventory:
         self.eternal_blue_count         = 0
         self.host_discovery_finished    = False
 
-        self.zmap_ping_file             = str(work_dir / 'zmap/zmap_ping_{date:%Y-%m-%d_%H-%M-%S}.txt'.format(date=datetime.now()))
-        self.online_hosts_file          = str(work_dir / 'zmap/zmap_all_online_hosts.txt')
+        self.zmap_ping_file             = compress.compressed_name(str(work_dir / 'zmap/zmap_ping_{date:%Y-%m-%d_%H-%M-%S}.txt'.format(date=datetime.now())), compression)
+        self.online_hosts_file          = compress.compressed_name(str(work_dir / 'zmap/zmap_all_online_hosts.txt'), compression)
 
         self.skip_ping                  = skip_ping
         self.force_ping                 = force_ping
         self.force_syn                  = force_syn
 
+        # offline mode only works with cached data (no scanning, no root, no zmap)
+        self.offline                    = offline
+
         self.update_config(bandwidth, work_dir, blacklist, whitelist)
 
         # make sure zmap is installed
-        if not which('zmap'):
+        if not self.offline and not which('zmap'):
             sys.stderr.write('\n[!] Please install zmap! :)\n\n')
             sys.exit(1)
 
@@ -119,28 +170,108 @@ class Inventory:
 
 
 
+    @property
+    def open_ports(self):
+        '''
+        global open port counters
+        dictionary in format:
+        { port: open_count ... }
+        '''
+
+        with self.hosts_lock:
+            return dict([(port, len(ips)) for port, ips in self.port_index.items()])
+
+
+    def add_open_port(self, ip, port):
+        '''
+        records an open port on a host (which must already exist)
+        returns True if it wasn't already known
+        '''
+
+        with self.hosts_lock:
+            host = self.hosts[ip]
+            if port in host.open_ports:
+                return False
+
+            host.open_ports.add(port)
+            try:
+                self.port_index[port].add(ip)
+            except KeyError:
+                self.port_index[port] = set([ip])
+            self._port_index_sorted.pop(port, None)
+            return True
+
+
+    def hosts_with_port(self, port):
+        '''
+        returns valid hosts with port open, sorted by IP
+        '''
+
+        with self.hosts_lock:
+            try:
+                return self._port_index_sorted[port]
+            except KeyError:
+                pass
+
+            hosts = [self.hosts[ip] for ip in sorted(self.port_index.get(port, [])) if self._valid_host(ip)]
+            self._port_index_sorted[port] = hosts
+            return hosts
+
+
     def hosts_sorted(self, hosts=None):
+        '''
+        generates hosts in IP order
+        if a list of IPs is given, only those are returned
+        (IPs which aren't in the inventory get an empty Host)
+        '''
+
+        for ip, host in self._sorted_items(hosts):
+            yield host
 
-        hosts_sorted = []
+
+    def _sorted_items(self, hosts=None):
+        '''
+        same as hosts_sorted(), but generates (ip_address(), Host()) tuples
+        '''
 
         if hosts is None:
-            hosts_sorted = list(self.hosts.values())
+            for ip in sorted(self.hosts, key=int):
+                yield (ip, self.hosts[ip])
+
         else:
-            for ip in hosts:
-                hostname = ''
+            for ip in sorted([ipaddress.ip_address(ip) for ip in hosts], key=int):
                 try:
-                    # try to get hostname
-                    hostname = self.hosts[ipaddress.ip_address(ip)]['Hostname']
+                    yield (ip, self.hosts[ip])
                 except KeyError:
-                    pass
-                finally:
-                    hosts_sorted.append(Host(ip, hostname))
+                    yield (ip, Host(ip))
+
+
+    def add_module(self, module, active=False):
+        '''
+        inactive modules can be ModuleSpecs, which only carry their columns over
+        '''
 
-        hosts_sorted.sort(key=lambda x: ipaddress.ip_address(x['IP Address']))
-        return hosts_sorted
+        self.modules.append(module)
+        if active:
+            self.active_modules.append(module)
+            self._index_finding_modules()
 
 
     def run_modules(self):
+        '''
+        runs all active modules and waits for them to finish
+        '''
+
+        self.start_modules(scanned_ports=None)
+        self.finish_modules()
+
+
+    def start_modules(self, scanned_ports=None):
+        '''
+        starts running active modules in the background
+        if scanned_ports is a list, modules wait until their required ports are marked
+        with port_scanned(), so they can run while other ports are still being scanned
+        '''
 
         # make sure the right programs are installed
         for module in list(self.active_modules):
@@ -150,10 +281,186 @@ class Inventory:
                 sys.stderr.write('\n[!] Error running module "{}"\n'.format(module.name))
                 sys.stderr.write('[!] Please ensure the following are installed and in your $PATH:\n')
                 sys.stderr.write('\n'.join([('     - ' + str(e)) for e in progs_to_install]) + '\n\n')
+        self._index_finding_modules()
+
+        self.scheduler = None
+        if not self.active_modules:
+            return
+
+        self._check_root()
+
+        self.scheduler = ModuleScheduler(self, self.active_modules, max_parallel=self.max_parallel_modules, \
+            max_connections=self.max_connections, scanned_ports=scanned_ports)
+
+        # streaming modules start probing hosts right away, before their batch run()
+        if scanned_ports is not None and any([m.streaming for m in self.active_modules]):
+            self.dispatcher = StreamDispatcher(self, self.active_modules)
+            self.dispatcher.submit_known()
+            self.scheduler.dispatcher = self.dispatcher
+
+        self.scheduler.start()
+
+
+    def port_scanned(self, port):
+        '''
+        lets modules waiting on this port start
+        '''
+
+        if self.scheduler is not None:
+            self.scheduler.port_scanned(port)
+
+
+    def finish_modules(self):
+        '''
+        waits for all modules to finish
+        '''
+
+        if self.scheduler is None:
+            return
+
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+            for module_name, probed in self.dispatcher.probed.items():
+                print('\n[+] Streamed {:,} host(s) to module "{}" ({:,} errors)'.format(\
+                    probed, module_name, self.dispatcher.errors[module_name]))
+            self.dispatcher = None
+        self.scheduler.join()
+
+        self._modules_finished()
+
+
+    def cancel_modules(self):
+        '''
+        stops modules early (e.g. on ctrl+c), keeping whatever results they've recorded so far
+        '''
+
+        if self.scheduler is None:
+            return
+
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+            self.dispatcher = None
+        self.scheduler.cancel()
+
+        self._modules_finished()
 
+
+    def _modules_finished(self):
+
+        self.module_timing.update(self.scheduler.timing)
+        self.results.save()
+        self.scheduler = None
+
+
+    def update_host(self, ip, values):
+        '''
+        thread-safe way for modules to record results
+        takes IP address and dictionary of CSV columns
+        '''
+
+        with self.hosts_lock:
+            if type(ip) == str:
+                ip = ipaddress.ip_address(ip)
+            try:
+                host = self.hosts[ip]
+            except KeyError:
+                host = Host(ip)
+                host.update(values)
+                self._add_host(ip, host)
+                return
+
+            for column, value in values.items():
+                old_value = host.get(column, None)
+                host[column] = value
+                if value != old_value:
+                    self._track_finding(ip, column, value)
+
+
+    def _add_host(self, ip, host):
+        '''
+        adds a new host and updates the running totals
+        if the host is already known, the existing one is kept and returned
+        '''
+
+        with self.hosts_lock:
+            try:
+                return self.hosts[ip]
+            except KeyError:
+                self.hosts[ip] = host
+
+            ip_int = int(ip)
+            for netmask, counts in self._subnet_counts.items():
+                subnet = ip_int >> (32 - netmask)
+                try:
+                    counts[subnet] += 1
+                except KeyError:
+                    counts[subnet] = 1
+
+            for column, value in host.items():
+                self._track_finding(ip, column, value)
+
+            return host
+
+
+    def _track_finding(self, ip, column, value):
+        '''
+        keeps self.findings up to date when a host's column changes
+        '''
+
+        try:
+            modules = self._finding_modules[column]
+        except KeyError:
+            return
+
+        if any([m.finding(column, value) for m in modules]):
+            self.findings.setdefault(column, set()).add(ip)
+        else:
+            self.findings.get(column, set()).discard(ip)
+
+
+    def _index_finding_modules(self):
+
+        self._finding_modules = dict()
         for module in self.active_modules:
-            self._check_root()
-            module.run(self)
+            for header in module.csv_headers:
+                self._finding_modules.setdefault(header, []).append(module)
+
+
+    def hosts_with_finding(self, column):
+        '''
+        returns valid hosts with a finding in column (see BaseModule.finding()), sorted by IP
+        '''
+
+        with self.hosts_lock:
+            ips = sorted(self.findings.get(column, []), key=int)
+            return [self.hosts[ip] for ip in ips if self._valid_host(ip)]
+
+
+    def subnet_counts(self, netmask=24):
+        '''
+        returns number of hosts in each subnet of size netmask
+        counted the first time it's asked for, and kept up to date after that
+        dictionary in format:
+        { ip_network(): host_count ... }
+        '''
+
+        netmask = int(netmask)
+        host_bits = 32 - netmask
+
+        with self.hosts_lock:
+            try:
+                counts = self._subnet_counts[netmask]
+            except KeyError:
+                counts = dict()
+                for ip in self.hosts:
+                    subnet = int(ip) >> host_bits
+                    try:
+                        counts[subnet] += 1
+                    except KeyError:
+                        counts[subnet] = 1
+                self._subnet_counts[netmask] = counts
+
+            return dict([(ipaddress.ip_network((subnet << host_bits, netmask)), count) for subnet, count in counts.items()])
 
 
     def module_reports(self):
@@ -168,27 +475,55 @@ class Inventory:
 
         patator_input_file, new_ports_found = self.scan_online_hosts(port=22)
 
-        patator_targets = [h.ip for h in self.hosts.values() if 22 in h.open_ports]
+        patator_targets = [h.ip for h in self.hosts_with_port(22)]
 
         patator = Patator(patator_targets, work_dir=self.work_dir / 'patator')
         patator.scan()
 
 
 
-    def report(self, netmask=24):
+    def subnet_tree(self, netmasks=(8, 16, 24)):
+        '''
+        returns SubnetTree() of all hosts, for summarizing at several netmasks at once
+        '''
+
+        with self.hosts_lock:
+            ips = [int(ip) for ip in self.hosts]
+
+        return SubnetTree(ips, netmasks)
+
+
+    def report(self, netmask=24, summary_netmasks=None, top=5):
 
         print('\n\n[+] RESULTS:')
         print('=' * 60 + '\n')
         print('[+] Total Online Hosts: {:,}'.format(len(self.hosts)))
         print('[+] Summary of Subnets:')
-        summarized_hosts = list(self.summarize_online_hosts(netmask=netmask).items())
-        # sort by network first
-        summarized_hosts.sort(key=lambda x: x[0])
-        # then sort by host count
-        summarized_hosts.sort(key=lambda x: x[1], reverse=True)
+        summarized_hosts = list(self.subnet_counts(netmask=netmask).items())
+        # sort by host count, then by network
+        summarized_hosts.sort(key=lambda x: (-x[1], x[0]))
         for subnet in summarized_hosts:
             print('\t{:<19}{:<10}'.format(str(subnet[0]), ' ({:,} | {:.1f}%)'.format(subnet[1], subnet[1]/len(self.hosts)*100)))
 
+        if summary_netmasks and self.hosts:
+            tree = self.subnet_tree(summary_netmasks)
+            netmasks = sorted(tree.netmasks)
+
+            print('')
+            print('[+] Subnet Density:')
+            for n in netmasks:
+                subnets = tree.counts(n)
+                print('\t/{:<4}{:,} subnet(s), {:.1f} hosts each on average'.format(n, len(subnets), len(self.hosts) / len(subnets)))
+
+            # busiest subnets inside each of the next size up (e.g. /24s in each /16)
+            for parent, child in zip(netmasks, netmasks[1:]):
+                print('')
+                print('[+] Busiest /{} subnets in each /{}:'.format(child, parent))
+                for parent_network, parent_count, children in tree.busiest(parent, child, top):
+                    print('\t{:<19}{:<10}'.format(str(parent_network), ' ({:,})'.format(parent_count)))
+                    for child_network, child_count in children:
+                        print('\t    {:<19}{:<10}'.format(str(child_network), ' ({:,} | {:.1f}%)'.format(child_count, child_count/parent_count*100)))
+
         print('')
         open_port_counts = list(self.open_ports.items())
         open_port_counts.sort(key=lambda x: x[1], reverse=True)
@@ -196,6 +531,12 @@ class Inventory:
             print('[+] {:,} host(s) with port {} open ({:.1f}%)'.format(\
                     open_port_count, port, (open_port_count / len(self.hosts) * 100)))
 
+        if self.module_timing:
+            print('')
+            print('[+] Module run times:')
+            for module_name, seconds in sorted(self.module_timing.items(), key=lambda x: x[1], reverse=True):
+                print('\t{:<20}{:.1f}s'.format(module_name, seconds))
+
         print('')
 
 
@@ -206,7 +547,7 @@ class Inventory:
             pass
 
         port = int(port)
-        zmap_out_file = self.work_dir / 'zmap/zmap_port_{}_{date:%Y-%m-%d_%H-%M-%S}.txt'.format(port, date=datetime.now())
+        zmap_out_file = compress.compressed_name(self.work_dir / 'zmap/zmap_port_{}_{date:%Y-%m-%d_%H-%M-%S}.txt'.format(port, date=datetime.now()), self.compression)
         zmap_whitelist_file = self.work_dir / 'zmap/zmap_tmp_whitelist_port_{}.txt'.format(port)
         targets = [t[0] for t in self.targets.items() if port not in t[1]]
 
@@ -280,7 +621,7 @@ class Inventory:
                 open_port_count = 0
 
                 new_ports_found = False
-                with open(zmap_out_file, 'w') as f:
+                with compress.open_file(zmap_out_file, 'w') as f:
                     for line in io.TextIOWrapper(self.secondary_zmap_process.stdout, encoding='utf-8'):
 
                         try:
@@ -289,8 +630,8 @@ class Inventory:
                             continue
 
                         # make sure the host exists
-                        if not ip in self.hosts:
-                            self.hosts[ip] = Host(ip)
+                        # (modules may be running in other threads)
+                        self._add_host(ip, Host(ip))
 
                         print('[+] {:<23}{:<10}'.format('{}:{}'.format(str(ip), port), self.hosts[ip]['Hostname']))
 
@@ -298,20 +639,17 @@ class Inventory:
                         # for scanning eternal blue, etc.
                         f.write(str(ip) + '\n')
 
-                        if port not in self.hosts[ip].open_ports:
-                            self.hosts[ip].open_ports.add(port)
+                        if self.add_open_port(ip, port):
                             open_port_count += 1
                             new_ports_found = True
 
+                        # hand the host straight to any streaming modules
+                        if self.dispatcher is not None:
+                            self.dispatcher.submit(self.hosts[ip], port)
+
                 if not new_ports_found:
                     print('[!] No new hosts found with port {} open'.format(port))
 
-                if open_port_count > 0:
-                    try:
-                        self.open_ports[port] += open_port_count
-                    except KeyError:
-                        self.open_ports[port] = open_port_count
-
             except sp.CalledProcessError as e:
                 sys.stderr.write('[!] Error launching zmap: {}\n'.format(str(e)))
                 sys.exit(1)
@@ -334,6 +672,13 @@ class Inventory:
         self.secondary_zmap_started = False
         self.work_dir               = Path(work_dir)
 
+        # blacklist/whitelist may change
+        self._valid_hosts           = dict()
+        self._port_index_sorted     = dict()
+
+        # module results from previous runs
+        self.results                = ResultStore(self.work_dir / 'module_results.json')
+
         # validate bandwidth arg
         if not any([self.bandwidth.endswith(s) for s in ['K', 'M', 'G']]):
             raise ValueError('Invalid bandwidth: {}'.format(self.bandwidth))
@@ -346,7 +691,8 @@ class Inventory:
         # validate blacklist arg
         if blacklist is None:
             blacklist = work_dir / 'zmap/zmap_tmp_blacklist'
-            blacklist.touch(mode=0o644, exist_ok=True)
+            if not self.offline:
+                blacklist.touch(mode=0o644, exist_ok=True)
             self.blacklist_arg = str(blacklist)
         else:
             self.blacklist_arg = Path(blacklist).resolve()
@@ -470,7 +816,7 @@ class Inventory:
     def summarize_online_hosts(self, hosts=None, netmask=24):
 
         if hosts is None:
-            hosts = self.hosts
+            return self.subnet_counts(netmask=netmask)
 
         subnets = dict()
 
@@ -489,60 +835,74 @@ class Inventory:
 
     def write_csv(self, csv_file=None, hosts=None):
 
-        try:
-
-            csv_writer, f = self._make_csv_writer(csv_file)
-
+        if self.zmap_ping_targets and not self.offline:
             # make sure initial discovery scan has completed
             for host in self:
                 pass
 
-            with open(self.online_hosts_file, 'w') as f:
-                for host in self.hosts_sorted(hosts):
+        csv_writer, f = self._make_csv_writer(csv_file)
 
-                    self._write_csv_line(csv_writer, host)
-                    f.write(host['IP Address'] + '\n')
+        try:
+            if self.offline:
+                # no scan state to update
+                csv_writer.writerows(self._csv_rows(self._sorted_items(hosts)))
+
+            else:
+                with compress.open_file(self.online_hosts_file, 'w', buffering=self.write_buffer) as online_hosts:
+                    for row in self._csv_rows(self._sorted_items(hosts)):
+                        csv_writer.writerow(row)
+                        online_hosts.write(row['IP Address'] + '\n')
 
         finally:
-            try:
-                f.close()
-            except:
-                pass
+            f.close()
 
 
 
-    def dump_scan_cache(self):
+    def write_parquet(self, parquet_file, hosts=None):
+        '''
+        writes the same columns as write_csv() to a Parquet file
+        IPs are stored as uint32, and port states and module results are dictionary-encoded
+        '''
 
+        if self.zmap_ping_targets and not self.offline:
+            # make sure initial discovery scan has completed
+            for host in self:
+                pass
+
+        writer = columnar.ParquetWriter(parquet_file, self._csv_fieldnames())
         try:
-            # dictionary in the form { ip_network: (csv_writer, csv_file_handle) }
-            targets = dict()
+            writer.writerows(self._csv_rows(self._sorted_items(hosts)))
+        finally:
+            writer.close()
 
-            for target in self.targets:
-                target_id = str(target).replace('/', '-')
-                target_dir = self.work_dir / target_id
-                target_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
-                target_file = target_dir / 'state.csv'
-                targets[target] = (None, target_file)
 
 
-            for target in targets:
+    def dump_scan_cache(self):
+
+        # sorted once, and sliced for each target
+        ips = sorted(self.hosts, key=int)
+        ip_ints = [int(ip) for ip in ips]
 
-                if targets[target][0] is None:
-                    target_file = targets[target][1]
-                    targets[target] = self._make_csv_writer(csv_file=target_file)
+        for target in self.targets:
+            target_id = str(target).replace('/', '-')
+            target_dir = self.work_dir / target_id
+            target_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
+            target_file = compress.compressed_name(target_dir / 'state.csv', self.compression)
 
-                for ip, host in self.hosts.items():
-                    if ip in target:
-                        csv_writer = targets[target][0]
-                        self._write_csv_line(csv_writer, host, ports=self.targets[target])
+            start = bisect.bisect_left(ip_ints, int(target.network_address))
+            end = bisect.bisect_right(ip_ints, int(target.broadcast_address))
+            hosts = ((ip, self.hosts[ip]) for ip in ips[start:end])
 
-        finally:
+            csv_writer, f = self._make_csv_writer(csv_file=target_file)
             try:
-                # close file handles
-                for target in targets:
-                    targets[target][1].close()
-            except:
-                pass
+                csv_writer.writerows(self._csv_rows(hosts, ports=self.targets[target]))
+            finally:
+                f.close()
+
+            # remove the old cache if compression was changed, so it isn't loaded again
+            for old_file in compress.variants(target_file):
+                if old_file != target_file and old_file.is_file():
+                    old_file.unlink()
 
 
 
@@ -572,21 +932,25 @@ class Inventory:
 
                     try:
                         for cache_file in next(os.walk(target_dir))[2]:
-                            if cache_file.endswith('.csv'):
+                            if compress.strip_extension(cache_file).endswith('.csv'):
                                 #print('[+] Reading {}'.format(str(cache_file)))
                                 empty_file, open_ports = self.read_csv(target_dir / cache_file)
+                            elif cache_file.endswith('.parquet') and columnar.pa is not None:
+                                empty_file, open_ports = self.read_parquet(target_dir / cache_file)
+                            else:
+                                continue
 
-                                try:
-                                    self.targets[target_net].update(open_ports)
-                                except KeyError:
-                                    self.targets[target_net] = open_ports
+                            try:
+                                self.targets[target_net].update(open_ports)
+                            except KeyError:
+                                self.targets[target_net] = open_ports
 
-                                if not empty_file:
-                                    print('[+]  - contains cached data'.format(str(target_net)))
-                                    cached_targets.append(target_net)
-                                else:
-                                    print('[+]  - empty (use --force-ping to scan again)')
-                                    cached_targets.append(target_net)
+                            if not empty_file:
+                                print('[+]  - contains cached data'.format(str(target_net)))
+                                cached_targets.append(target_net)
+                            else:
+                                print('[+]  - empty (use --force-ping to scan again)')
+                                cached_targets.append(target_net)
 
                     except StopIteration:
                         continue
@@ -596,6 +960,9 @@ class Inventory:
 
         print('[+] Loaded {:,} hosts from cache'.format(len(self.hosts)))
 
+        if self.offline:
+            return
+
         for target in self.targets:
             if not target in cached_targets or self.force_ping:
                 self.zmap_ping_targets.add(target)
@@ -610,57 +977,81 @@ class Inventory:
         returns number of hosts therein
         '''
 
-        new_hosts = 0
-        empty_file = True
-        open_ports = dict()
+        with compress.open_file(str(csv_file), newline='') as f:
+            return self._read_lines(csv.DictReader(f))
+
 
-        with open(str(csv_file), newline='') as f:
-            c = csv.DictReader(f)
 
-            for line in c:
+    def read_parquet(self, parquet_file):
+        '''
+        takes name of Parquet file (see write_parquet())
+        ingests contents the same way as read_csv()
+        '''
 
-                line = dict(line)
+        return self._read_lines(columnar.read_rows(parquet_file))
 
-                try:
-                    ip = ipaddress.ip_address(line['IP Address'])
-                    empty_file = False
-                except ValueError:
-                    #print('[!] Invalid IP address: {}'.format(str(line['IP Address'])))
-                    continue
 
-                host = Host(ip=line['IP Address'], hostname=line['Hostname'], resolve=self.force_resolve)
-                for module in self.modules:
-                    module.read_host(line, host)
 
-                # if we've already seen this host, merge it
-                if ip not in self.hosts:
-                    self.hosts[ip] = host
-                    new_hosts += 1
-                else:
-                    self.hosts[ip].merge(host)
+    def _read_lines(self, lines):
+        '''
+        takes iterable of CSV lines (dictionaries)
+        returns (empty_file, { port: open_count ... })
+        '''
 
-                for key, value in line.items():
-                    value = value.strip()
-                    if key.endswith('/tcp'):
-                        port = int(key.split('/')[0])
-                        if value.lower() == 'open':
-                            if not port in self.open_ports:
-                                self.open_ports[port] = 0
+        new_hosts = 0
+        empty_file = True
+        open_ports = dict()
 
-                            if port not in self.hosts[ip].open_ports:
-                                self.hosts[ip].open_ports.add(port)
-                                self.open_ports[port] += 1
+        for line in lines:
 
-                            try:
-                                open_ports[port] += 1
-                            except KeyError:
-                                open_ports[port] = 1
+            line = dict(line)
+
+            try:
+                ip = ipaddress.ip_address(line['IP Address'])
+                empty_file = False
+            except ValueError:
+                #print('[!] Invalid IP address: {}'.format(str(line['IP Address'])))
+                continue
 
-                    # all other values are loaded here, to preserve module output between executions
-                    # even if the module is not loaded
-                    # currently, a module's read_host() method is not needed
-                    #elif value:
-                    #    host.update({key: value})
+            host = Host(ip=line['IP Address'], hostname=line['Hostname'], resolve=self.force_resolve)
+
+            # all other values are loaded here, to preserve module output between executions
+            # even if the module is not loaded
+            for key, value in line.items():
+                if key is None or key in ['IP Address', 'Hostname'] or key.endswith('/tcp'):
+                    continue
+                self.extra_columns[key] = None
+                value = (value or '').strip()
+                if value:
+                    host.update({key: value})
+
+            for module in self.modules:
+                module.read_host(line, host)
+
+            # if we've already seen this host, merge it
+            if ip not in self.hosts:
+                self._add_host(ip, host)
+                new_hosts += 1
+            else:
+                with self.hosts_lock:
+                    existing = self.hosts[ip]
+                    old_values = dict(existing)
+                    existing.merge(host)
+                    for column, value in existing.items():
+                        if old_values.get(column, None) != value:
+                            self._track_finding(ip, column, value)
+
+            for key, value in line.items():
+                if key is not None and key.endswith('/tcp'):
+                    value = (value or '').strip()
+                    port = int(key.split('/')[0])
+                    if value.lower() == 'open':
+                        self.add_open_port(ip, port)
+
+                        try:
+                            open_ports[port] += 1
+                        except KeyError:
+                            open_ports[port] = 1
 
 
         return (empty_file, open_ports)
@@ -676,79 +1067,74 @@ class Inventory:
 
         # default CSV output
         if csv_file is None:
-            csv_file = self.work_dir / 'asset_inventory.csv'
+            csv_file = compress.compressed_name(self.work_dir / 'asset_inventory.csv', self.compression)
 
-        f = open(csv_file, 'w', newline='')
+        f = compress.open_file(csv_file, 'w', newline='', buffering=self.write_buffer)
 
-        # build CSV headers
-        fieldnames = ['IP Address', 'Hostname']
-        for m in self.modules:
-            fieldnames += m.csv_headers
-        fieldnames += ['{}/tcp'.format(port) for port in self.open_ports]
-
-        csv_writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        csv_writer = csv.DictWriter(f, fieldnames=self._csv_fieldnames(), extrasaction='ignore')
         csv_writer.writeheader()
 
         return (csv_writer, f)
 
 
 
-    def _write_csv_line(self, csv_writer, host, ports=None):
+    def _csv_fieldnames(self):
+        '''
+        returns CSV headers, in order
+        '''
 
-        if ports is None:
-            ports = self.open_ports
+        fieldnames = ['IP Address', 'Hostname']
+        for m in self.modules:
+            fieldnames += [h for h in m.csv_headers if not h in fieldnames]
+        fieldnames += [c for c in self.extra_columns if not c in fieldnames]
+        fieldnames += ['{}/tcp'.format(port) for port in self.port_index]
 
-        if not type(host) == Host:
-            try:
-                host = self.hosts[ipaddress.ip_address(host)]
-            except ValueError:
-                return
+        return fieldnames
 
-        # see which target range the host is from
-        # so we know whether the port is closed or unscanned
-        ip = ipaddress.ip_address(host['IP Address'])
-        in_target = None
-        for target in self.targets:
-            try:
-                if ip in target:
-                    #print(str(ip), ' is in ', str(target))
-                    in_target = target
-                    break
-            except TypeError as e:
-                '''
-                Traceback (most recent call last):
-                  File "./zmap_asset_inventory.py", line 275, in <module>
-                    main(options)
-                  File "./zmap_asset_inventory.py", line 133, in main
-                    z.write_csv(csv_file=options.csv_file)
-                  File "/root/Downloads/zmap-asset-inventory/lib/scan.py", line 382, in write_csv
-                    self._write_csv_line(csv_writer, host)
-                  File "/root/Downloads/zmap-asset-inventory/lib/scan.py", line 570, in _write_csv_line
-                    if ip in target:
-                TypeError: 'in <string>' requires string as left operand, not IPv4Address
-                '''
-                print('target: {}, {}'.format(str(target), str(type(target))))
-                print(str(e))
-                continue
 
-        open_ports = dict()
-        for port in ports:
-            port_state = 'Unknown'
-            if port in host.open_ports:
-                port_state = 'Open'
-            elif in_target is not None:
-                if port in self.targets[in_target]:
-                    #print(str(port), ' is in ', str(self.targets))
-                    port_state = 'Closed'
 
-            open_ports['{}/tcp'.format(port)] = port_state
+    def _csv_rows(self, hosts, ports=None):
+        '''
+        takes iterable of (ip_address(), Host()) tuples
+        generates CSV rows (dictionaries)
+        the hosts themselves aren't modified
+        '''
 
-        host.update(open_ports)
-        try:
-            csv_writer.writerow(host)
-        except ValueError as e:
-            # port is in self.open_ports but not in self.targets
-            print('[!] {}'.format(str(e)))
+        if ports is None:
+            ports = self.port_index
+        ports = list(ports)
+        port_columns = ['{}/tcp'.format(port) for port in ports]
+
+        # (start, end, network) for each target, as integers
+        targets = [(int(t.network_address), int(t.broadcast_address), t) for t in self.targets]
+        # hosts are usually sorted, so the last target is checked first
+        last_target = None
+
+        for ip, host in hosts:
+
+            # see which target range the host is from
+            # so we know whether the port is closed or unscanned
+            ip = int(ip)
+            if last_target is None or not (last_target[0] <= ip <= last_target[1]):
+                last_target = None
+                for target in targets:
+                    if target[0] <= ip <= target[1]:
+                        last_target = target
+                        break
+
+            scanned_ports = (self.targets[last_target[2]] if last_target is not None else ())
+            open_ports = host.open_ports
+
+            row = dict(host)
+            for port, column in zip(ports, port_columns):
+                if port in open_ports:
+                    row[column] = 'Open'
+                elif port in scanned_ports:
+                    row[column] = 'Closed'
+                else:
+                    row[column] = 'Unknown'
+
+            yield row
 
 
 
@@ -784,12 +1170,19 @@ class Inventory:
         elif type(host) == Host:
             host = host.ip
 
+        try:
+            return self._valid_hosts[host]
+        except KeyError:
+            pass
+
+        valid = False
         if not any([host in network for network in self.blacklist]):
             if not self.whitelist or any([host in network for network in self.whitelist]):
                 if any([host in target for target in self.targets]):
-                    return True
+                    valid = True
 
-        return False
+        self._valid_hosts[host] = valid
+        return valid
 
 
     def _check_root(self):
@@ -810,14 +1203,17 @@ class Inventory:
 
     def __iter__(self):
 
-        for host in self.hosts.values():
-            #f.write(host['IP Address'] + '\n')
-            if self._valid_host(host):
+        # iterate over a snapshot, since modules may be adding hosts in other threads
+        with self.hosts_lock:
+            hosts = list(self.hosts.items())
+
+        for ip, host in hosts:
+            if self._valid_host(ip):
                 yield host
 
         if self.zmap_ping_targets and not self.primary_zmap_started and not self.skip_ping:
 
-            with open(self.zmap_ping_file, 'w') as f:
+            with compress.open_file(self.zmap_ping_file, 'w') as f:
 
                 self.start()
                 sleep(1)
@@ -826,11 +1222,10 @@ class Inventory:
                         ip = ipaddress.ip_address(line.strip())
                     except ValueError:
                         continue
-                    host = Host(ip, resolve=self.resolve)
+                    host = self._add_host(ip, Host(ip, resolve=self.resolve))
                     print('[+] {:<17}{:<10} '.format(host['IP Address'], host['Hostname']))
-                    self.hosts[ip] = host
                     f.write(str(ip) + '\n')
-                    if self._valid_host(host):
+                    if self._valid_host(ip):
                         yield host
 
                 self.zmap_ping_targets.clear()
@@ -2,7 +2,9 @@
 
 # by TheTechromancer
 
+import threading
 from shutil import which
+from ..compression import compress_file
 
 
 class BaseModule():
@@ -12,6 +14,12 @@ class BaseModule():
     csv_headers     = []
     required_ports  = []
     required_progs  = []
+    # max connections the module opens at once (None if it doesn't manage its own)
+    # lowered by the scheduler when modules run side by side
+    max_concurrency = None
+    # streaming modules implement probe(), which is called for each host as soon
+    # as one of stream_ports is found open (see lib/streaming.py)
+    streaming       = False
 
     def __init__(self, inventory):
 
@@ -19,6 +27,61 @@ class BaseModule():
         self.work_dir = inventory.work_dir / 'modules' / self.name
         self.work_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
 
+        # hosts which have been handed to probe(), so run() can skip them
+        self.streamed = set()
+
+        # set on ctrl+c, long-running modules should check it and stop early
+        self.cancelled = threading.Event()
+
+        # compression for output files ("gzip", "zstd", or None)
+        self.compression = inventory.compression
+
+
+    @property
+    def stream_ports(self):
+        '''
+        ports which trigger probe()
+        '''
+
+        return self.required_ports
+
+
+    def wants(self, host):
+        '''
+        whether or not probe() should be called on a host (e.g. it hasn't been checked yet)
+        '''
+
+        return True
+
+
+    async def probe(self, host):
+        '''
+        hook for streaming modules
+        checks a single host, returns dictionary of CSV columns (or None)
+        '''
+
+        return None
+
+
+    def finding(self, column, value):
+        '''
+        whether or not a value in one of the module's columns should be reported
+        the inventory keeps track of which hosts have findings as results come in,
+        so report() can use inventory.hosts_with_finding() instead of going through every host
+        '''
+
+        return False
+
+
+    def compress_nmap_output(self, output_file, targets_file=None):
+        '''
+        compresses nmap's -oA output (and the -iL targets file) once it's been parsed
+        '''
+
+        for filename in ['{}.{}'.format(output_file, ext) for ext in ['nmap', 'gnmap', 'xml']] + [targets_file]:
+            if filename is not None:
+                compress_file(filename, self.compression)
+
 
     def check_progs(self):
 
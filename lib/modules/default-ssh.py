@@ -2,16 +2,11 @@
 
 # by TheTechromancer
 
-import io
-import ipaddress
+import asyncio
 from .base_module import *
-from time import sleep
-import subprocess as sp
 from pathlib import Path
-from signal import SIGINT
 from datetime import datetime
-
-patator_default_work_dir = (Path.home() / '.asset_inventory/cache/patator').resolve()
+from ..ssh import SSHCredentialChecker, read_creds, paramiko
 
 
 class Module(BaseModule):
@@ -19,108 +14,97 @@ class Module(BaseModule):
     name            = 'default_ssh'
     csv_headers     = ['Default SSH Login']
     required_ports  = [22]
-    required_progs  = ['patator']
+    required_progs  = []
 
     def __init__(self, inventory):
 
         super().__init__(inventory)
 
         self.port = 22
-        self.threads = 80
-        self.num_targets = 0
+        self.timeout = 10
+        # max SSH connections in total
+        self.max_concurrency = 80
+        # max SSH connections to any one host
+        self.per_host_concurrency = 1
+        # re-check hosts after this many days, even if the credential list hasn't changed
+        self.cache_days = 30
 
         # file containing usernames and passwords to try (colon-delimited)
         self.creds_file = Path(__file__).resolve().parent / 'ssh_creds.txt'
 
-        # log file for patator stdout
-        patator_log_filename = 'patator_log_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now())
-        self.patator_log_file = self.work_dir / patator_log_filename
+        # file for valid username/password pairs
+        valid_creds_filename = 'ssh_valid_creds_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now())
+        self.valid_creds_file = self.work_dir / valid_creds_filename
 
-        # file for patator valid username/password pairs
-        patator_valid_creds = 'patator_valid_creds_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now())
-        self.patator_valid_creds = self.work_dir / patator_valid_creds
 
-        # file containing target IPs
-        targets_filename = 'patator_targets_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now())
-        self.targets_file = self.work_dir / targets_filename
+    def check_progs(self):
 
-        # variable for running patator process
-        self.patator_process = None
+        if paramiko is None:
+            return ['paramiko (python3 -m pip install paramiko)']
+        return []
 
 
     def run(self, inventory):
 
-        # write targets to file
-        with open(self.targets_file, 'w') as f:
-            for host in inventory:
-                if self.port in host.open_ports:
-                    self.num_targets += 1
-                    f.write(host['IP Address'] + '\n')
+        # hosts only need to be checked again if the credential list has changed
+        fingerprint = inventory.results.fingerprint(inventory.results.fingerprint_file(self.creds_file), self.port)
+
+        targets = []
+        skipped = 0
+        for host in inventory.hosts_with_port(self.port):
+            login = inventory.results.get(self.name, host.ip, fingerprint, self.cache_days)
+            if login is None:
+                targets.append(host.ip)
+            else:
+                inventory.update_host(host.ip, {'Default SSH Login': login})
+                skipped += 1
+
+        if skipped:
+            print('\n[+] Skipping {:,} host(s) already checked with the same credentials'.format(skipped))
+
+        if not targets:
+            print('\n[+] No valid targets for SSH login check')
+            return
+
+        creds = read_creds(self.creds_file)
+        checker = SSHCredentialChecker(creds, port=self.port, timeout=self.timeout, \
+            max_concurrency=self.max_concurrency, per_host_concurrency=self.per_host_concurrency)
+
+        print('\n[+] Trying {:,} SSH login(s) against {:,} targets'.format(len(creds), len(targets)))
+
+        finished = 0
+        with open(self.valid_creds_file, 'w') as valid_creds_file:
+
+            def _update(ip, login):
+                nonlocal finished
+                finished += 1
+                # if it couldn't connect (None), try again next time,
+                # and keep whatever was already found (e.g. from the cached CSV)
+                if login is not None:
+                    inventory.results.record(self.name, ip, login, fingerprint)
+                    inventory.update_host(ip, {'Default SSH Login': login})
+                if login:
+                    valid_creds_file.write('{}\t{}\n'.format(ip, login))
+                    valid_creds_file.flush()
+                    print('\r[+] {:<17}{}'.format(str(ip), login))
+                print('\r[+] {:,}/{:,} hosts checked'.format(finished, len(targets)), end='')
+
+            asyncio.run(checker.check_many(targets, callback=_update))
+
+        print('\n[+] Finished SSH login check')
 
-        if self.num_targets <= 0:
-            print('\n[+] No valid targets for Patator scan')
 
-        else:
 
-            try:
-
-                patator_command = ['patator', 'ssh_login', '--threads={}'.format(self.threads), \
-                    'user=COMBO00', 'password=COMBO01', 'host=FILE1', 
-                    '--max-retries=2', '0={}'.format(self.creds_file),\
-                    '1={}'.format(self.targets_file)]
-
-                print('\n[+] Running patator against {:,} targets:\n\t> {}\n'.format(self.num_targets, ' '.join(patator_command)))
-
-                if self.patator_process is None:
-                    self.patator_process = sp.Popen(patator_command, stdout=sp.PIPE, stderr=sp.PIPE)
-                    sleep(2)
-
-                    with open(self.patator_valid_creds, 'w') as valid_creds_file:
-                        with open(self.patator_log_file, 'w') as log_file:
-                            for line in io.TextIOWrapper(self.patator_process.stderr, encoding='utf-8'):
-                                # pass through stdout to log
-                                log_file.write(line)
-                                line = ''.join(line.split('patator')[1:]).strip()
-                                print('\r{}'.format(line), end='')
-                                if 'INFO - 0' in line:
-                                    valid_creds_file.write(line)
-                                    print('\r' + line)
-                                    #try:
-                                    cred_str = line.split()[6]
-                                    creds = ':'.join(cred_str.split(':')[:2])
-                                    ip = ipaddress.ip_address(cred_str.split(':')[-1])
-                                    inventory.hosts[ip].update({'Default SSH Login': creds})
-                                    #except ValueError:
-                                    #    continue
-
-                    self.patator_process = None
-
-                else:
-                    raise PatatorError('Patator is already running')
-
-            except KeyboardInterrupt:
-                print('\n\n[!] Cancelling Patator scan, please wait')
-                try:
-                    self.patator_process.send_signal(SIGINT)
-                    sleep(1)
-                    self.patator_process.send_signal(SIGINT)
-                    sleep(1)
-                    self.patator_process.terminate()
-                except AttributeError:
-                    pass
+    def finding(self, column, value):
 
+        return column == 'Default SSH Login' and ':' in value
 
 
     def report(self, inventory):
 
         valid_creds = dict()
-        for host in inventory:
-            try:
-                creds = host['Default SSH Login']
-                if ':' in creds:
-                    valid_creds[host.ip] = creds
-            except KeyError:
-                pass
+        for host in inventory.hosts_with_finding('Default SSH Login'):
+            valid_creds[host.ip] = host['Default SSH Login']
 
         if valid_creds:
             print('[+] {:,} system(s) with default SSH logins:\n\t'.format(len(valid_creds)), end='')
@@ -138,4 +122,4 @@ class Module(BaseModule):
         except KeyError:
             vulnerable = ''
 
-        host.update({'Default SSH Login': vulnerable})
\ No newline at end of file
+        host.update({'Default SSH Login': vulnerable})
@@ -6,15 +6,20 @@ import os
 import sys
 import json
 import random
+import hashlib
+import threading
 import ipaddress
 import configparser
-from time import sleep
-import subprocess as sp
+from time import time
 from shutil import which
 from pathlib import Path
 import concurrent.futures
 from datetime import datetime
 from .base_module import *
+from ..execution import get_backend, ExecutionError, LogonFailure, ConnectionFailure
+from ..ratelimit import RateLimiter, CircuitBreaker
+from ..raw_output import RawOutputWriter
+from ..collectors import load_collectors, build_command, split_output, CollectorError
 
 
 class ServiceEnumException(Exception):
@@ -23,6 +28,9 @@ class ServiceEnumException(Exception):
 class LogonFailureException(Exception):
     pass
 
+class HostUnreachableException(ServiceEnumException):
+    pass
+
 
 
 class Module(BaseModule):
@@ -39,96 +47,217 @@ class Module(BaseModule):
         super().__init__(inventory)
 
         self.config = self.parse_config()
-        self.lockout_counter = 0
+        self.backend = get_backend(self.config)
+        self.lockout = CircuitBreaker(self.ufail_limit)
+        self.cache = ServiceCache(self.work_dir / 'service_cache.json', self.checks, self.cache_days)
 
-        # {ip : 'wmiexec_output'}
-        self.raw_wmiexec_output = dict()
-        # {ip: {service: 'Yes'}}
+        # seconds between progress updates
+        self.status_interval = 10
+
+        # {ip: {column: 'Yes'}}
         self.services = dict()
-        
-        self.raw_output_file = self.work_dir / 'raw_wmiexec_output_{date:%Y-%m-%d_%H-%M-%S}.txt'.format( date=datetime.now() )
+
+        # raw command output is streamed here as each host finishes
+        # look up a host with: python3 lib/raw_output.py <file> <ip>
+        self.raw_output_file = self.work_dir / 'raw_wmiexec_output_{date:%Y-%m-%d_%H-%M-%S}.gz'.format( date=datetime.now() )
+        self.raw_output = None
+
+
+
+    def check_progs(self):
+
+        return self.backend.missing_progs()
+
+
+
+    @property
+    def checks(self):
+        '''
+        everything gathered from each host, and its definition
+        services are keyed by friendly name, collectors by "collector:<name>"
+        returns dictionary in format:
+        { check_name: definition ... }
+        '''
+
+        checks = dict([(fname, sname.upper()) for fname, sname in self.config['SERVICES'].items()])
+        for collector in self.collectors:
+            checks['collector:' + collector.name] = collector.fingerprint
+
+        return checks
+
+
+
+    def result_columns(self, results):
+        '''
+        takes dictionary of check results
+        returns dictionary of CSV columns
+        '''
+
+        columns = dict()
+        for check, value in results.items():
+            if check.startswith('collector:'):
+                columns.update(value)
+            else:
+                columns[check] = value
+
+        return columns
 
 
 
     def run(self, inventory):
 
+        hosts_to_scan = []
+
         try:
+            cached_hosts = 0
+            for host in inventory.hosts_with_port(445):
+                # restore whatever's still valid from the cache
+                inventory.update_host(host.ip, self.result_columns(self.cache.cached_results(host.ip)))
+                # and only run the checks that aren't
+                stale_checks = self.cache.stale_checks(host.ip)
+                if stale_checks:
+                    hosts_to_scan.append((host, stale_checks))
+                else:
+                    cached_hosts += 1
+
+            if cached_hosts:
+                print('\n[+] Skipping {:,} Windows hosts with fresh results in {}'.format(cached_hosts, self.cache.cache_file))
+
+            if not hosts_to_scan:
+                print('\n[+] No valid targets for service enumeration')
+                return
+
+            print('\n[+] Retrieving service information for {:,} Windows hosts'.format(len(hosts_to_scan)))
+            print('[+] Rate limit: {:.1f} hosts/s, {:,} at a time'.format(self.rate, self.max_concurrency))
+            # shuffle hosts
+            hosts_to_scan = random.sample(hosts_to_scan, len(hosts_to_scan))
+
+            limiter = RateLimiter(self.rate, self.max_concurrency)
+
+            print('[+] Writing raw command output to {}'.format(self.raw_output_file))
+            self.raw_output = RawOutputWriter(self.raw_output_file)
+
             # set up threading
             futures = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=self.threads) as executor:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+
+                last_status = time()
+                for host, checks in hosts_to_scan:
+                    assert not self.lockout.tripped
+                    if self.cancelled.is_set():
+                        print('[!] Cancelling service enumeration')
+                        break
+                    limiter.acquire()
+                    futures.append(executor.submit(self._get_services, host, checks, limiter))
+
+                    if time() - last_status > self.status_interval:
+                        print('[+] Service enumeration: {}'.format(limiter.status(len(hosts_to_scan))))
+                        last_status = time()
+
+                # hosts which haven't been started yet are skipped
+                if self.cancelled.is_set():
+                    for future in futures:
+                        future.cancel()
+
+                # wait for stragglers
+                while futures:
+                    done, futures = concurrent.futures.wait(futures, timeout=self.status_interval)
+                    print('[+] Service enumeration: {}'.format(limiter.status(len(hosts_to_scan))))
 
-                hosts_to_scan = list([h for h in inventory if 445 in h.open_ports])
+        except AssertionError:
+            print('[!] Logon failure limit reached ({limit}/{limit})'.format(limit=self.ufail_limit))
 
-                if not hosts_to_scan:
-                    print('\n[+] No valid targets for service enumeration')
+        finally:
+            self.backend.close()
 
-                else:
-                    print('\n[+] Retrieving service information for {:,} Windows hosts'.format(len(hosts_to_scan)))
-                    # shuffle hosts
-                    hosts_to_scan = random.sample(hosts_to_scan, len(hosts_to_scan))
+            for ip, services in self.services.items():
+                inventory.update_host(ip, services)
 
-                    for host in hosts_to_scan:
-                        assert self.lockout_counter < self.ufail_limit
-                        futures.append(executor.submit(self.get_services, host))
-                        sleep(.75)
+            if self.services:
+                self.cache.save()
 
-                    sleep(10)
-                    executor.shutdown(wait=True)
+            if self.raw_output is not None:
+                self.raw_output.close()
+                self.raw_output = None
 
-                    for ip, services in self.services.items():
-                        inventory.hosts[ip].update(services)
 
 
-        except AssertionError:
-            print('[!] Logon failure limit reached ({limit}/{limit})'.format(limit=self.ufail_limit))
+    def _get_services(self, host, checks, limiter):
 
+        success = False
+        # only timeouts and connection errors slow things down
+        # other failures (access denied, no output, etc.) are specific to the host
+        backoff = False
+        try:
+            success = self.get_services(host, checks)
+        except HostUnreachableException as e:
+            print('[!] Error getting services from {}'.format(str(host)))
+            print(str(e))
+            backoff = True
         finally:
-            try:
-                if hosts_to_scan:
-                    print('[+] Writing raw command output to {}'.format(self.raw_output_file))
-                    with open(self.raw_output_file, 'w') as f:
-                        for ip, output in self.raw_wmiexec_output.items():
-                            f.write(str(ip) + '\n')
-                            f.write('*' * 5 + '\n')
-                            f.write(str(output) + '\n')
-                            f.write('=' * 5 + '\n')
-            except (NameError, UnboundLocalError):
-                pass
+            limiter.release(success, backoff=backoff)
 
 
-    def get_services(self, host):
+
+    def get_services(self, host, checks=None):
+        '''
+        runs the specified checks (see self.checks), or all of them, in a single execution
+        returns True if services were successfully retrieved
+        raises HostUnreachableException if the host timed out or couldn't be connected to
+        '''
 
         ip = host.ip
 
-        w = wmiexec(host, self.config)
+        if checks is None:
+            checks = self.checks
+
+        services = dict([(f, s) for f, s in self.config['SERVICES'].items() if f in checks])
+        collectors = [c for c in self.collectors if 'collector:' + c.name in checks]
+
+        try:
+            w = wmiexec(host, self.config, self.backend, services=services, collectors=collectors)
+        except ValueError as e:
+            print('[!] Error getting services from {}'.format(str(host)))
+            print(str(e))
+            return False
+
         try:
             result = w.get_services()
+        except HostUnreachableException:
+            raise
         except ServiceEnumException as e:
             print('[!] Error getting services from {}'.format(str(host)))
             print(str(e))
-            return
+            return False
         except LogonFailureException as e:
             print('[!] LOGIN FAILURE ON {}'.format(str(host)))
             print(str(e))
             # increment lockout counter
-            self.lockout_counter += 1
-            return
+            self.lockout.failure()
+            return False
 
         if result:
             # reset lockout counter
-            self.lockout_counter = 0
+            self.lockout.success()
 
-            os_name, services_detected = result
+            os_name, services_detected, facts = result
 
             print('[+] Found {:,} services on {}'.format(list(services_detected.values()).count('Yes'), ip))
 
+            results = dict(services_detected)
+            for name, columns in facts.items():
+                results['collector:' + name] = columns
+
             self.services[ip] = {'OS': os_name}
-            self.services[ip].update(services_detected)
+            self.services[ip].update(self.result_columns(results))
+            self.cache.update(ip, os_name, results)
 
-            self.raw_wmiexec_output[ip] = w.raw_stdout + w.raw_stderr
+            self.raw_output.write(ip, w.raw_stdout + w.raw_stderr)
+            return True
 
         else:
-            print('[!] No output returned from service enumeration of {}'.format(str(self)))
+            print('[!] No output returned from service enumeration of {}'.format(str(host)))
+            return False
 
 
 
@@ -240,7 +369,7 @@ class Module(BaseModule):
 
     def read_host(self, line, host):
 
-        service_friendly_names = [i.lower() for i in list(self.services.values())]
+        service_friendly_names = [i.lower() for i in self.csv_headers]
 
         # update host if the line header matches one of the services in services.config
         for key, value in line.items():
@@ -263,6 +392,15 @@ class Module(BaseModule):
             self.threads = int(config['EXECUTION']['THREADS'])
             self.ufail_limit = int(config['CREDENTIALS']['consecutivefailedlogonlimit'])
 
+            # hosts per second, and max number of hosts being enumerated at once
+            self.rate = float(config['EXECUTION'].get('Rate', '20'))
+            self.max_concurrency = int(config['EXECUTION'].get('MaxInFlight', str(self.threads)))
+            if self.rate <= 0:
+                raise ValueError('Rate must be greater than 0')
+
+            # how long cached results are good for (0 disables caching)
+            self.cache_days = float(config['EXECUTION'].get('CacheDays', '7'))
+
             # make sure we have credentials
             if not config['CREDENTIALS']['username'] or not (config['CREDENTIALS']['password'] \
                 or config['CREDENTIALS']['hashes']):
@@ -279,87 +417,232 @@ class Module(BaseModule):
             else:
                 raise TypeError('No services specified in services.config')
 
-            return config
-
         except (KeyError, TypeError, ValueError) as e:
-            raise ValueError('Problem with services.config at {}'.format(str(config_file)))
-            print('\t' + str(e))
+            raise ValueError('Problem with services.config at {}: {}'.format(str(config_path), str(e)))
 
+        # extra facts to gather in the same execution
+        collectors_path = "{0}/collectors.config".format(sys.path[0])
+        try:
+            self.collectors = load_collectors(collectors_path)
+        except (CollectorError, configparser.Error) as e:
+            raise ValueError('Problem with collectors.config at {}: {}'.format(str(collectors_path), str(e)))
 
+        for collector in self.collectors:
+            self.csv_headers += [c for c in collector.columns if not c in self.csv_headers]
 
+        return config
 
 
-class wmiexec:
+
+
+
+class ServiceCache:
     '''
-    Can be used with any of the impacket execution methods (smbexec, atexec, etc.)
+    remembers which checks were run on each host, what was found, and when
+    each check (service or collector) is fingerprinted separately, so adding one line to [SERVICES]
+    only means checking for that one service on each host
+    stored as JSON in format:
+    {
+        ip: {
+            'timestamp': unix_time,
+            'checks_hash': hash_of_all_checks,
+            'os': os_name,
+            'checks': { check_name: {'fingerprint': hash_of_definition, 'timestamp': unix_time, 'value': 'Yes'} ... }
+        } ...
+    }
     '''
 
-    def __init__(self, target, config):
+    def __init__(self, cache_file, checks, cache_days=7):
 
-        self.target   = target.ip
-        self.username = config['CREDENTIALS']['username']
-        self.password = config['CREDENTIALS']['password']
-        self.domain   = config['CREDENTIALS']['domain']
-        self.hashes   = config['CREDENTIALS']['hashes']
-        self.services = config['SERVICES']
-        self.timeout  = int(config['EXECUTION']['TIMEOUT'])
-        self.method   = config['EXECUTION']['METHOD']
+        self.cache_file     = Path(cache_file)
+        # { check_name: definition }
+        self.checks         = dict(checks)
+        self.ttl            = cache_days * 86400
+        self.checks_hash    = self.fingerprint(sorted(self.checks.items()))
+        self.lock           = threading.Lock()
 
-        self.impacket_auth = ''
+        self.hosts = dict()
+        try:
+            with open(self.cache_file) as f:
+                self.hosts = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            print('[!] Ignoring corrupt service cache at {}'.format(self.cache_file))
 
-        self.raw_output = ''
 
-        self.ticket = False
-        if not self.username or not (self.password or self.hashes):
-            try:
-                os.environ['KRB5CCNAME']
-                if target.hostname:
-                    self.target = target.hostname
-                else:
-                    raise ValueError('Ticket authentication needs valid hostname, none found for {}, skipping'.format(str(target['IP Address'])))                
-                self.impacket_auth = ['-k', '-no-pass', '{}/{}@{}'.format(self.domain, self.username, str(self.target))]
-            except KeyError:
-                raise ValueError('Kerberos ticket not found, please export "KRB5CCNAME" variable')
-        elif self.password:
-            self.impacket_auth = ['{}/{}:{}@{}'.format(self.domain, self.username, self.password, self.target)]
-        elif self.hashes:
-            self.impacket_auth = ['-hashes', self.hashes, '{}/{}@{}'.format(self.domain, self.username, self.target)]
-        else:
-            raise ValueError('Specified authentication method not valid.  Please check services.config.')
+    @staticmethod
+    def fingerprint(value):
+
+        return hashlib.sha1(json.dumps(value).encode()).hexdigest()[:16]
+
+
+    def stale_checks(self, ip):
+        '''
+        returns checks which need to be (re)run on host, in format:
+        { check_name: definition }
+        '''
+
+        try:
+            record = self.hosts[str(ip)]
+        except KeyError:
+            return dict(self.checks)
+
+        if self.ttl <= 0:
+            return dict(self.checks)
+
+        now = time()
+
+        # shortcut: nothing has changed since the last full check
+        if record.get('checks_hash') == self.checks_hash and now - record['timestamp'] < self.ttl:
+            return dict()
+
+        return dict([(name, definition) for name, definition in self.checks.items() \
+            if self._entry(record, name, now) is None])
+
+
+    def cached_results(self, ip):
+        '''
+        returns still-valid results for host, in format:
+        { 'OS': os_name, check_name: value ... }
+        '''
+
+        results = dict()
+
+        try:
+            record = self.hosts[str(ip)]
+        except KeyError:
+            return results
+
+        if self.ttl <= 0:
+            return results
+
+        now = time()
+        for name in self.checks:
+            entry = self._entry(record, name, now)
+            if entry is not None:
+                results[name] = entry['value']
+
+        if results and record.get('os', ''):
+            results['OS'] = record['os']
+
+        return results
+
+
+    def update(self, ip, os_name, results):
+
+        now = time()
+
+        with self.lock:
+            record = self.hosts.get(str(ip), dict())
+            record.setdefault('checks', dict())
+            record['os'] = os_name
+
+            for name, value in results.items():
+                record['checks'][name] = {
+                    'fingerprint':  self.fingerprint(self.checks[name]),
+                    'timestamp':    now,
+                    'value':        value
+                }
+
+            # the host is only as fresh as its oldest current check
+            current_entries = [self._entry(record, name, now) for name in self.checks]
+            if all(current_entries):
+                record['checks_hash'] = self.checks_hash
+                record['timestamp'] = min([e['timestamp'] for e in current_entries])
+            else:
+                record['checks_hash'] = ''
+                record['timestamp'] = 0
+
+            self.hosts[str(ip)] = record
+
+
+    def save(self):
+
+        with self.lock:
+            tmp_file = self.cache_file.with_suffix('.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump(self.hosts, f)
+            tmp_file.replace(self.cache_file)
+
+
+    def _entry(self, record, name, now):
+        '''
+        returns cache entry for check if it's current, otherwise None
+        '''
+
+        try:
+            entry = record['checks'][name]
+        except KeyError:
+            return None
+
+        if entry['fingerprint'] == self.fingerprint(self.checks[name]) and now - entry['timestamp'] < self.ttl:
+            return entry
+
+        return None
+
+
+
+
+
+class wmiexec:
+    '''
+    Can be used with any execution backend (see lib/execution.py)
+    '''
+
+    def __init__(self, target, config, backend, services=None, collectors=None):
+
+        self.target     = str(target.ip)
+        self.username   = config['CREDENTIALS']['username']
+        self.password   = config['CREDENTIALS']['password']
+        self.services   = (config['SERVICES'] if services is None else services)
+        self.collectors = ([] if collectors is None else collectors)
+        self.backend    = backend
+
+        self.raw_stdout = ''
+        self.raw_stderr = ''
+
+        # kerberos needs a hostname to get a service ticket for
+        if not self.username or not (self.password or config['CREDENTIALS']['hashes']):
+            if target.hostname:
+                self.target = target.hostname
+            else:
+                raise ValueError('Ticket authentication needs valid hostname, none found for {}, skipping'.format(str(target['IP Address'])))
 
 
 
     def get_services(self):
         '''
-        enumerates requested services
-        returns tuple (os_name, { service_fname: True|False ... } )
+        enumerates requested services, and runs any collectors, in a single execution
+        returns tuple (os_name, { service_fname: 'Yes'|'No' ... }, { collector_name: { column: value ... } ... } )
         '''
 
         service_keywords = set()
         for service_name in self.services.values():
             [service_keywords.add(word) for word in service_name.split()]
 
-        canary = '!@#'
-        canary_cmd = 'echo {}'.format(canary)
+        sections = [('os', '''reg query "hklm\\software\\microsoft\\windows nt\\currentversion" /v productname''')]
+        if service_keywords:
+            sections.append(('services', '''sc query | findstr /i "{}"'''.format(' '.join(service_keywords))))
+        for collector in self.collectors:
+            sections.append((collector.name, collector.command))
 
-        win_commands = ['(', canary_cmd, '&', \
-        '''reg query "hklm\\software\\microsoft\\windows nt\\currentversion" /v productname''', '&',
-        canary_cmd, '&', '''sc query | findstr /i "{}"'''.format(' '.join(service_keywords)), ')']
-
-        stdout,stderr = self.run_wmiexec(' '.join(win_commands))
+        stdout,stderr = self.run_wmiexec(build_command(sections))
 
         if 'STATUS_LOGON_FAILURE' in stdout:
             raise LogonFailureException(stdout + stderr)
-        elif not canary in stdout:
+
+        output = split_output(stdout)
+        if not all([name in output for name, command in sections]):
             raise ServiceEnumException(stdout + stderr)
 
-        else:
-            try:
-                os_str, svc_str = [[line.strip() for line in chunk.split('\r\n') if line.strip()] for chunk in stdout.split(canary)[1:3]]
-            except ValueError:
-                raise ServiceEnumException(stdout + stderr)
+        os_str = [line.strip() for line in output['os'] if line.strip()]
+        svc_str = [line.strip() for line in output.get('services', []) if line.strip()]
 
-        os_name = ' '.join(os_str[-1].split()[2:])
+        try:
+            os_name = ' '.join(os_str[-1].split()[2:])
+        except IndexError:
+            os_name = 'Unknown'
 
         services_detected = dict()
         for (fname, sname) in self.services.items():
@@ -373,27 +656,23 @@ class wmiexec:
                     services_detected[fname] = 'Yes'
                     break
 
-        return (os_name, services_detected)
-
-
+        facts = dict()
+        for collector in self.collectors:
+            facts[collector.name] = collector.parse(output[collector.name])
 
-    def run_wmiexec(self, command, method=None, timeout=None):
+        return (os_name, services_detected, facts)
 
-        if timeout is None:
-            timeout = self.timeout
 
-        if method is None:
-            method = self.method
 
-        exec_base = [method] + self.impacket_auth
-        exec_command = exec_base + [command]
+    def run_wmiexec(self, command):
 
-        print(' >> ' + ' '.join(exec_base) + " '{}'".format(command))
         try:
-            env = dict(os.environ, PYTHONIOENCODING='UTF-8')
-            exec_process = sp.run(exec_command, stdout=sp.PIPE, stderr=sp.PIPE, timeout=timeout, env=env)
-            self.raw_stdout = exec_process.stdout.decode()
-            self.raw_stderr = exec_process.stderr.decode()
-            return (self.raw_stdout, self.raw_stderr)
-        except sp.TimeoutExpired:
-            raise ServiceEnumException(f'{method} timed out:\n{" ".join(exec_command)}')
+            self.raw_stdout, self.raw_stderr = self.backend.execute(self.target, command)
+        except LogonFailure as e:
+            raise LogonFailureException(str(e))
+        except ConnectionFailure as e:
+            raise HostUnreachableException(str(e))
+        except ExecutionError as e:
+            raise ServiceEnumException(str(e))
+
+        return (self.raw_stdout, self.raw_stderr)
@@ -21,25 +21,44 @@ class Module(BaseModule):
         super().__init__(inventory)
 
         self.process            = None
+        self.script             = 'smb-vuln-ms17-010'
+        # re-check hosts after this many days
+        self.cache_days         = 30
         self.targets_file       = str(self.work_dir / 'eternalblue_targets_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now()))
         self.output_file        = str(self.work_dir / 'eternalblue_results_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now()))
 
 
     def run(self, inventory):
 
+        fingerprint = inventory.results.fingerprint(self.script)
+
         targets = 0
+        skipped = 0
         with open(self.targets_file, mode='w') as f:
-            for host in inventory:
+            for host in inventory.hosts_with_port(445):
                 ip = host.ip
                 try:
                     vulnerable = host['Vulnerable to EternalBlue']
                 except KeyError:
                     vulnerable = 'N/A'
-                inventory.hosts[ip].update({'Vulnerable to EternalBlue': vulnerable})
 
-                if 445 in host.open_ports and not vulnerable.strip().lower() in ['yes', 'no']:
+                cached = inventory.results.get(self.name, ip, fingerprint, self.cache_days)
+                if cached is None and vulnerable.strip().lower() in ['yes', 'no']:
+                    # checked before results were stored, so the CSV's result starts the clock
+                    cached = vulnerable.strip().capitalize()
+                    inventory.results.record(self.name, ip, cached, fingerprint)
+
+                if cached is None:
                     targets += 1
                     f.write(str(ip) + '\n')
+                else:
+                    vulnerable = cached
+                    skipped += 1
+
+                inventory.update_host(ip, {'Vulnerable to EternalBlue': vulnerable})
+
+        if skipped:
+            print('\n[+] Skipping {:,} host(s) checked for EternalBlue in the last {} days'.format(skipped, self.cache_days))
 
         if targets <= 0:
             print('\n[!] No valid targets for EternalBlue scan')
@@ -47,7 +66,7 @@ class Module(BaseModule):
         else:
 
             command = ['nmap', '-p445', '-T4', '-n', '-Pn', '-v', '-sV', \
-                '--script=smb-vuln-ms17-010', '-oA', self.output_file, \
+                '--script={}'.format(self.script), '-oA', self.output_file, \
                 '-iL', self.targets_file]
 
             print('\n[+] Scanning {:,} systems for EternalBlue:\n\t> {}\n'.format(targets, ' '.join(command)))
@@ -77,27 +96,49 @@ class Module(BaseModule):
                 if ip is None:
                     continue
 
-                else:
-                    for hostscript in host.findall('hostscript'):
-                        for script in hostscript.findall('script'):
-                            if script.attrib['id'] == 'smb-vuln-ms17-010':
-                                if 'VULNERABLE' in script.attrib['output']:
-                                    inventory.hosts[ip].update({'Vulnerable to EternalBlue': 'Yes'})
-                                else:
-                                    inventory.hosts[ip].update({'Vulnerable to EternalBlue': 'No'})
+                # the script only has output for vulnerable hosts, so any other host that was up is "No"
+                # (-Pn marks every host up, so 445 has to be open too)
+                status = host.find('status')
+                if status is None or status.attrib.get('state') != 'up':
+                    continue
+                if not self._port_open(host, 445):
+                    continue
+
+                vulnerable = 'No'
+                for hostscript in host.findall('hostscript'):
+                    for script in hostscript.findall('script'):
+                        if script.attrib['id'] == self.script and 'VULNERABLE' in script.attrib['output']:
+                            vulnerable = 'Yes'
 
+                inventory.update_host(ip, {'Vulnerable to EternalBlue': vulnerable})
+                inventory.results.record(self.name, ip, vulnerable, fingerprint)
+
+            self.compress_nmap_output(self.output_file, self.targets_file)
             print('[+] Saved Nmap EternalBlue results to {}.*'.format(self.output_file))
 
 
+    @staticmethod
+    def _port_open(host, port):
+        '''
+        takes <host> element from nmap XML
+        '''
+
+        for p in host.iter('port'):
+            if p.attrib.get('portid') == str(port):
+                state = p.find('state')
+                return state is not None and state.attrib.get('state') == 'open'
+
+        return False
+
+
+    def finding(self, column, value):
+
+        return column == 'Vulnerable to EternalBlue' and value.lower().startswith('y')
+
+
     def report(self, inventory):
 
-        vulnerable_hosts = []
-        for host in inventory:
-            try:
-                if host['Vulnerable to EternalBlue'].lower().startswith('y'):
-                    vulnerable_hosts.append(host)
-            except KeyError:
-                pass
+        vulnerable_hosts = inventory.hosts_with_finding('Vulnerable to EternalBlue')
 
         if vulnerable_hosts:
             print('[+] {} system(s) vulnerable to EternalBlue:\n\t'.format(len(vulnerable_hosts)), end='')
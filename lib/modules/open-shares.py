@@ -3,21 +3,42 @@
 # by TheTechromancer
 
 import sys
+import asyncio
 import ipaddress
-from time import sleep
 import subprocess as sp
 import concurrent.futures
 from .base_module import *
 from datetime import datetime
-import xml.etree.cElementTree as xml # for parsing Nmap output
+from ..nfs import exports, exports_many, RPCError
+import xml.etree.ElementTree as xml # for parsing Nmap output
 
 class Module(BaseModule):
 
     name            = 'open-shares'
-    csv_headers     = ['Open FTP', 'Open NFS'] #'Open SMB',
+    csv_headers     = ['Open FTP', 'Open NFS', 'NFS Exports'] #'Open SMB',
     required_ports  = [21,111,9100] #139,445
     required_progs  = ['nmap']
 
+    # nmap share checks, keyed by CSV column
+    # NFS is handled natively (see check_nfs())
+    # { column: (ports, nmap_script) ... }
+    share_checks = {
+        'Open FTP': ((21,),         'ftp-anon'),
+        'Open SMB': ((139,445),     'smb-enum-shares'),
+    }
+    enabled_checks  = ['Open FTP'] #'Open SMB'
+
+    # max number of concurrent nmap processes
+    max_scans       = 4
+
+    # NFS export enumeration
+    nfs_timeout     = 5
+    max_concurrency = 500
+
+    # NFS hosts are probed as soon as 111 is found open
+    streaming       = True
+    stream_ports    = [111]
+
     def __init__(self, inventory):
 
         super().__init__(inventory)
@@ -26,265 +47,268 @@ class Module(BaseModule):
 
     def run(self, inventory):
 
-        '''
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            executor.submit(self.check_smb, inventory)
-            sleep(1)
-            executor.submit(self.check_ftp, inventory)
-            sleep(1)
-            executor.submit(self.check_nfs, inventory)
-        '''
-        #self.check_smb(inventory)
-        self.check_ftp(inventory)
-        self.check_nfs(inventory)
+        scan_plan = self.plan_checks(inventory)
+        nfs_targets = self.plan_nfs(inventory)
 
+        if not (scan_plan or nfs_targets):
+            print('\n[!] No valid targets for open share scan')
+            return
 
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_scans) as executor:
+            futures = [executor.submit(self.run_scan, inventory, ports, checks, hosts) \
+                for (ports, checks), hosts in scan_plan.items()]
 
+            # NFS runs alongside the nmap scans
+            self.check_nfs(inventory, nfs_targets)
 
-    def check_ftp(self, inventory):
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
 
-        targets = 0
-        targets_file       = str(self.work_dir / 'ftp_targets_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now()))
-        output_file        = str(self.work_dir / 'ftp_results_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now()))
+        if scan_plan:
+            print('\n[+] Finished Nmap share scans')
 
-        with open(targets_file, 'w') as f:
-            for host in inventory:
+
+
+    def plan_checks(self, inventory):
+        '''
+        figures out which share checks each host needs
+        hosts needing the exact same ports/scripts are grouped into a single nmap invocation
+        returns dictionary in format:
+        { (ports, checks): [ ip_address() ... ] ... }
+        '''
+
+        scan_plan = dict()
+
+        # only hosts with at least one relevant port open
+        candidates = dict()
+        for check in self.enabled_checks:
+            for port in self.share_checks[check][0]:
+                for host in inventory.hosts_with_port(port):
+                    candidates[host.ip] = host
+
+        for ip, host in sorted(candidates.items()):
+            host_ports = set()
+            host_checks = []
+
+            for check in self.enabled_checks:
                 try:
-                    if host['Open FTP'].lower() in ['yes', 'no']:
+                    if host[check].lower() in ['yes', 'no']:
                         continue
                 except KeyError:
                     pass
-                if 9100 not in host.open_ports and 21 in host.open_ports:
-                    f.write(str(host.ip) + '\n')
-                    targets += 1
 
-        if targets <= 0:
-            print('\n[!] No valid targets for FTP scan')
+                check_ports, script = self.share_checks[check]
 
-        else:
+                # skip printers, they tend to print garbage when poked on FTP/SMB
+                if 9100 in host.open_ports:
+                    continue
 
-            command = ['nmap', '-p21', '-T4', '-n', '-Pn', '-v', '-sV', \
-                '--script=ftp-anon', '-oA', output_file, \
-                '-iL', targets_file]
+                open_check_ports = [p for p in check_ports if p in host.open_ports]
+                if open_check_ports:
+                    host_ports.update(open_check_ports)
+                    host_checks.append(check)
 
-            print('\n[+] Scanning {:,} system(s) for open FTP:\n\t> {}\n'.format(targets, ' '.join(command)))
+            if host_checks:
+                key = (tuple(sorted(host_ports)), tuple(host_checks))
+                try:
+                    scan_plan[key].append(host.ip)
+                except KeyError:
+                    scan_plan[key] = [host.ip]
 
-            try:
-                process = sp.run(command, check=True)
-            except sp.CalledProcessError as e:
-                sys.stderr.write('[!] Error launching Nmap FTP scan: {}\n'.format(str(e)))
-                return
+        return scan_plan
 
-            # parse xml
-            tree = xml.parse(output_file + '.xml')
 
-            for host in tree.findall('host'):
 
-                ip = None
-                for address in host.findall('address'):
-                    if address.attrib['addrtype'] == 'ipv4':
-                        try:
-                            ip = ipaddress.ip_address(address.attrib['addr'])
-                        except ValueError:
-                            continue
-                        break
+    def plan_nfs(self, inventory):
 
-                if ip is None:
-                    continue
+        targets = []
+        for host in inventory.hosts_with_port(111):
+            if not host.ip in self.streamed and self.wants(host):
+                targets.append(host.ip)
 
-                else:
-                    inventory.hosts[ip].update({'Open FTP': 'No'})
+        return targets
 
-                    for nmap_ports in host.findall('ports'):
-                        for nmap_port in nmap_ports.findall('port'):
-                            for script in nmap_port.findall('script'):
-                                if script.attrib['id'] == 'ftp-anon':
-                                    if 'Anonymous FTP login allowed' in script.attrib['output']:
-                                        inventory.hosts[ip].update({'Open FTP': 'Yes'})
-                                        
 
-            print('[+] Saved Nmap FTP scan results to {}.*'.format(output_file))
-            print('\n[+] Finished Nmap FTP scan')
 
+    def wants(self, host):
 
+        try:
+            return not host['Open NFS'].lower() in ['yes', 'no']
+        except KeyError:
+            return True
 
 
-    def check_smb(self, inventory):
 
-        targets = 0
-        targets_file       = str(self.work_dir / 'smb_targets_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now()))
-        output_file        = str(self.work_dir / 'smb_results_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now()))
+    async def probe(self, host):
 
-        with open(targets_file, 'w') as f:
-            for host in inventory:
-                try:
-                    if host['Open SMB'].lower() in ['yes', 'no']:
-                        continue
-                except KeyError:
-                    pass
-                if 9100 not in host.open_ports and any([port in host.open_ports for port in [139,445]]):
-                    f.write(str(host.ip) + '\n')
-                    targets += 1
+        try:
+            export_list = await exports(str(host.ip), timeout=self.nfs_timeout)
+        except (OSError, asyncio.TimeoutError, RPCError):
+            export_list = None
 
-        if targets <= 0:
-            print('\n[!] No valid targets for SMB scan')
+        return self.nfs_columns(export_list, host.ip)
 
-        else:
 
-            command = ['nmap', '-p139,445', '-T4', '-n', '-Pn', '-v', '-sV', \
-                '--script=smb-enum-shares', '-oA', output_file, \
-                '-iL', targets_file]
 
-            print('\n[+] Scanning {:,} system(s) for open SMB:\n\t> {}\n'.format(targets, ' '.join(command)))
+    def check_nfs(self, inventory, targets):
+        '''
+        queries portmapper and mountd directly for the export list of each target
+        '''
+
+        if not targets:
+            print('\n[!] No valid targets for NFS scan')
+            return
+
+        print('\n[+] Enumerating NFS exports on {:,} system(s)'.format(len(targets)))
 
-            try:
-                process = sp.run(command, check=True)
-            except sp.CalledProcessError as e:
-                sys.stderr.write('[!] Error launching Nmap SMB scan: {}\n'.format(str(e)))
-                return
+        def _update(ip, export_list):
+            inventory.update_host(ip, self.nfs_columns(export_list, ip))
 
-            print('\n[+] Finished Nmap SMB scan')
+        asyncio.run(exports_many(targets, timeout=self.nfs_timeout, \
+            max_concurrency=self.max_concurrency, callback=_update))
 
-            # parse xml
-            tree = xml.parse(output_file + '.xml')
+        print('\n[+] Finished NFS scan')
 
-            for host in tree.findall('host'):
 
-                ip = None
-                for address in host.findall('address'):
-                    if address.attrib['addrtype'] == 'ipv4':
-                        try:
-                            ip = ipaddress.ip_address(address.attrib['addr'])
-                        except ValueError:
-                            continue
-                        break
 
-                if ip is None:
-                    continue
+    def nfs_columns(self, export_list, ip):
+        '''
+        takes list of exports from nfs.exports() (None if portmapper didn't answer)
+        returns dictionary of CSV columns
+        '''
+
+        if export_list is None:
+            return {'Open NFS': 'N/A', 'NFS Exports': ''}
+
+        nfs_exports = self.format_exports(export_list)
+        if export_list:
+            print('[+] {:<17}{}'.format(str(ip), nfs_exports))
 
-                else:
-                    inventory.hosts[ip].update({'Open SMB': 'No'})
+        return {
+            'Open NFS': ('Yes' if export_list else 'No'),
+            'NFS Exports': nfs_exports
+        }
 
-                    for hostscript in host.findall('hostscript'):
-                        for script in hostscript.findall('script'):
-                            if script.attrib['id'] == 'smb-enum-shares':
-                                if any([keyword in script.attrib['output'] for keyword in ['access: READ', 'access: WRITE']]):
-                                    inventory.hosts[ip].update({'Open SMB': 'Yes'})
-                                    
 
-            print('[+] Saved Nmap SMB results to {}.*'.format(output_file))
-            print('\n[+] Finished Nmap SMB scan')
 
+    @staticmethod
+    def format_exports(export_list):
+        '''
+        takes list of exports from nfs.exports()
+        returns string in format:
+        "/export (*); /home (10.0.0.0/8 backup-server)"
+        '''
 
+        exports = []
+        for path, groups in export_list:
+            # no groups means anyone can mount it
+            if not groups:
+                groups = ['*']
+            exports.append('{} ({})'.format(path, ' '.join(groups)))
 
-    def check_nfs(self, inventory):
+        return '; '.join(exports)
 
-        targets = 0
-        targets_file       = str(self.work_dir / 'nfs_targets_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now()))
-        output_file        = str(self.work_dir / 'nfs_results_{date:%Y-%m-%d_%H-%M-%S}'.format(date=datetime.now()))
+
+
+    def run_scan(self, inventory, ports, checks, hosts):
+
+        scan_id = '_'.join([check.split()[-1].lower() for check in checks])
+        targets_file       = str(self.work_dir / '{}_targets_{date:%Y-%m-%d_%H-%M-%S}'.format(scan_id, date=datetime.now()))
+        output_file        = str(self.work_dir / '{}_results_{date:%Y-%m-%d_%H-%M-%S}'.format(scan_id, date=datetime.now()))
 
         with open(targets_file, 'w') as f:
-            for host in inventory:
-                try:
-                    if host['Open NFS'].lower() in ['yes', 'no']:
-                        continue
-                except KeyError:
-                    pass
-                if 111 in host.open_ports:
-                    f.write(str(host.ip) + '\n')
-                    targets += 1
+            for ip in hosts:
+                f.write(str(ip) + '\n')
 
-        if targets <= 0:
-            print('\n[!] No valid targets for NFS scan')
+        scripts = [self.share_checks[check][1] for check in checks]
+        check_names = '/'.join([check.split()[-1] for check in checks])
 
-        else:
+        command = ['nmap', '-p{}'.format(','.join([str(p) for p in ports])), '-T4', '-n', '-Pn', '-v', '-sV', \
+            '--script={}'.format(','.join(scripts)), '-oA', output_file, \
+            '-iL', targets_file]
+
+        print('\n[+] Scanning {:,} system(s) for open {}:\n\t> {}\n'.format(len(hosts), check_names, ' '.join(command)))
 
-            command = ['nmap', '-p111', '-T4', '-n', '-Pn', '-v', '-sV', \
-                '--script=nfs-showmount', '-oA', output_file, \
-                '-iL', targets_file]
+        try:
+            process = sp.run(command, stdout=sp.DEVNULL, check=True)
+        except sp.CalledProcessError as e:
+            sys.stderr.write('[!] Error launching Nmap {} scan: {}\n'.format(check_names, str(e)))
+            return
 
-            print('\n[+] Scanning {:,} system(s) for open NFS:\n\t> {}\n'.format(targets, ' '.join(command)))
+        self.parse_results(inventory, output_file + '.xml', checks)
+        self.compress_nmap_output(output_file, targets_file)
 
-            try:
-                process = sp.run(command, check=True)
-            except sp.CalledProcessError as e:
-                sys.stderr.write('[!] Error launching Nmap NFS scan: {}\n'.format(str(e)))
-                return
+        print('[+] Saved Nmap {} scan results to {}.*'.format(check_names, output_file))
 
-            # parse xml
-            tree = xml.parse(output_file + '.xml')
 
-            for host in tree.findall('host'):
 
-                ip = None
-                for address in host.findall('address'):
-                    if address.attrib['addrtype'] == 'ipv4':
-                        try:
-                            ip = ipaddress.ip_address(address.attrib['addr'])
-                        except ValueError:
-                            continue
-                        break
+    def parse_results(self, inventory, xml_file, checks):
+        '''
+        splits the results of a combined nmap scan back into their CSV columns
+        '''
 
-                if ip is None:
-                    continue
+        tree = xml.parse(xml_file)
+
+        for host in tree.findall('host'):
+
+            ip = None
+            for address in host.findall('address'):
+                if address.attrib['addrtype'] == 'ipv4':
+                    try:
+                        ip = ipaddress.ip_address(address.attrib['addr'])
+                    except ValueError:
+                        continue
+                    break
+
+            if ip is None:
+                continue
+
+            # { script_id: [outputs] }
+            script_output = dict()
+            for script in host.findall('ports/port/script') + host.findall('hostscript/script'):
+                try:
+                    script_output[script.attrib['id']].append(script.attrib['output'])
+                except KeyError:
+                    script_output[script.attrib['id']] = [script.attrib['output']]
+
+            for check in checks:
+                script = self.share_checks[check][1]
+                result = 'No'
+                if any([self.share_open(check, output) for output in script_output.get(script, [])]):
+                    result = 'Yes'
+                inventory.update_host(ip, {check: result})
+
+
+
+    @staticmethod
+    def share_open(check, script_output):
 
-                else:
-                    inventory.hosts[ip].update({'Open NFS': 'No'})
+        if check == 'Open FTP':
+            return 'Anonymous FTP login allowed' in script_output
+        elif check == 'Open SMB':
+            return any([keyword in script_output for keyword in ['access: READ', 'access: WRITE']])
 
-                    for nmap_ports in host.findall('ports'):
-                        for nmap_port in nmap_ports.findall('port'):
-                            for script in nmap_port.findall('script'):
-                                if script.attrib['id'] == 'nfs-showmount':
-                                    if '/' in script.attrib['output']:
-                                        inventory.hosts[ip].update({'Open NFS': 'Yes'})
-                                        
+        return False
 
-            print('[+] Saved Nmap NFS scan results to {}.*'.format(output_file))
-            print('\n[+] Finished Nmap NFS scan')
 
 
+    def finding(self, column, value):
+
+        return column in ['Open SMB', 'Open FTP', 'Open NFS'] and value.lower().startswith('y')
+
 
     def report(self, inventory):
 
-        vulnerable_hosts = []
-        for host in inventory:
-            try:
-                if host['Open NFS'].lower().startswith('y'):
-                    vulnerable_hosts.append(host)
-            except KeyError:
-                pass
+        vulnerable_hosts = inventory.hosts_with_finding('Open NFS')
 
         if vulnerable_hosts:
             print('[+] {} system(s) with open NFS shares:\n\t'.format(len(vulnerable_hosts)), end='')
-            print('\n\t'.join([str(h) for h in vulnerable_hosts]))
+            print('\n\t'.join(['{}  {}'.format(str(h), h.get('NFS Exports', '')) for h in vulnerable_hosts]))
         else:
             print('[+] No systems found with open NFS shares')
         print('')
 
-        '''
-        vulnerable_hosts = []
-        for host in inventory:
-            try:
-                if host['Open SMB'].lower().startswith('y'):
-                    vulnerable_hosts.append(host)
-            except KeyError:
-                pass
-
-        if vulnerable_hosts:
-            print('[+] {} system(s) with open SMB shares:\n\t'.format(len(vulnerable_hosts)), end='')
-            print('\n\t'.join([str(h) for h in vulnerable_hosts]))
-        else:
-            print('[+] No systems found with open SMB shares')
-        print('')
-        '''
-
-        vulnerable_hosts = []
-        for host in inventory:
-            try:
-                if host['Open FTP'].lower().startswith('y'):
-                    vulnerable_hosts.append(host)
-            except KeyError:
-                pass
+        vulnerable_hosts = inventory.hosts_with_finding('Open FTP')
 
         if vulnerable_hosts:
             print('[+] {} system(s) with open FTP:\n\t'.format(len(vulnerable_hosts)), end='')
@@ -316,4 +340,11 @@ class Module(BaseModule):
             vulnerable = csv_line['Open NFS'].strip()
         except KeyError:
             pass
-        host.update({'Open NFS': vulnerable})
\ No newline at end of file
+        host.update({'Open NFS': vulnerable})
+
+        nfs_exports = ''
+        try:
+            nfs_exports = csv_line['NFS Exports'].strip()
+        except KeyError:
+            pass
+        host.update({'NFS Exports': nfs_exports})
\ No newline at end of file
@@ -39,16 +39,15 @@ class Module(BaseModule):
             output_file = str(self.work_dir / 'open_vnc_nmap_{}_{date:%Y-%m-%d_%H-%M-%S}'.format(port, date=datetime.now()))
 
             with open(targets_file, mode='w') as f:
-                for host in inventory:
-                    if port in host.open_ports:
-                        try:
-                            if host['Open VNC'].lower() in ['yes', 'no']:
-                                continue
-                        except KeyError:
-                            pass
+                for host in inventory.hosts_with_port(port):
+                    try:
+                        if host['Open VNC'].lower() in ['yes', 'no']:
+                            continue
+                    except KeyError:
+                        pass
 
-                        f.write(host['IP Address'] + '\n')
-                        valid_targets += 1
+                    f.write(host['IP Address'] + '\n')
+                    valid_targets += 1
         
             if valid_targets <= 0:
                 print('\n[+] No systems to scan for open VNC on port {}'.format(port))
@@ -89,12 +88,13 @@ class Module(BaseModule):
                                 for script in nmap_port.findall('script'):
                                     if script.attrib['id'] == 'vnc-info':
                                         if 'does not require auth' in script.attrib['output']:
-                                            inventory.hosts[ip].update({'Open VNC': 'Yes'})
+                                            inventory.update_host(ip, {'Open VNC': 'Yes'})
                                             try:
                                                 vulnerable_hosts[ip].add(port)
                                             except KeyError:
                                                 vulnerable_hosts[ip] = {port,}
 
+                self.compress_nmap_output(output_file, targets_file)
                 print('[+] Saved Nmap VNC results to {}.*'.format(output_file))
 
 
@@ -121,15 +121,14 @@ class Module(BaseModule):
 
 
 
+    def finding(self, column, value):
+
+        return column == 'Open VNC' and value.lower().startswith('y')
+
+
     def report(self, inventory):
 
-        vulnerable_hosts = []
-        for host in inventory:
-            try:
-                if host['Open VNC'].lower().startswith('y'):
-                    vulnerable_hosts.append(host)
-            except KeyError:
-                pass
+        vulnerable_hosts = inventory.hosts_with_finding('Open VNC')
 
         if vulnerable_hosts:
             print('[+] {:,} system(s) with Open VNC:\n\t'.format(len(vulnerable_hosts)), end='')
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import asyncio
+from .base_module import *
+from ..smb import negotiate, negotiate_many
+
+
+class Module(BaseModule):
+
+    name            = 'smb_negotiate'
+    csv_headers     = ['SMBv1', 'SMB Signing', 'SMB Dialect']
+    required_ports  = [445]
+    required_progs  = []
+    streaming       = True
+
+    def __init__(self, inventory):
+
+        super().__init__(inventory)
+
+        self.port = 445
+        self.timeout = 5
+        self.max_concurrency = 500
+
+
+    def run(self, inventory):
+
+        targets = []
+        for host in inventory.hosts_with_port(self.port):
+            if not host.ip in self.streamed and self.wants(host):
+                targets.append(host.ip)
+
+        if not targets:
+            # hosts already being negotiated by probe() are waited on by the scheduler
+            if not self.streamed:
+                print('\n[!] No valid targets for SMB negotiation')
+            return
+
+        print('\n[+] Negotiating SMB with {:,} system(s)'.format(len(targets)))
+
+        def _update(ip, result):
+            inventory.update_host(ip, self.result_columns(result, ip))
+
+        asyncio.run(negotiate_many(targets, port=self.port, timeout=self.timeout, \
+            max_concurrency=self.max_concurrency, callback=_update))
+
+        print('\n[+] Finished SMB negotiation')
+
+
+    def wants(self, host):
+
+        try:
+            return not host['SMBv1'].lower() in ['yes', 'no']
+        except KeyError:
+            return True
+
+
+    async def probe(self, host):
+
+        try:
+            result = await negotiate(str(host.ip), port=self.port, timeout=self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            result = None
+
+        return self.result_columns(result, host.ip)
+
+
+    @staticmethod
+    def result_columns(result, ip=None):
+        '''
+        takes result from smb.negotiate()
+        returns dictionary of CSV columns (and prints them, if ip is specified)
+        '''
+
+        if result is None:
+            return {'SMBv1': 'N/A', 'SMB Signing': 'N/A', 'SMB Dialect': 'N/A'}
+
+        # prefer SMBv2 since that's what clients will actually use
+        signing = result['smb2_signing'] or result['smb1_signing'] or 'Unknown'
+        dialect = result['smb2_dialect'] or result['smb1_dialect'] or 'Unknown'
+
+        columns = {
+            'SMBv1':        ('Yes' if result['smb1'] else 'No'),
+            'SMB Signing':  signing,
+            'SMB Dialect':  dialect,
+        }
+
+        if ip is not None:
+            print('[+] {:<17}SMBv1: {:<5}Signing: {:<10}Dialect: {}'.format(str(ip), \
+                columns['SMBv1'], columns['SMB Signing'], columns['SMB Dialect']))
+
+        return columns
+
+
+    def finding(self, column, value):
+
+        if column == 'SMBv1':
+            return value.lower().startswith('y')
+        if column == 'SMB Signing':
+            return value.lower() in ['enabled', 'disabled']
+        return False
+
+
+    def report(self, inventory):
+
+        smb1_hosts = inventory.hosts_with_finding('SMBv1')
+        unsigned_hosts = inventory.hosts_with_finding('SMB Signing')
+
+        if smb1_hosts:
+            print('[+] {:,} system(s) with SMBv1 enabled:\n\t'.format(len(smb1_hosts)), end='')
+            print('\n\t'.join([str(h) for h in smb1_hosts]))
+        else:
+            print('[+] No systems found with SMBv1 enabled')
+        print('')
+
+        if unsigned_hosts:
+            print('[+] {:,} system(s) not requiring SMB signing:\n\t'.format(len(unsigned_hosts)), end='')
+            print('\n\t'.join([str(h) for h in unsigned_hosts]))
+        else:
+            print('[+] No systems found without SMB signing')
+        print('')
+
+
+    def read_host(self, csv_line, host):
+
+        for header in self.csv_headers:
+            value = 'N/A'
+            try:
+                c = csv_line[header].strip()
+                if c:
+                    value = c
+            except KeyError:
+                pass
+
+            host.update({header: value})
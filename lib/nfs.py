@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import struct
+import random
+import asyncio
+
+
+PORTMAPPER_PROGRAM  = 100000
+PORTMAPPER_VERSION  = 2
+PORTMAPPER_GETPORT  = 3
+
+MOUNT_PROGRAM       = 100005
+MOUNT_EXPORT        = 5
+# EXPORT is the same procedure in v1 and v3, v3 is tried first
+MOUNT_VERSIONS      = [3, 1]
+
+IPPROTO_TCP         = 6
+
+
+class RPCError(Exception):
+    pass
+
+
+
+class XDRReader:
+    '''
+    minimal XDR decoder, just enough for portmapper and mountd replies
+    '''
+
+    def __init__(self, data):
+
+        self.data = data
+        self.offset = 0
+
+
+    def uint(self):
+
+        try:
+            value = struct.unpack_from('>I', self.data, self.offset)[0]
+        except struct.error:
+            raise RPCError('Truncated RPC reply')
+        self.offset += 4
+        return value
+
+
+    def opaque(self):
+
+        length = self.uint()
+        value = self.data[self.offset:self.offset+length]
+        if len(value) < length:
+            raise RPCError('Truncated RPC reply')
+        # opaque data is padded to a multiple of four bytes
+        self.offset += (length + 3) & ~3
+        return value
+
+
+    def string(self):
+
+        return self.opaque().decode('utf-8', errors='replace')
+
+
+
+def rpc_call_message(xid, program, version, procedure, args=b''):
+    '''
+    builds an ONC-RPC call with AUTH_NULL credentials, including the TCP record marker
+    '''
+
+    message = struct.pack('>IIIIIIIIII',
+        xid,
+        0,              # message type (call)
+        2,              # RPC version
+        program,
+        version,
+        procedure,
+        0, 0,           # credentials (AUTH_NULL)
+        0, 0,           # verifier (AUTH_NULL)
+    ) + args
+
+    # single fragment
+    return struct.pack('>I', 0x80000000 | len(message)) + message
+
+
+
+def parse_rpc_reply(data, xid):
+    '''
+    takes an ONC-RPC reply
+    returns an XDRReader positioned at the start of the procedure results
+    '''
+
+    reply = XDRReader(data)
+
+    if reply.uint() != xid:
+        raise RPCError('RPC reply XID mismatch')
+    if reply.uint() != 1:
+        raise RPCError('Not an RPC reply')
+
+    reply_stat = reply.uint()
+    if reply_stat != 0:
+        raise RPCError('RPC call denied')
+
+    # verifier
+    reply.uint()
+    reply.opaque()
+
+    accept_stat = reply.uint()
+    if accept_stat != 0:
+        raise RPCError('RPC call failed with status {}'.format(accept_stat))
+
+    return reply
+
+
+
+async def rpc_call(host, port, program, version, procedure, args=b'', timeout=5):
+    '''
+    makes a single RPC call over TCP
+    returns an XDRReader positioned at the start of the procedure results
+    '''
+
+    xid = random.getrandbits(32)
+
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(rpc_call_message(xid, program, version, procedure, args))
+        await writer.drain()
+
+        data = b''
+        last_fragment = False
+        while not last_fragment:
+            marker = struct.unpack('>I', await asyncio.wait_for(reader.readexactly(4), timeout))[0]
+            last_fragment = bool(marker & 0x80000000)
+            data += await asyncio.wait_for(reader.readexactly(marker & 0x7fffffff), timeout)
+
+    except (asyncio.IncompleteReadError, ConnectionError) as e:
+        raise RPCError('Connection closed during RPC call: {}'.format(str(e)))
+
+    finally:
+        writer.close()
+
+    return parse_rpc_reply(data, xid)
+
+
+
+async def getport(host, program, version, protocol=IPPROTO_TCP, port=111, timeout=5):
+    '''
+    asks portmapper where an RPC program is listening
+    returns port number, or 0 if the program isn't registered
+    '''
+
+    args = struct.pack('>IIII', program, version, protocol, 0)
+    reply = await rpc_call(host, port, PORTMAPPER_PROGRAM, PORTMAPPER_VERSION, PORTMAPPER_GETPORT, args, timeout=timeout)
+    return reply.uint()
+
+
+
+async def exports(host, port=111, timeout=5):
+    '''
+    finds mountd via portmapper and lists its exports
+    returns list of tuples in format:
+    [ (export_path, [allowed_client, ...]) ... ]
+    an empty client list means the export is open to everyone
+    '''
+
+    for version in MOUNT_VERSIONS:
+        mountd_port = await getport(host, MOUNT_PROGRAM, version, port=port, timeout=timeout)
+        if mountd_port:
+            break
+    else:
+        # portmapper is up, but there's no NFS
+        return []
+
+    reply = await rpc_call(host, mountd_port, MOUNT_PROGRAM, version, MOUNT_EXPORT, timeout=timeout)
+
+    export_list = []
+    # exports and their groups are XDR optional-data linked lists
+    while reply.uint():
+        path = reply.string()
+        groups = []
+        while reply.uint():
+            groups.append(reply.string())
+        export_list.append((path, groups))
+
+    return export_list
+
+
+
+async def exports_many(hosts, port=111, timeout=5, max_concurrency=500, callback=None):
+    '''
+    lists NFS exports on many hosts concurrently
+    callback (if specified) is called with (host, export_list) as soon as each host finishes
+    export_list is None if the host couldn't be queried
+    returns list of (host, export_list) tuples
+    '''
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _query(host):
+        async with semaphore:
+            try:
+                export_list = await exports(str(host), port=port, timeout=timeout)
+            except (OSError, asyncio.TimeoutError, RPCError):
+                export_list = None
+        if callback is not None:
+            callback(host, export_list)
+        return (host, export_list)
+
+    return await asyncio.gather(*[_query(host) for host in hosts])
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import time
+import threading
+
+
+class RateLimiter:
+    '''
+    token bucket with a cap on the amount of work in flight
+    the rate is halved whenever something fails (e.g. times out) and creeps back up as things succeed
+    safe to use from multiple threads
+    '''
+
+    def __init__(self, rate, max_in_flight, min_rate=None, backoff=.5, recovery=.05):
+
+        # target rate (per second)
+        self.max_rate       = float(rate)
+        if self.max_rate <= 0:
+            raise ValueError('Invalid rate: {}'.format(rate))
+        # current rate, lowered by backoff()
+        self.rate           = self.max_rate
+        self.min_rate       = (max(self.max_rate / 100, .1) if min_rate is None else float(min_rate))
+        # multiply rate by this on failure
+        self.backoff_factor = backoff
+        # add this fraction of max_rate on success
+        self.recovery       = recovery
+
+        self.max_in_flight  = max(1, int(max_in_flight))
+        self.in_flight      = 0
+
+        self.tokens         = 1.0
+        self.last_refill    = time.monotonic()
+
+        self.started        = 0
+        self.completed      = 0
+        self.errors         = 0
+        self.start_time     = time.monotonic()
+
+        self.condition      = threading.Condition()
+
+
+    def acquire(self):
+        '''
+        blocks until there's both a token and a free slot
+        '''
+
+        with self.condition:
+            while True:
+                self._refill()
+                if self.in_flight < self.max_in_flight and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    self.started += 1
+                    return
+
+                if self.in_flight >= self.max_in_flight:
+                    # wait for release()
+                    self.condition.wait(1)
+                else:
+                    self.condition.wait((1 - self.tokens) / self.rate)
+
+
+    def release(self, success=True, backoff=None):
+        '''
+        frees up a slot and adjusts the rate depending on whether the work succeeded
+        failures only lower the rate if backoff is True (the default),
+        pass backoff=False for failures that going slower won't fix (e.g. access denied)
+        '''
+
+        if backoff is None:
+            backoff = not success
+
+        with self.condition:
+            self.in_flight -= 1
+            self.completed += 1
+            if success:
+                self.rate = min(self.max_rate, self.rate + (self.max_rate * self.recovery))
+            else:
+                self.errors += 1
+                if backoff:
+                    self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+            self.condition.notify_all()
+
+
+    @property
+    def throughput(self):
+        '''
+        average completions per second since the limiter was created
+        '''
+
+        elapsed = time.monotonic() - self.start_time
+        if elapsed <= 0:
+            return 0.0
+        return self.completed / elapsed
+
+
+    def status(self, total=None):
+
+        progress = '{:,}'.format(self.completed)
+        if total is not None:
+            progress += '/{:,}'.format(total)
+
+        return '{} done ({:.1f}/s, limit {:.1f}/s, {:,} in flight, {:,} errors)'.format(\
+            progress, self.throughput, self.rate, self.in_flight, self.errors)
+
+
+    def _refill(self):
+
+        now = time.monotonic()
+        # allow bursts of up to one second's worth of tokens
+        self.tokens = min(max(1.0, self.rate), self.tokens + ((now - self.last_refill) * self.rate))
+        self.last_refill = now
+
+
+
+class CircuitBreaker:
+    '''
+    trips after a number of *consecutive* failures
+    safe to use from multiple threads
+    '''
+
+    def __init__(self, limit):
+
+        self.limit      = int(limit)
+        self.failures   = 0
+        self.lock       = threading.Lock()
+
+
+    def success(self):
+
+        with self.lock:
+            self.failures = 0
+
+
+    def failure(self):
+        '''
+        returns True if the breaker has tripped
+        '''
+
+        with self.lock:
+            self.failures += 1
+            return self.failures >= self.limit
+
+
+    @property
+    def tripped(self):
+
+        with self.lock:
+            return self.failures >= self.limit
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import sys
+import gzip
+import queue
+import argparse
+import threading
+from pathlib import Path
+
+
+class RawOutputWriter:
+    '''
+    streams raw command output from many threads into one compressed file
+    a single writer thread does all the disk I/O
+    each host gets its own gzip member, so one host can be read back without decompressing the rest
+    ("zcat" on the whole file still works)
+    the index file contains one line per host, in the format:
+        host<TAB>offset<TAB>length
+    '''
+
+    def __init__(self, filename, max_queued=1000):
+
+        self.filename = Path(filename)
+        self.index_file = index_filename(self.filename)
+
+        self.queue = queue.Queue(maxsize=max_queued)
+        # set if the writer thread dies (disk full, etc.)
+        self.error = None
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+
+    def write(self, host, output):
+        '''
+        output is dropped (with a warning) if the writer thread has died, rather than blocking forever
+        '''
+
+        while self.thread.is_alive():
+            try:
+                self.queue.put((str(host), output), timeout=1)
+                return
+            except queue.Full:
+                continue
+
+        if self.dropped == 0:
+            sys.stderr.write('[!] Error writing raw output to {}: {}\n'.format(self.filename, str(self.error)))
+        self.dropped += 1
+
+
+    def close(self):
+        '''
+        raises the writer thread's error, if it died
+        '''
+
+        # no sentinel if the writer is already dead, since nothing would take it off the queue
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=1)
+                break
+            except queue.Full:
+                continue
+
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+    def _write_loop(self):
+
+        try:
+            self._write()
+        except Exception as e:
+            self.error = e
+
+
+    def _write(self):
+
+        with open(self.filename, 'ab') as f, open(self.index_file, 'a') as index:
+            offset = f.tell()
+
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+
+                host, output = item
+                record = '{}\n{}\n{}\n{}\n'.format(host, '*' * 5, output, '=' * 5)
+                data = gzip.compress(record.encode('utf-8', errors='replace'))
+
+                f.write(data)
+                f.flush()
+                # index is written after the data so it never points past the end of the file
+                index.write('{}\t{}\t{}\n'.format(host, offset, len(data)))
+                index.flush()
+
+                offset += len(data)
+
+
+
+def index_filename(filename):
+
+    filename = Path(filename)
+    return filename.with_name(filename.name + '.idx')
+
+
+
+def read_index(filename):
+    '''
+    returns dictionary in format:
+    { host: [(offset, length) ...] ... }
+    '''
+
+    index = dict()
+    with open(index_filename(filename)) as f:
+        for line in f:
+            try:
+                host, offset, length = line.rstrip('\n').split('\t')
+                index.setdefault(host, []).append((int(offset), int(length)))
+            except ValueError:
+                continue
+
+    return index
+
+
+
+def read_raw_output(filename, host, index=None):
+    '''
+    returns list of raw output strings recorded for host
+    '''
+
+    if index is None:
+        index = read_index(filename)
+
+    outputs = []
+    with open(filename, 'rb') as f:
+        for offset, length in index.get(str(host), []):
+            f.seek(offset)
+            record = gzip.decompress(f.read(length)).decode('utf-8', errors='replace')
+            # strip host header and trailer
+            outputs.append(record.split('\n', 2)[-1].rsplit('\n' + '=' * 5 + '\n', 1)[0])
+
+    return outputs
+
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Look up raw command output for a host')
+    parser.add_argument('file', type=Path,  help='raw output file (.gz)')
+    parser.add_argument('host',             help='IP address or hostname')
+
+    options = parser.parse_args()
+
+    try:
+        outputs = read_raw_output(options.file, options.host)
+    except FileNotFoundError as e:
+        sys.stderr.write('[!] {}\n'.format(str(e)))
+        sys.exit(1)
+
+    if not outputs:
+        sys.stderr.write('[!] No output found for {}\n'.format(options.host))
+        sys.exit(1)
+
+    print('\n'.join(outputs))
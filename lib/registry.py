@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import ast
+import importlib
+from pathlib import Path
+
+
+class ModuleSpec:
+    '''
+    a module's metadata, read from its source without importing it
+    stands in for the module when it isn't active, so its columns are still
+    loaded from the cache and written to the CSV
+    '''
+
+    # class attributes which are read from "class Module"
+    attributes = ['name', 'csv_headers', 'required_ports', 'required_progs']
+
+    def __init__(self, path, package='lib.modules'):
+
+        self.path           = Path(path)
+        # name used on the command line (-M)
+        self.module         = self.path.stem
+        self.package        = package
+
+        self.name           = self.module
+        self.csv_headers    = []
+        self.required_ports = []
+        self.required_progs = []
+        # columns read by the module's read_host()
+        self.read_columns   = []
+
+        self._parse()
+
+
+    def load(self, inventory):
+        '''
+        imports the module and returns an instance of it
+        '''
+
+        _m = importlib.import_module('{}.{}'.format(self.package, self.module))
+        return _m.Module(inventory)
+
+
+    def read_host(self, csv_line, host):
+        '''
+        generic version of BaseModule.read_host()
+        '''
+
+        for column in (self.read_columns or self.csv_headers):
+            value = (csv_line.get(column, '') or '').strip()
+            if value:
+                host.update({column: value})
+
+
+    def _parse(self):
+
+        with open(self.path) as f:
+            tree = ast.parse(f.read(), filename=str(self.path))
+
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and node.name == 'Module':
+                break
+        else:
+            return
+
+        for statement in node.body:
+
+            if isinstance(statement, ast.Assign) and len(statement.targets) == 1 \
+                and isinstance(statement.targets[0], ast.Name) and statement.targets[0].id in self.attributes:
+                try:
+                    setattr(self, statement.targets[0].id, ast.literal_eval(statement.value))
+                except (ValueError, TypeError, SyntaxError):
+                    continue
+
+            elif isinstance(statement, ast.FunctionDef) and statement.name == 'read_host':
+                try:
+                    line_arg = statement.args.args[1].arg
+                except IndexError:
+                    continue
+                # look for csv_line['Column']
+                for n in ast.walk(statement):
+                    if isinstance(n, ast.Subscript) and isinstance(n.value, ast.Name) and n.value.id == line_arg \
+                        and isinstance(n.slice, ast.Constant) and isinstance(n.slice.value, str):
+                        if not n.slice.value in self.read_columns:
+                            self.read_columns.append(n.slice.value)
+
+
+    def __repr__(self):
+
+        return 'ModuleSpec({})'.format(self.module)
+
+
+
+class ModuleRegistry:
+    '''
+    finds modules in lib/modules without importing them
+    '''
+
+    def __init__(self, module_dir, package='lib.modules'):
+
+        self.module_dir = Path(module_dir)
+
+        # { module: ModuleSpec() ... }
+        self.specs = dict()
+        for file in sorted(self.module_dir.glob('*.py')):
+            if file.stem not in ['__init__', 'base_module']:
+                self.specs[file.stem] = ModuleSpec(file, package=package)
+
+
+    def names(self):
+
+        return list(self.specs)
+
+
+    def __getitem__(self, module):
+
+        return self.specs[module]
+
+
+    def __iter__(self):
+
+        return iter(self.specs.values())
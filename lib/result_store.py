@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import json
+import hashlib
+import threading
+from time import time
+from pathlib import Path
+
+
+class ResultStore:
+    '''
+    remembers module results across runs, so hosts don't get checked over and over
+    each (check, host) result is stored with when it was obtained, and a fingerprint of
+    whatever went into it (credential list, nmap script, etc.)
+    a result is only reused if it's younger than the TTL and the fingerprint hasn't changed
+    stored as JSON in format:
+    {
+        check_name: {
+            ip: {'timestamp': unix_time, 'fingerprint': hash_of_inputs, 'value': 'Yes'} ...
+        } ...
+    }
+    safe to use from multiple threads
+    '''
+
+    def __init__(self, store_file):
+
+        self.store_file = Path(store_file)
+        self.lock       = threading.Lock()
+
+        self.checks = dict()
+        try:
+            with open(self.store_file) as f:
+                self.checks = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            print('[!] Ignoring corrupt result store at {}'.format(self.store_file))
+
+
+    @staticmethod
+    def fingerprint(*values):
+        '''
+        hashes any JSON-serializable values
+        '''
+
+        return hashlib.sha1(json.dumps(values, default=str).encode()).hexdigest()[:16]
+
+
+    @staticmethod
+    def fingerprint_file(filename):
+        '''
+        hashes the contents of a file (empty string if it doesn't exist)
+        '''
+
+        try:
+            with open(filename, 'rb') as f:
+                return hashlib.sha1(f.read()).hexdigest()[:16]
+        except FileNotFoundError:
+            return ''
+
+
+    def get(self, check, ip, fingerprint='', ttl_days=30):
+        '''
+        returns stored value if it's current, otherwise None
+        '''
+
+        with self.lock:
+            try:
+                entry = self.checks[check][str(ip)]
+            except KeyError:
+                return None
+
+        if entry['fingerprint'] == fingerprint and time() - entry['timestamp'] < ttl_days * 86400:
+            return entry['value']
+
+        return None
+
+
+    def record(self, check, ip, value, fingerprint=''):
+
+        with self.lock:
+            self.checks.setdefault(check, dict())[str(ip)] = {
+                'timestamp':    time(),
+                'fingerprint':  fingerprint,
+                'value':        value
+            }
+
+
+    def save(self):
+
+        with self.lock:
+            tmp_file = self.store_file.with_suffix('.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump(self.checks, f)
+            tmp_file.replace(self.store_file)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import sys
+import threading
+import traceback
+from time import time
+
+
+class ModuleScheduler:
+    '''
+    runs modules at the same time, each in its own thread
+    modules which need the same port are run one after another (in the order given),
+    so two modules never hammer the same service at once
+    a streaming module counts as running until its probes have finished (see dispatcher)
+    the connection budget is split between modules which can run side by side,
+    by lowering each module's "max_concurrency" before it starts
+    if scanned_ports is given, a module is held back until all its required ports have been
+    scanned (see port_scanned()), so it can run while other ports are still being scanned
+    '''
+
+    def __init__(self, inventory, modules, max_parallel=4, max_connections=1000, scanned_ports=None):
+
+        self.inventory          = inventory
+        # StreamDispatcher, if modules are streaming
+        self.dispatcher         = None
+        self.modules            = list(modules)
+        self.max_parallel       = max(1, int(max_parallel))
+        self.max_connections    = max(1, int(max_connections))
+
+        # { module_name: seconds }
+        self.timing             = dict()
+        # { module_name: error_string }
+        self.errors             = dict()
+
+        # None means every port has been scanned
+        self.scanned_ports      = (None if scanned_ports is None else set(scanned_ports))
+
+        self.condition          = threading.Condition()
+        self.cancelled          = threading.Event()
+        self.pending            = []
+        self.running            = []
+        self.thread             = None
+
+        # split the connection budget up front, since streaming probes can start before run()
+        share = self.connection_share()
+        for module in self.modules:
+            if module.max_concurrency is not None:
+                module.max_concurrency = max(1, min(module.max_concurrency, share))
+
+
+    @staticmethod
+    def conflicts(module1, module2):
+
+        return bool(set(module1.required_ports).intersection(module2.required_ports))
+
+
+    def connection_share(self):
+        '''
+        how many connections each module gets if everything that can run in parallel does
+        '''
+
+        groups = []
+        for module in self.modules:
+            for group in groups:
+                if any([self.conflicts(module, m) for m in group]):
+                    group.append(module)
+                    break
+            else:
+                groups.append([module])
+
+        return max(1, self.max_connections // max(1, min(self.max_parallel, len(groups))))
+
+
+    def start(self):
+        '''
+        runs modules in the background
+        '''
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def port_scanned(self, port):
+        '''
+        marks a port as scanned, which may let modules start
+        '''
+
+        with self.condition:
+            if self.scanned_ports is not None:
+                self.scanned_ports.add(int(port))
+                self.condition.notify_all()
+
+
+    def join(self):
+        '''
+        treats every port as scanned, and waits for all modules to finish
+        '''
+
+        with self.condition:
+            self.scanned_ports = None
+            self.condition.notify_all()
+
+        if self.thread is None:
+            self.run()
+        else:
+            # short timeout so ctrl+c still works
+            while self.thread.is_alive():
+                self.thread.join(1)
+
+
+    def cancel(self, timeout=10):
+        '''
+        keeps pending modules from starting and tells running ones to stop
+        waits up to timeout seconds for them to finish
+        '''
+
+        with self.condition:
+            self.cancelled.set()
+            for module in self.modules:
+                module.cancelled.set()
+            self.condition.notify_all()
+
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+    def run(self):
+
+        if not self.modules:
+            return
+
+        with self.condition:
+            self.pending = list(self.modules)
+
+            while True:
+                if self.cancelled.is_set():
+                    self.pending = []
+                if not (self.pending or self.running):
+                    break
+
+                for module in self._runnable():
+                    self.pending.remove(module)
+                    self.running.append(module)
+                    threading.Thread(target=self._run_module, args=(module,), daemon=True).start()
+
+                self.condition.wait()
+
+
+    def _runnable(self):
+        '''
+        returns pending modules which can start right now
+        '''
+
+        runnable = []
+        running = list(self.running)
+
+        for i, module in enumerate(self.pending):
+            if len(running) >= self.max_parallel:
+                break
+            # don't start before the ports the module needs have been scanned
+            if self.scanned_ports is not None and not self.scanned_ports.issuperset(module.required_ports):
+                continue
+            # don't start before conflicting modules that are running or were queued earlier
+            if any([self.conflicts(module, m) for m in running + self.pending[:i]]):
+                continue
+            runnable.append(module)
+            running.append(module)
+
+        return runnable
+
+
+    def _run_module(self, module):
+
+        print('\n[+] Starting module "{}"'.format(module.name))
+        started = time()
+        try:
+            module.run(self.inventory)
+            if module.streaming and self.dispatcher is not None:
+                self.dispatcher.wait(module)
+        except (Exception, SystemExit) as e:
+            self.errors[module.name] = str(e) or e.__class__.__name__
+            sys.stderr.write('\n[!] Error in module "{}":\n{}\n'.format(module.name, traceback.format_exc()))
+        finally:
+            self.timing[module.name] = time() - started
+            print('\n[+] Module "{}" finished in {:.1f} seconds'.format(module.name, self.timing[module.name]))
+            with self.condition:
+                self.running.remove(module)
+                self.condition.notify_all()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import os
+import struct
+import asyncio
+
+
+# dialects offered in the SMBv1 negotiation
+smb1_dialects = [
+    b'PC NETWORK PROGRAM 1.0',
+    b'LANMAN1.0',
+    b'Windows for Workgroups 3.1a',
+    b'LM1.2X002',
+    b'LANMAN2.1',
+    b'NT LM 0.12',
+]
+
+# dialects offered in the SMBv2 negotiation
+# 3.1.1 is left out because it requires negotiate contexts
+smb2_dialects = {
+    0x0202: '2.0.2',
+    0x0210: '2.1',
+    0x0300: '3.0',
+    0x0302: '3.0.2',
+}
+
+
+class SMBNegotiateError(Exception):
+    pass
+
+
+
+def smb1_negotiate_request():
+    '''
+    builds a bare SMBv1 NEGOTIATE request, including the NetBIOS session header
+    '''
+
+    header = struct.pack('<4sBIBHH8sHHHHH',
+        b'\xffSMB',     # protocol
+        0x72,           # command (negotiate)
+        0,              # status
+        0x18,           # flags (case-insensitive, canonicalized paths)
+        0xc801,         # flags2 (unicode, NT status, extended security, long names)
+        0,              # PID high
+        b'\x00' * 8,    # security signature
+        0,              # reserved
+        0,              # TID
+        os.getpid() & 0xffff,
+        0,              # UID
+        0,              # MID
+    )
+
+    dialects = b''.join([b'\x02' + d + b'\x00' for d in smb1_dialects])
+    body = struct.pack('<BH', 0, len(dialects)) + dialects
+
+    return _netbios(header + body)
+
+
+
+def smb2_negotiate_request():
+    '''
+    builds a bare SMBv2 NEGOTIATE request, including the NetBIOS session header
+    '''
+
+    header = struct.pack('<4sHHIHHIIQIIQ16s',
+        b'\xfeSMB',     # protocol
+        64,             # structure size
+        0,              # credit charge
+        0,              # status
+        0,              # command (negotiate)
+        1,              # credits requested
+        0,              # flags
+        0,              # next command
+        0,              # message ID
+        0,              # process ID
+        0,              # tree ID
+        0,              # session ID
+        b'\x00' * 16,   # signature
+    )
+
+    dialects = list(smb2_dialects)
+    body = struct.pack('<HHHHI16sQ',
+        36,             # structure size
+        len(dialects),
+        0x01,           # security mode (signing enabled)
+        0,              # reserved
+        0,              # capabilities
+        os.urandom(16), # client GUID
+        0,              # client start time
+    ) + struct.pack('<{}H'.format(len(dialects)), *dialects)
+
+    return _netbios(header + body)
+
+
+
+def parse_smb1_negotiate_response(data):
+    '''
+    takes an SMBv1 NEGOTIATE response (without NetBIOS header)
+    returns tuple (dialect_name, signing)
+    '''
+
+    if len(data) < 35 or not data.startswith(b'\xffSMB') or data[4] != 0x72:
+        raise SMBNegotiateError('Invalid SMBv1 negotiate response')
+
+    status = struct.unpack_from('<I', data, 5)[0]
+    if status != 0:
+        raise SMBNegotiateError('SMBv1 negotiate failed with status 0x{:08x}'.format(status))
+
+    word_count = data[32]
+    dialect_index = struct.unpack_from('<H', data, 33)[0]
+    if dialect_index >= len(smb1_dialects):
+        raise SMBNegotiateError('No SMBv1 dialect accepted')
+
+    dialect = smb1_dialects[dialect_index].decode()
+
+    # only NT LM 0.12 responses carry a security mode
+    signing = 'Unknown'
+    if word_count >= 17 and len(data) > 35:
+        security_mode = data[35]
+        signing = _signing(security_mode & 0x08, security_mode & 0x04)
+
+    return (dialect, signing)
+
+
+
+def parse_smb2_negotiate_response(data):
+    '''
+    takes an SMBv2 NEGOTIATE response (without NetBIOS header)
+    returns tuple (dialect_name, signing)
+    '''
+
+    if len(data) < 70 or not data.startswith(b'\xfeSMB'):
+        raise SMBNegotiateError('Invalid SMBv2 negotiate response')
+
+    status = struct.unpack_from('<I', data, 8)[0]
+    if status != 0:
+        raise SMBNegotiateError('SMBv2 negotiate failed with status 0x{:08x}'.format(status))
+
+    security_mode, dialect_revision = struct.unpack_from('<HH', data, 66)
+    dialect = smb2_dialects.get(dialect_revision, '0x{:04x}'.format(dialect_revision))
+    signing = _signing(security_mode & 0x02, security_mode & 0x01)
+
+    return (dialect, signing)
+
+
+
+async def negotiate(host, port=445, timeout=5):
+    '''
+    negotiates SMBv1 and SMBv2 with a host in parallel
+    returns dictionary in format:
+    {
+        'smb1':         True|False,
+        'smb1_dialect': 'NT LM 0.12'|None,
+        'smb1_signing': 'Required'|'Enabled'|'Disabled'|'Unknown'|None,
+        'smb2_dialect': '3.0.2'|None,
+        'smb2_signing': 'Required'|'Enabled'|'Disabled'|None
+    }
+    returns None if the port is open but neither reply is valid SMB (e.g. another service, or a reset),
+    since there's no telling whether SMBv1 is enabled
+    raises OSError or asyncio.TimeoutError if the host can't be reached at all
+    '''
+
+    smb1, smb2 = await asyncio.gather(
+        _exchange(host, port, smb1_negotiate_request(), timeout),
+        _exchange(host, port, smb2_negotiate_request(), timeout),
+        return_exceptions=True
+    )
+
+    # neither connection succeeded, nothing to report
+    if isinstance(smb1, (OSError, asyncio.TimeoutError)) and isinstance(smb2, (OSError, asyncio.TimeoutError)):
+        raise smb1
+
+    result = {
+        # only known to be disabled if SMBv2 answered, see below
+        'smb1':         None,
+        'smb1_dialect': None,
+        'smb1_signing': None,
+        'smb2_dialect': None,
+        'smb2_signing': None,
+    }
+
+    # servers with SMBv1 disabled typically just drop the connection
+    if isinstance(smb1, bytes):
+        try:
+            result['smb1_dialect'], result['smb1_signing'] = parse_smb1_negotiate_response(smb1)
+            result['smb1'] = True
+        except SMBNegotiateError:
+            pass
+
+    if isinstance(smb2, bytes):
+        try:
+            result['smb2_dialect'], result['smb2_signing'] = parse_smb2_negotiate_response(smb2)
+            if not result['smb1']:
+                result['smb1'] = False
+        except SMBNegotiateError:
+            pass
+
+    if result['smb1'] is None:
+        return None
+
+    return result
+
+
+
+async def negotiate_many(hosts, port=445, timeout=5, max_concurrency=500, callback=None):
+    '''
+    negotiates SMB with many hosts concurrently
+    callback (if specified) is called with (host, result) as soon as each host finishes
+    result is None if the host couldn't be reached or didn't speak SMB
+    returns list of (host, result) tuples
+    '''
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _probe(host):
+        async with semaphore:
+            try:
+                result = await negotiate(str(host), port=port, timeout=timeout)
+            except (OSError, asyncio.TimeoutError):
+                result = None
+        if callback is not None:
+            callback(host, result)
+        return (host, result)
+
+    return await asyncio.gather(*[_probe(host) for host in hosts])
+
+
+
+async def _exchange(host, port, request, timeout):
+    '''
+    sends a single request and returns the response (without NetBIOS header)
+    '''
+
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(request)
+        await writer.drain()
+        header = await asyncio.wait_for(reader.readexactly(4), timeout)
+        length = struct.unpack('>I', header)[0] & 0xffffff
+        return await asyncio.wait_for(reader.readexactly(length), timeout)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        # connection was made, but the server hung up on us
+        return b''
+    finally:
+        writer.close()
+
+
+
+def _netbios(message):
+
+    return struct.pack('>I', len(message)) + message
+
+
+
+def _signing(required, enabled):
+
+    if required:
+        return 'Required'
+    elif enabled:
+        return 'Enabled'
+    return 'Disabled'
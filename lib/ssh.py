@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import socket
+import asyncio
+import logging
+import concurrent.futures
+
+try:
+    import paramiko
+    # paramiko logs a traceback for every failed handshake
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+except ImportError:
+    paramiko = None
+
+
+class SSHHostError(Exception):
+    '''
+    raised when there's no point trying any more credentials on a host
+    '''
+    pass
+
+class SSHAuthNotAllowed(SSHHostError):
+    '''
+    raised when the server doesn't accept passwords at all (which is a result in itself)
+    '''
+    pass
+
+
+
+def read_creds(creds_file):
+    '''
+    takes file containing colon-delimited usernames and passwords
+    returns list of (username, password) tuples
+    '''
+
+    creds = []
+    with open(creds_file) as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if ':' in line:
+                username, password = line.split(':', 1)
+                creds.append((username, password))
+
+    return creds
+
+
+
+class SSHCredentialChecker:
+    '''
+    tries username/password pairs against many SSH servers at once, without any external tools
+    one transport (TCP connection + SSH handshake) is reused for every password of a given username,
+    since most servers don't let you switch usernames mid-connection
+    '''
+
+    def __init__(self, creds, port=22, timeout=10, max_concurrency=80, per_host_concurrency=1, attempts_per_connection=5):
+
+        self.creds                      = list(creds)
+        self.port                       = int(port)
+        self.timeout                    = timeout
+        # max SSH connections in total
+        self.max_concurrency            = max_concurrency
+        # max SSH connections to any one host (keeps us from locking accounts out)
+        self.per_host_concurrency       = per_host_concurrency
+        # stay below OpenSSH's default MaxAuthTries of 6
+        self.attempts_per_connection    = attempts_per_connection
+
+        # { username: [password, ...] }
+        self.passwords = dict()
+        for username, password in self.creds:
+            self.passwords.setdefault(username, []).append(password)
+
+
+    async def check_many(self, hosts, callback=None):
+        '''
+        checks every host concurrently
+        callback (if specified) is called with (host, creds) as soon as each host finishes
+        creds is "username:password", '' if nothing worked, or None if the host couldn't be fully checked
+        returns list of (host, creds) tuples
+        '''
+
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency) as self.executor:
+
+            async def _check(host):
+                creds = await self.check_host(host)
+                if callback is not None:
+                    callback(host, creds)
+                return (host, creds)
+
+            return await asyncio.gather(*[_check(host) for host in hosts])
+
+
+    async def check_host(self, host):
+
+        loop = asyncio.get_running_loop()
+        host_semaphore = asyncio.Semaphore(self.per_host_concurrency)
+        # set once we've found valid creds or given up on the host
+        finished = asyncio.Event()
+        valid_creds = []
+        incomplete = False
+
+        async def _try_username(username, passwords):
+            nonlocal incomplete
+            async with host_semaphore:
+                async with self.semaphore:
+                    if finished.is_set():
+                        return
+                    try:
+                        password = await loop.run_in_executor(self.executor, self.try_passwords, str(host), username, passwords)
+                    except SSHAuthNotAllowed:
+                        finished.set()
+                        return
+                    except SSHHostError:
+                        incomplete = True
+                        finished.set()
+                        return
+                    if password is not None:
+                        valid_creds.append('{}:{}'.format(username, password))
+                        finished.set()
+
+        await asyncio.gather(*[_try_username(u, p) for u, p in self.passwords.items()])
+
+        try:
+            return valid_creds[0]
+        except IndexError:
+            return (None if incomplete else '')
+
+
+    def try_passwords(self, host, username, passwords):
+        '''
+        tries passwords for one username, reconnecting only when the server hangs up on us
+        returns the valid password, or None
+        raises SSHHostError if the host is unreachable or doesn't allow password logins
+        '''
+
+        remaining = list(passwords)
+        reconnects = 0
+
+        while remaining:
+            transport = self._connect(host)
+            try:
+                attempts = 0
+                while remaining and attempts < self.attempts_per_connection:
+                    password = remaining[0]
+                    try:
+                        transport.auth_password(username, password)
+                        if transport.is_authenticated():
+                            return password
+                    except paramiko.BadAuthenticationType as e:
+                        raise SSHAuthNotAllowed('Password authentication not allowed on {}: {}'.format(host, e.allowed_types))
+                    except paramiko.AuthenticationException:
+                        remaining.pop(0)
+                        attempts += 1
+                    except (paramiko.SSHException, EOFError, OSError):
+                        # connection dropped mid-attempt, retry this password on a new connection
+                        reconnects += 1
+                        if reconnects > len(passwords):
+                            raise SSHHostError('Too many dropped connections to {}'.format(host))
+                        break
+
+                    if not transport.is_active():
+                        break
+            finally:
+                transport.close()
+
+        return None
+
+
+    def _connect(self, host):
+
+        try:
+            sock = socket.create_connection((host, self.port), timeout=self.timeout)
+        except OSError as e:
+            raise SSHHostError('Error connecting to {}:{}: {}'.format(host, self.port, str(e)))
+
+        try:
+            transport = paramiko.Transport(sock)
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            sock.close()
+            raise SSHHostError('SSH handshake with {}:{} failed: {}'.format(host, self.port, str(e)))
+
+        try:
+            transport.banner_timeout = self.timeout
+            transport.auth_timeout = self.timeout
+            transport.start_client(timeout=self.timeout)
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            # start_client() may have already started the transport thread
+            transport.close()
+            raise SSHHostError('SSH handshake with {}:{} failed: {}'.format(host, self.port, str(e)))
+
+        return transport
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import sys
+import asyncio
+import threading
+import traceback
+import concurrent.futures
+
+
+class StreamDispatcher:
+    '''
+    pushes hosts to streaming modules the moment a matching port is found open
+    probes run as coroutines on an event loop in a background thread
+    each host is only sent to each module once, and is added to the module's
+    "streamed" set as soon as it's claimed, so the module's batch run() can skip it
+    '''
+
+    def __init__(self, inventory, modules, default_concurrency=100):
+
+        self.inventory      = inventory
+        self.modules        = [m for m in modules if m.streaming]
+        self.default_concurrency = default_concurrency
+
+        self.lock           = threading.Lock()
+        # probes that haven't finished yet
+        # { module_name: set(futures) }
+        self.futures        = dict([(m.name, set()) for m in self.modules])
+
+        # { module_name: probe_count }
+        self.probed         = dict([(m.name, 0) for m in self.modules])
+        # { module_name: error_count }
+        self.errors         = dict([(m.name, 0) for m in self.modules])
+
+        self.loop           = asyncio.new_event_loop()
+        self.thread         = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        # one semaphore per module, created on the event loop
+        self.semaphores = asyncio.run_coroutine_threadsafe(self._make_semaphores(), self.loop).result()
+
+
+    def submit(self, host, port):
+        '''
+        thread-safe, called whenever port is found open on host
+        '''
+
+        for module in self.modules:
+            if not port in module.stream_ports:
+                continue
+
+            with self.lock:
+                if host.ip in module.streamed or not module.wants(host):
+                    continue
+                module.streamed.add(host.ip)
+                future = asyncio.run_coroutine_threadsafe(self._probe(module, host), self.loop)
+                self.futures[module.name].add(future)
+            future.add_done_callback(lambda f, name=module.name: self._done(name, f))
+
+
+    def submit_known(self):
+        '''
+        submits hosts which were already known to have open ports (e.g. from the scan cache)
+        '''
+
+        ports = set()
+        for module in self.modules:
+            ports.update(module.stream_ports)
+
+        for port in ports:
+            for host in self.inventory.hosts_with_port(port):
+                self.submit(host, port)
+
+
+    def wait(self, module):
+        '''
+        waits for a module's probes to finish
+        '''
+
+        if not module.name in self.futures:
+            return
+
+        while True:
+            with self.lock:
+                futures = list(self.futures[module.name])
+            if not futures:
+                break
+            concurrent.futures.wait(futures)
+
+
+    def close(self):
+        '''
+        waits for all probes to finish
+        '''
+
+        for module in self.modules:
+            self.wait(module)
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+    def cancel(self):
+        '''
+        cancels probes which haven't finished yet
+        '''
+
+        with self.lock:
+            futures = [f for module_futures in self.futures.values() for f in module_futures]
+        for future in futures:
+            future.cancel()
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+    def _done(self, module_name, future):
+
+        with self.lock:
+            self.futures[module_name].discard(future)
+
+
+    async def _make_semaphores(self):
+
+        return dict([(m.name, asyncio.Semaphore(m.max_concurrency or self.default_concurrency)) for m in self.modules])
+
+
+    async def _probe(self, module, host):
+
+        async with self.semaphores[module.name]:
+            try:
+                columns = await module.probe(host)
+                if columns:
+                    self.inventory.update_host(host.ip, columns)
+                self.probed[module.name] += 1
+            except Exception:
+                self.errors[module.name] += 1
+                sys.stderr.write('\n[!] Error probing {} in module "{}":\n{}\n'.format(\
+                    str(host.ip), module.name, traceback.format_exc()))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import csv
+import json
+import ipaddress
+from .compression import open_file, strip_extension
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class SubnetTree:
+    '''
+    host counts at several netmasks, built in one pass over the hosts
+    hosts are sorted once as integers, then each netmask is counted from the buckets
+    of the next smaller subnet size (e.g. /24s from hosts, /16s from /24s, /8s from /16s)
+    uses numpy for the pass over the hosts if it's installed
+    '''
+
+    def __init__(self, ips, netmasks=(8, 16, 24)):
+
+        # largest netmask (smallest subnets) first
+        self.netmasks = sorted(set([int(n) for n in netmasks]), reverse=True)
+        for netmask in self.netmasks:
+            if not 0 <= netmask <= 32:
+                raise ValueError('Invalid netmask: {}'.format(netmask))
+
+        self.host_count = 0
+        # { netmask: ([subnet_as_int ...], [host_count ...]) ... }
+        self.levels = dict()
+
+        if np is not None:
+            self._build_numpy(ips)
+        else:
+            self._build(ips)
+
+
+    def counts(self, netmask):
+        '''
+        returns [ (ip_network(), host_count) ... ] sorted by network
+        '''
+
+        subnets, counts = self.levels[netmask]
+        return [(self._network(subnet, netmask), count) for subnet, count in zip(subnets, counts)]
+
+
+    def busiest(self, parent=16, child=24, top=5):
+        '''
+        returns the busiest child subnets inside each parent subnet:
+        [ (parent_network, host_count, [ (child_network, host_count) ... ]) ... ]
+        parents are sorted by host count
+        '''
+
+        children = self._group(parent, child)
+
+        busiest = []
+        for subnet, count in sorted(zip(*self.levels[parent]), key=lambda x: (-x[1], x[0])):
+            top_children = sorted(children.get(subnet, []), key=lambda x: (-x[1], x[0]))[:top]
+            busiest.append((self._network(subnet, parent), count, \
+                [(self._network(s, child), c) for s, c in top_children]))
+
+        return busiest
+
+
+    def rows(self):
+        '''
+        generates a row for every subnet, smallest netmask first
+        "Parent" is the containing subnet at the next smaller netmask, and "Rank" is the
+        subnet's place within it by host count (so the busiest /24s in each /16 have the lowest ranks)
+        '''
+
+        netmasks = sorted(self.netmasks)
+        for i, netmask in enumerate(netmasks):
+
+            if i > 0:
+                parent_netmask = netmasks[i-1]
+                groups = self._group(parent_netmask, netmask)
+            else:
+                parent_netmask = None
+                groups = {None: list(zip(*self.levels[netmask]))}
+
+            for parent, subnets in groups.items():
+                parent = ('' if parent is None else str(self._network(parent, parent_netmask)))
+                subnets.sort(key=lambda x: (-x[1], x[0]))
+                for rank, (subnet, count) in enumerate(subnets, 1):
+                    yield {
+                        'Network':      str(self._network(subnet, netmask)),
+                        'Netmask':      netmask,
+                        'Hosts':        count,
+                        'Percent':      round(count / self.host_count * 100, 2),
+                        'Parent':       parent,
+                        'Rank':         rank
+                    }
+
+
+    def write(self, filename):
+        '''
+        writes every subnet to a CSV or JSON file (based on the extension)
+        '''
+
+        fieldnames = ['Network', 'Netmask', 'Hosts', 'Percent', 'Parent', 'Rank']
+
+        with open_file(filename, mode='w', newline='') as f:
+            if strip_extension(filename).endswith('.json'):
+                json.dump({'hosts': self.host_count, 'subnets': list(self.rows())}, f, indent=2)
+            else:
+                c = csv.DictWriter(f, fieldnames=fieldnames)
+                c.writeheader()
+                c.writerows(self.rows())
+
+
+    def _group(self, parent, child):
+        '''
+        groups child subnets by the parent subnet they're in
+        returns { parent_as_int: [ (child_as_int, host_count) ... ] ... }
+        '''
+
+        shift = child - parent
+        groups = dict()
+        for subnet, count in zip(*self.levels[child]):
+            groups.setdefault(subnet >> shift, []).append((subnet, count))
+
+        return groups
+
+
+    @staticmethod
+    def _network(subnet, netmask):
+
+        return ipaddress.ip_network((subnet << (32 - netmask), netmask))
+
+
+    def _build_numpy(self, ips):
+
+        # uint64 so shifting by 32 (netmask 0) works
+        subnets = np.fromiter(ips, dtype=np.uint64)
+        subnets.sort()
+        counts = np.ones(len(subnets), dtype=np.int64)
+        self.host_count = len(subnets)
+
+        bits = 32
+        for netmask in self.netmasks:
+            subnets = subnets >> np.uint64(bits - netmask)
+            bits = netmask
+            if len(subnets):
+                # subnets are still sorted, so each one is a contiguous run
+                starts = np.flatnonzero(np.concatenate(([True], subnets[1:] != subnets[:-1])))
+                counts = np.add.reduceat(counts, starts)
+                subnets = subnets[starts]
+            self.levels[netmask] = (subnets.tolist(), counts.tolist())
+
+
+    def _build(self, ips):
+
+        subnets = sorted(ips)
+        counts = [1] * len(subnets)
+        self.host_count = len(subnets)
+
+        bits = 32
+        for netmask in self.netmasks:
+            shift = bits - netmask
+            bits = netmask
+            new_subnets = []
+            new_counts = []
+            for subnet, count in zip(subnets, counts):
+                subnet >>= shift
+                if new_subnets and new_subnets[-1] == subnet:
+                    new_counts[-1] += count
+                else:
+                    new_subnets.append(subnet)
+                    new_counts.append(count)
+            subnets, counts = new_subnets, new_counts
+            self.levels[netmask] = (subnets, counts)